@@ -1,6 +1,30 @@
-import pythoncom
-import win32com.client
 import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+from multiprocessing import util
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# AutoCAD (COM) is only needed for .dwg inputs; .dxf plans are preprocessed with ezdxf
+try:
+    import pythoncom
+    import win32com.client
+except ImportError:
+    pythoncom = None
+
+try:
+    import ezdxf
+except ImportError:
+    ezdxf = None
+
+
+PLAN_EXTENSIONS = (".dwg", ".dxf")
+CACHE_NAME = ".preprocess_cache.json"
+# Bumped whenever the preprocessing changes, so older outputs are redone
+PREPROCESS_VERSION = 1
 
 
 def getProjectRoot():
@@ -9,12 +33,15 @@ def getProjectRoot():
     return os.path.dirname(os.path.dirname(directory_path))
 
 
-def process_dwg(dwg_path, save_path):
+def process_dwg(dwg_path, save_path, acad=None):
+    """ Explodes the blocks of a .dwg with AutoCAD. AutoCAD is started (and quit) unless 'acad' is given. """
     pythoncom.CoInitialize()
 
-    # Start AutoCAD
-    acad = win32com.client.Dispatch("AutoCAD.Application")
-    acad.Visible = False
+    # Start a new AutoCAD: Dispatch would attach to one the user has open, and Quit would close it
+    own_acad = acad is None
+    if own_acad:
+        acad = win32com.client.DispatchEx("AutoCAD.Application")
+        acad.Visible = False
 
     doc = acad.Documents.Open(dwg_path)
     ms = doc.ModelSpace
@@ -51,19 +78,288 @@ def process_dwg(dwg_path, save_path):
     doc.SaveAs(save_path, 25)  # 25 is the DXF 2018 file type
 
     doc.Close(False)
-    acad.Quit()
+    if own_acad:
+        acad.Quit()
 
     print("File processed and saved.")
+    return counter - 1
 
 def layer_exists(layers, name):
     for l in layers:
         if l.Name == name:
             return True
     return False
+
+
+def effective_block_name(doc, insert):
+    """ Name of the block an INSERT shows, also for the anonymous (*U) copies of dynamic blocks. """
+    name = insert.dxf.name
+    if name.startswith("*"):
+        record = doc.block_records.get(name)
+        if record is not None and record.has_xdata("AcDbBlockRepBTag"):
+            for code, value in record.get_xdata("AcDbBlockRepBTag"):
+                if code == 1005 and value in doc.entitydb:
+                    return doc.entitydb[value].dxf.name
+    return name
+
+
+def process_dxf(dxf_path, save_path):
+    """ Same preprocessing as process_dwg, without AutoCAD: explodes every block of a .dxf with ezdxf. """
+    doc = ezdxf.readfile(dxf_path)
+    msp = doc.modelspace()
+
+    counter = 1
+    for insert in list(msp.query("INSERT")):
+        try:
+            layer_name = f"{effective_block_name(doc, insert)}_{counter}"
+            if layer_name not in doc.layers:
+                doc.layers.add(layer_name)
+
+            # Removes the block reference and returns its elements
+            for e in insert.explode():
+                e.dxf.layer = layer_name
+            counter += 1
+
+        except Exception as e:
+            print(f"Error processing a block in {dxf_path}: {e}")
+
+    doc.saveas(save_path)
+    return counter - 1
+
+
+# ============================
+# BATCH PREPROCESSING
+# ============================
+
+_acad = None
+
+
+def _quit_acad():
+    global _acad
+    if _acad is not None:
+        try:
+            _acad.Quit()
+        except Exception:
+            pass
+        _acad = None
+
+
+def _get_acad():
+    """
+    One AutoCAD per worker process, started on its first .dwg and quit when
+    the worker exits. DispatchEx starts a new instance each time: Dispatch
+    would hand every worker the same running AutoCAD (which only runs one
+    command at a time), and the first recycled worker would quit it under
+    the others.
+    """
+    global _acad
+    if _acad is None:
+        pythoncom.CoInitialize()
+        _acad = win32com.client.DispatchEx("AutoCAD.Application")
+        _acad.Visible = False
+        util.Finalize(None, _quit_acad, exitpriority=10)
+    return _acad
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def collect_plans(inputs):
+    """ Plans given as files, directories (searched recursively) or glob patterns, without duplicates. """
+    plans = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, "**", "*"), recursive=True)
+        else:
+            matches = glob.glob(item, recursive=True)
+        plans += [os.path.abspath(p) for p in sorted(matches)
+                  if os.path.isfile(p) and p.lower().endswith(PLAN_EXTENSIONS)]
+    return list(dict.fromkeys(plans))
+
+
+def get_output_path(plan_path, output_dir, root):
+    """ <output_dir>/<path relative to the input root>.dxf, so equal names in different folders do not clash. """
+    relative = os.path.relpath(plan_path, root) if root else os.path.basename(plan_path)
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + ".dxf")
+
+
+def load_cache(cache_path):
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache_path, cache):
+    temp_path = cache_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(temp_path, cache_path)
+
+
+def is_up_to_date(entry, sha256, output_path):
+    return (entry is not None and entry.get("sha256") == sha256 and entry.get("version") == PREPROCESS_VERSION
+            and os.path.isfile(output_path) and entry.get("output") == output_path)
+
+
+def preprocess_plan(plan_path, output_path):
+    """ Worker: preprocesses one plan and returns its timing. Runs in a pool process. """
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if plan_path.lower().endswith(".dxf"):
+        if ezdxf is None:
+            raise RuntimeError("ezdxf is not installed (pip install ezdxf)")
+        blocks = process_dxf(plan_path, output_path)
+    else:
+        if pythoncom is None:
+            raise RuntimeError(".dwg plans need AutoCAD and pywin32 (Windows only)")
+        # AutoCAD appends the extension itself
+        blocks = process_dwg(plan_path, os.path.splitext(output_path)[0] + ".", acad=_get_acad())
+    return {"blocks": blocks, "seconds": time.perf_counter() - start}
+
+
+def run_batch(inputs, output_dir, workers=None, tasks_per_worker=20, force=False, report_path=None):
+    """
+    Preprocesses every plan matched by 'inputs' on a pool of worker processes.
+    Plans whose content hash already has an up-to-date output are skipped. At
+    most two plans per worker are queued, and workers are replaced after
+    'tasks_per_worker' plans, so memory stays bounded on large archives.
+    """
+    output_dir = os.path.abspath(output_dir)
+    # Earlier outputs are .dxf too; never take them as inputs
+    plans = [p for p in collect_plans(inputs) if not p.startswith(output_dir + os.sep)]
+    if not plans:
+        print("No .dwg/.dxf plans found.", file=sys.stderr)
+        return 1
+
+    os.makedirs(output_dir, exist_ok=True)
+    cache_path = os.path.join(output_dir, CACHE_NAME)
+    cache = load_cache(cache_path)
+    root = os.path.commonpath([os.path.dirname(p) for p in plans])
+
+    pending, results = [], []
+    for plan in plans:
+        output_path = get_output_path(plan, output_dir, root)
+        sha256 = file_sha256(plan)
+        if not force and is_up_to_date(cache.get(plan), sha256, output_path):
+            results.append({"plan": plan, "status": "skipped", "output": output_path})
+            print(f"[skip] {plan} (up to date)")
+            continue
+        pending.append((plan, output_path, sha256))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending) or 1))
+    pool_args = {"max_workers": workers}
+    # Workers are only recycled on Python 3.11+ (max_tasks_per_child)
+    if sys.version_info >= (3, 11):
+        pool_args["max_tasks_per_child"] = tasks_per_worker
+
+    batch_start = time.perf_counter()
+    with ProcessPoolExecutor(**pool_args) as pool:
+        queued = iter(pending)
+        running = {}
+        while True:
+            while len(running) < workers * 2:
+                item = next(queued, None)
+                if item is None:
+                    break
+                running[pool.submit(preprocess_plan, item[0], item[1])] = item
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                plan, output_path, sha256 = running.pop(future)
+                size = os.path.getsize(plan)
+                try:
+                    timing = future.result()
+                except Exception as e:
+                    results.append({"plan": plan, "status": "failed", "error": str(e)})
+                    print(f"[fail] {plan}: {e}", file=sys.stderr)
+                    continue
+
+                seconds = timing["seconds"]
+                results.append({
+                    "plan": plan,
+                    "status": "processed",
+                    "output": output_path,
+                    "blocks": timing["blocks"],
+                    "bytes": size,
+                    "seconds": round(seconds, 3),
+                    "mbPerSecond": round(size / 1e6 / seconds, 3) if seconds > 0 else None,
+                })
+                print(f"[done] {plan}: {timing['blocks']} blocks, {seconds:.2f} s, "
+                      f"{size / 1e6 / max(seconds, 1e-9):.2f} MB/s")
+                cache[plan] = {"sha256": sha256, "version": PREPROCESS_VERSION, "output": output_path}
+                # Saved as it goes, so an interrupted run does not redo the finished plans
+                save_cache(cache_path, cache)
+
+    elapsed = time.perf_counter() - batch_start
+    processed = [r for r in results if r["status"] == "processed"]
+    failed = [r for r in results if r["status"] == "failed"]
+    summary = {
+        "workers": workers,
+        "plans": len(plans),
+        "processed": len(processed),
+        "skipped": len(results) - len(processed) - len(failed),
+        "failed": len(failed),
+        "seconds": round(elapsed, 3),
+        "plansPerSecond": round(len(processed) / elapsed, 3) if processed and elapsed > 0 else 0.0,
+        "bytesProcessed": sum(r["bytes"] for r in processed),
+    }
+    print(f"{summary['processed']} processed, {summary['skipped']} skipped, {summary['failed']} failed "
+          f"in {elapsed:.1f} s with {workers} workers ({summary['plansPerSecond']} plans/s).")
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "files": results}, f, indent=2)
+    return 1 if failed else 0
+
+
 if __name__ == "__main__":
-    base_path = getProjectRoot()
-    input_path = os.path.join(base_path, 'tfg', 'autocad', 'dwg', 'base_plane.dwg')
-    output_path = os.path.join(base_path, 'tfg', 'autocad', 'results', 'preprocessed_plane.')
+    parser = argparse.ArgumentParser(description="Explodes the blocks of AutoCAD plans into one layer per block")
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        help="Plans, directories or glob patterns of .dwg/.dxf files (default: dwg/base_plane.dwg)"
+    )
+    parser.add_argument(
+        "--output-dir",
+        help="Folder for the preprocessed .dxf files (default: results/)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes (default: one per CPU core)"
+    )
+    parser.add_argument(
+        "--tasks-per-worker",
+        type=int,
+        default=20,
+        help="Plans a worker handles before it is replaced, to release its memory"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Reprocess plans even when their output is up to date"
+    )
+    parser.add_argument(
+        "--report",
+        help="Write the per-file timings and throughput to this JSON file"
+    )
+    args = parser.parse_args()
 
-    process_dwg(input_path, output_path)
+    base_path = getProjectRoot()
+    if not args.inputs:
+        input_path = os.path.join(base_path, 'tfg', 'autocad', 'dwg', 'base_plane.dwg')
+        output_path = os.path.join(base_path, 'tfg', 'autocad', 'results', 'preprocessed_plane.')
 
+        process_dwg(input_path, output_path)
+    else:
+        output_dir = args.output_dir or os.path.join(base_path, 'tfg', 'autocad', 'results')
+        sys.exit(run_batch(args.inputs, output_dir, args.workers, args.tasks_per_worker, args.force, args.report))
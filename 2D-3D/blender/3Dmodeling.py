@@ -3,23 +3,73 @@ import os
 import re
 import sys
 import cv2
+import json
+import time
+import ctypes
+import hashlib
 import argparse
+import tempfile
+import tracemalloc
 import numpy as np
 from math import radians, atan2, degrees
-from mathutils import Vector, Euler
+from mathutils import Vector, Euler, Matrix
+from mathutils.geometry import tessellate_polygon
 
 # ============================
 # GENERAL FUNCTIONS
 # ============================
 
 def saveBlend(savePath):
-    bpy.ops.wm.save_as_mainfile(filepath=savePath)
+    """
+    Saves the current file atomically: it is written next to the target under a
+    temporary name and then renamed, so readers never see a half-written .blend.
+    Returns the SHA-256 of the saved file.
+    """
+    tmpPath = getTempPath(savePath)
+    bpy.ops.wm.save_as_mainfile(filepath=tmpPath, copy=True)
+    os.replace(tmpPath, savePath)
     print(f"File saved at: {savePath}")
-    
+    return fileSha256(savePath)
+
+
+def getPlanObjects():
+    """
+    Objects of the plan being processed. Floors already processed in a batch
+    session are excluded from the view layer, so they are never picked up again.
+    The view layer is synced first: objects removed from bpy.data would
+    otherwise still be listed (as None) until the next update.
+    """
+    bpy.context.view_layer.update()
+    return list(bpy.context.view_layer.objects)
+
+
+def getTempPath(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+
+
+def writeJsonAtomic(path, data):
+    tmpPath = getTempPath(path)
+    with open(tmpPath, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmpPath, path)
+    print(f"File saved at: {path}")
+    return fileSha256(path)
+
+
+def fileSha256(path, chunkSize=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunkSize), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 def parseNames():
     suffix = "_curve_"
 
-    for objItem in bpy.data.objects:
+    for objItem in getPlanObjects():
         if objItem.type != 'CURVE' or not objItem.name.endswith(suffix) or objItem.name.startswith("00_"):
             continue
 
@@ -39,6 +89,166 @@ def parseNames():
 
 
 
+# ============================
+# PROGRESS EVENTS
+# ============================
+
+def emitEvent(eventType, **fields):
+    """
+    Writes one event as a single JSON line on stdout (newline-delimited JSON).
+    The launcher and Unity only parse lines starting with '{', so the regular
+    log prints can stay interleaved with the events.
+    """
+    event = {"event": eventType, "time": round(time.time(), 3)}
+    event.update(fields)
+    sys.stdout.write(json.dumps(event) + "\n")
+    sys.stdout.flush()
+
+
+def countSceneObjects():
+    counts = {}
+    for objItem in bpy.data.objects:
+        counts[objItem.type] = counts.get(objItem.type, 0) + 1
+    return counts
+
+
+def runStage(name, func, index, total, memoryReport=None, progress=None, tile=None, **kwargs):
+    """
+    Runs one pipeline stage between a 'stage_started' and a 'stage_finished'
+    event. The percentage reported is the share of stages already completed.
+    Orphaned datablocks are purged after every stage; when 'memoryReport' is a
+    list, the memory usage of the stage is measured and appended to it.
+    In a tiled run, 'progress' gives the (start, end) position of this tile's
+    share of the stage and 'tile' labels the events and the memory entries.
+    """
+    begin, end = progress or (index, index + 1)
+    tileFields = {} if tile is None else {"tile": tile}
+    emitEvent("stage_started", stage=name, index=index, total=total,
+              percent=round(100.0 * begin / total, 1), **tileFields)
+    if memoryReport is not None:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    result = func(**kwargs)
+    seconds = round(time.perf_counter() - start, 3)
+    purged = purgeOrphanData()
+
+    fields = {}
+    if memoryReport is not None:
+        fields["memory"] = getMemoryUsage()
+        memoryReport.append({"stage": name, "index": index, **tileFields, "seconds": seconds,
+                             "purged": purged, **fields["memory"]})
+
+    emitEvent("stage_finished", stage=name, index=index, total=total,
+              seconds=seconds,
+              objects=len(bpy.data.objects),
+              objectsByType=countSceneObjects(),
+              purged=purged,
+              percent=round(100.0 * end / total, 1),
+              **tileFields,
+              **fields)
+    return result
+
+
+
+
+
+
+
+
+# ============================
+# MEMORY HYGIENE
+# ============================
+
+def purgeOrphanData():
+    """
+    Removes the meshes, curves and materials that no longer have any user:
+    meshes left behind by joins and object removals, curve data replaced when
+    converting to mesh, ... Meshes go first since they may hold the last
+    reference to a material.
+    """
+    removed = {}
+    for label, blocks in (("meshes", bpy.data.meshes),
+                          ("curves", bpy.data.curves),
+                          ("materials", bpy.data.materials)):
+        orphans = [block for block in blocks if block.users == 0]
+        if orphans:
+            bpy.data.batch_remove(orphans)
+        removed[label] = len(orphans)
+    return removed
+
+
+def getProcessRSS():
+    """ Resident memory of the Blender process in bytes (0 if unknown). """
+    if sys.platform == "win32":
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", ctypes.c_ulong),
+                        ("PageFaultCount", ctypes.c_ulong),
+                        ("PeakWorkingSetSize", ctypes.c_size_t),
+                        ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t),
+                        ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        kernel32 = ctypes.windll.kernel32
+        kernel32.GetCurrentProcess.restype = ctypes.c_void_p
+        ok = ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.c_void_p(kernel32.GetCurrentProcess()), ctypes.byref(counters), counters.cb)
+        return counters.WorkingSetSize if ok else 0
+
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def getMemoryUsage():
+    """
+    Datablock counts, process RSS and the tracemalloc current/peak values
+    (Python allocations only; Blender's own memory shows up in the RSS).
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "datablocks": {
+            "objects": len(bpy.data.objects),
+            "meshes": len(bpy.data.meshes),
+            "curves": len(bpy.data.curves),
+            "materials": len(bpy.data.materials),
+        },
+        "rssMB": round(getProcessRSS() / (1024 * 1024), 1),
+        "pythonCurrentMB": round(current / (1024 * 1024), 2),
+        "pythonPeakMB": round(peak / (1024 * 1024), 2),
+    }
+
+
+def getSidecarPath(outputBase, suffix):
+    """ Path of a file written next to an output: <output>_<suffix>.json """
+    return f"{outputBase}_{suffix}.json"
+
+
+def writeMemoryReport(outputBase, memoryReport):
+    if memoryReport is None:
+        return
+    tracemalloc.stop()
+    path = getSidecarPath(outputBase, "memory")
+    digest = writeJsonAtomic(path, {"stages": memoryReport})
+    emitEvent("output", path=path, sha256=digest, bytes=os.path.getsize(path))
+
+
+
+
+
+
+
+
 # ============================
 # SHARED FUNCTIONS
 # ============================
@@ -98,7 +308,7 @@ def separateByLooseParts(meshObj):
     bpy.ops.mesh.separate(type='LOOSE')
     bpy.ops.object.mode_set(mode='OBJECT')
     baseName = meshObj.name
-    newObjects = [o for o in bpy.context.scene.objects 
+    newObjects = [o for o in getPlanObjects()
                   if o.name == baseName or o.name.startswith(baseName + ".")]
     print(f"{len(newObjects)} objects have been created from '{baseName}'.")
     return newObjects
@@ -133,16 +343,14 @@ def getExtremePoints(obj):
     Uses OpenCV to calculate the minimum rotated bounding box of the object in the XY plane.
     Returns 4 points (Vector) in global coordinates with constant Z.
     """
-    puntos3D = [obj.matrix_world @ v.co for v in obj.data.vertices]
-    puntos2D = np.array([[v.x, v.y] for v in puntos3D], dtype=np.float32)
+    world = getWorldVertexArray(obj)
 
-    rect = cv2.minAreaRect(puntos2D)    # center, (w, h), angle
-    box = cv2.boxPoints(rect)           # 4 corners in order
-    box = np.array(box)
+    rect = cv2.minAreaRect(np.ascontiguousarray(world[:, :2]))    # center, (w, h), angle
+    box = cv2.boxPoints(rect)                                   # 4 corners in order
 
-    z = float(np.mean([v.z for v in puntos3D]))
+    z = float(world[:, 2].mean())
 
-    corners = [Vector((x, y, z)) for x, y in box]
+    corners = [Vector((float(x), float(y), z)) for x, y in box]
 
     print("\nRotated bounding box points (OpenCV):")
     for i, p in enumerate(corners):
@@ -151,6 +359,243 @@ def getExtremePoints(obj):
     return corners
 
 
+def getWorldVertexArray(obj):
+    """
+    Returns the vertices of a mesh object in world space as an (N, 3) float32
+    numpy array, read in one call with foreach_get instead of a per-vertex loop.
+    Single precision is enough because the plan was moved next to the origin
+    at ingest (see rebasePlan).
+    """
+    count = len(obj.data.vertices)
+    coords = np.empty(count * 3, dtype=np.float32)
+    obj.data.vertices.foreach_get("co", coords)
+    matrix = np.array(obj.matrix_world, dtype=np.float32)
+    return coords.reshape(count, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def edgesToChains(edges):
+    """
+    Walks undirected edges (pairs of vertex indices) into chains.
+    Returns (closedLoops, openChains) as lists of vertex index lists.
+    """
+    adjacency = {}
+    for a, b in edges:
+        adjacency.setdefault(a, []).append(b)
+        adjacency.setdefault(b, []).append(a)
+
+    visited = set()
+    closedLoops, openChains = [], []
+    for a, b in edges:
+        if (min(a, b), max(a, b)) in visited:
+            continue
+        visited.add((min(a, b), max(a, b)))
+        chain = [a, b]
+        # Extend forwards from b, then backwards from a
+        for forward in (True, False):
+            current = chain[-1] if forward else chain[0]
+            while True:
+                nxt = next((n for n in adjacency[current]
+                            if (min(current, n), max(current, n)) not in visited), None)
+                if nxt is None:
+                    break
+                visited.add((min(current, nxt), max(current, nxt)))
+                if forward:
+                    chain.append(nxt)
+                else:
+                    chain.insert(0, nxt)
+                current = nxt
+        if len(chain) > 3 and chain[0] == chain[-1]:
+            closedLoops.append(chain[:-1])
+        else:
+            openChains.append(chain)
+    return closedLoops, openChains
+
+
+def computeFootprint(obj, tolerance=1e-4):
+    """
+    XY outline of a mesh object: the edges lying on its lowest Z level, walked
+    into closed loops (and open chains, for walls drawn as loose lines).
+    """
+    world = getWorldVertexArray(obj)
+    if len(world) == 0:
+        return {"closed": [], "open": []}
+    bottom = world[:, 2] <= world[:, 2].min() + tolerance
+    edges = [tuple(e.vertices) for e in obj.data.edges if bottom[e.vertices[0]] and bottom[e.vertices[1]]]
+    closedLoops, openChains = edgesToChains(edges)
+    toXY = lambda chain: [[round(float(world[i, 0]), 5), round(float(world[i, 1]), 5)] for i in chain]
+    return {"closed": [toXY(c) for c in closedLoops], "open": [toXY(c) for c in openChains]}
+
+
+def storeFootprint(obj):
+    """ Keeps the 2D footprint on the object so later stages do not depend on its 3D shape. """
+    obj["footprint"] = json.dumps(computeFootprint(obj))
+
+
+def getFootprint(obj):
+    if "footprint" in obj:
+        return json.loads(obj["footprint"])
+    return computeFootprint(obj)
+
+
+def getTopologyArrays(mesh):
+    """ Loop vertex indices and loops per polygon, as int32 arrays. """
+    loops = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loops)
+    totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", totals)
+    return loops, totals
+
+
+
+
+
+
+
+
+# ============================
+# LOCAL ORIGIN
+# ============================
+
+# Scene property with the world position (CAD coordinates) of the local origin
+ORIGIN_PROPERTY = "plan_origin"
+ORIGIN_EMPTY_NAME = "PLAN_ORIGIN"
+# The offset is rounded to whole meters, so the rebased coordinates keep their decimals
+ORIGIN_STEP = 1.0
+
+
+def transformPoints(points, matrix, offset):
+    """ matrix @ points - offset for an (N, 3) array, in double precision. """
+    return points @ matrix[:3, :3].T + matrix[:3, 3] - offset
+
+
+def getPlanCorners(objects):
+    """ World corners of the bounding boxes of the curves and meshes, as an (N, 3) array. """
+    corners = [transformPoints(np.array(o.bound_box, dtype=np.float64), np.array(o.matrix_world, dtype=np.float64), 0.0)
+               for o in objects if o.type in ('CURVE', 'MESH')]
+    return np.vstack(corners) if corners else np.zeros((0, 3))
+
+
+def computePlanOrigin(corners):
+    """ Center of the XY bounding box of the corners, rounded to ORIGIN_STEP. Heights are kept. """
+    if len(corners) == 0:
+        return np.zeros(3)
+    center = (corners.min(axis=0) + corners.max(axis=0)) / 2
+    return np.array([*np.round(center[:2] / ORIGIN_STEP) * ORIGIN_STEP, 0.0])
+
+
+def rebaseVectors(collection, attribute, width, matrix, offset):
+    """ Rewrites the 'attribute' vectors of a bpy collection as world positions minus 'offset'. """
+    values = np.empty(len(collection) * width, dtype=np.float64)
+    collection.foreach_get(attribute, values)
+    values = values.reshape(-1, width)
+    values[:, :3] = transformPoints(values[:, :3], matrix, offset)
+    collection.foreach_set(attribute, values.ravel())
+
+
+def rebaseObject(obj, offset):
+    """
+    Bakes the transform of a curve or mesh object into its points, minus the
+    offset, and leaves the object at the origin. Anything else is just moved.
+    """
+    matrix = np.array(obj.matrix_world, dtype=np.float64)
+    if obj.type not in ('CURVE', 'MESH') or obj.children:
+        matrix[:3, 3] -= offset
+        obj.matrix_world = Matrix(matrix.tolist())
+        return
+
+    # Linked duplicates get their own copy, as each one is moved differently
+    if obj.data.users > 1:
+        obj.data = obj.data.copy()
+    if obj.type == 'MESH':
+        rebaseVectors(obj.data.vertices, "co", 3, matrix, offset)
+        obj.data.update()
+    else:
+        for spline in obj.data.splines:
+            if spline.type == 'BEZIER':
+                for attribute in ("co", "handle_left", "handle_right"):
+                    rebaseVectors(spline.bezier_points, attribute, 3, matrix, offset)
+            else:
+                rebaseVectors(spline.points, "co", 4, matrix, offset)
+    obj.matrix_world = Matrix.Identity(4)
+
+
+def rebasePlan(outputBase, originOffset=None):
+    """
+    Moves the plan next to the world origin before any geometry is built.
+    CAD plans keep their survey coordinates, often kilometres away from the
+    origin, where the single precision of Blender vertices, mathutils and
+    cv2.minAreaRect only resolves centimetres. The points are rebased in
+    double precision from the stored values, so every later stage can work
+    on float32 arrays without losing millimetres.
+    The offset is kept on the scene and in <output>_origin.json. With
+    --origin world it is put back on export (restorePlanOrigin); with
+    --origin local the saved model stays around the origin and whoever loads
+    it has to add the offset. Models that must line up (the original and the
+    reform, see mainPlanOrigin) are given the same 'originOffset', and the
+    floors of a batch session reuse the offset of the first one.
+    """
+    scene = bpy.context.scene
+    objects = getPlanObjects()
+    if ORIGIN_PROPERTY in scene:
+        offset = np.array(scene[ORIGIN_PROPERTY], dtype=np.float64)
+    else:
+        if originOffset is not None:
+            offset = np.array(originOffset, dtype=np.float64)
+        else:
+            offset = computePlanOrigin(getPlanCorners(objects))
+        scene[ORIGIN_PROPERTY] = offset.tolist()
+
+    if offset.any():
+        for obj in objects:
+            # Children move with their parent
+            if obj.parent is None:
+                rebaseObject(obj, offset)
+        bpy.context.view_layer.update()
+        print(f"Plan rebased: {len(objects)} objects moved by {(-offset).tolist()}.")
+
+    path = getSidecarPath(outputBase, "origin")
+    digest = writeJsonAtomic(path, {"origin": offset.tolist(), "units": "m"})
+    emitEvent("output", path=path, sha256=digest, bytes=os.path.getsize(path))
+    return offset
+
+
+def restorePlanOrigin(collection=None):
+    """
+    Puts the plan back at its CAD coordinates for export: an empty at the
+    offset becomes the parent of every top-level object, so the vertices keep
+    their small local values and only the empty carries the large translation.
+    """
+    scene = bpy.context.scene
+    offset = scene.get(ORIGIN_PROPERTY)
+    if offset is None or not any(offset):
+        return None
+    originObj = bpy.data.objects.get(ORIGIN_EMPTY_NAME)
+    if originObj is None:
+        originObj = bpy.data.objects.new(ORIGIN_EMPTY_NAME, None)
+        (collection or scene.collection).objects.link(originObj)
+        originObj.location = tuple(offset)
+    for objItem in scene.objects:
+        if objItem.parent is None and objItem != originObj:
+            objItem.parent = originObj
+    print(f"Plan moved back to its CAD origin {list(offset)}.")
+    return originObj
+
+
+def mainPlanOrigin(planPaths):
+    """
+    Computes the offset shared by several plans (the center of all their
+    geometry) and emits it as a 'plan_origin' event, so separate conversions
+    can be given the same --origin-offset and stay aligned.
+    """
+    corners = []
+    for planPath in planPaths:
+        bpy.ops.wm.open_mainfile(filepath=planPath)
+        corners.append(getPlanCorners(getPlanObjects()))
+    offset = computePlanOrigin(np.vstack(corners))
+    emitEvent("plan_origin", origin=offset.tolist(), plans=planPaths)
+    return offset
+
+
 
 
 
@@ -161,16 +606,28 @@ def getExtremePoints(obj):
 # FUNCTIONS FOR WALLS
 # ============================
 
-def mainWalls():
+WALL_HEIGHT = 2.70
+# Openings whose corners are this close to a wall corner are snapped onto it
+OPENING_SNAP = 0.05
+
+
+def mainWalls(walls="integrated"):
     wallsName = "00_A_MUROS_curve_"
     wallsObj = bpy.data.objects.get(wallsName)
+    if wallsObj and wallsObj.type == 'CURVE':
+        wallsObj = convertCurveToMesh(wallsName)
     if wallsObj:
         mergeVerticesByDistance(wallsObj)
-        walls = separateByLooseParts(wallsObj)
+        parts = separateByLooseParts(wallsObj)
+        for partObj in parts:
+            storeFootprint(partObj)
+        # Integrated walls are built by mainWallOpenings once doors and windows are known
+        if walls == "integrated":
+            return
         # Extrude and recalculate normals for each part
-        for partObj in walls:
-            extrudeInZ(partObj, height=2.70)
-        for partObj in walls:
+        for partObj in parts:
+            extrudeInZ(partObj, height=WALL_HEIGHT)
+        for partObj in parts:
             recalcNormals(partObj)
             applyCubeUVUnwrap(partObj)
     else:
@@ -191,6 +648,260 @@ def mergeVerticesByDistance(meshObj, threshold=0.0001):
     bpy.ops.object.editmode_toggle()  # Return to Object Mode
 
 
+def getOpeningSpans(opening, height=WALL_HEIGHT):
+    """ Solid height ranges of the wall across an opening: the sill below it and the lintel above. """
+    spans = []
+    if opening["sill"] > 1e-6:
+        spans.append((0.0, float(opening["sill"])))
+    if opening["head"] < height - 1e-6:
+        spans.append((float(opening["head"]), height))
+    return spans
+
+
+def subtractSpans(spans, others):
+    """ Height ranges of 'spans' not covered by any of 'others'. """
+    result = []
+    for z0, z1 in spans:
+        pieces = [(z0, z1)]
+        for o0, o1 in others:
+            pieces = [p for a, b in pieces for p in ((a, min(b, o0)), (max(a, o1), b)) if p[1] - p[0] > 1e-6]
+        result += pieces
+    return result
+
+
+def orientRings(rings):
+    """ Outer rings counter-clockwise and holes clockwise, so the solid is on the left of every edge. """
+    oriented = []
+    for i, ring in enumerate(rings):
+        start = (float(ring[0][0]), float(ring[0][1]))
+        depth = sum(cv2.pointPolygonTest(other.astype(np.float32), start, False) > 0
+                    for j, other in enumerate(rings) if j != i)
+        x, y = ring[:, 0], ring[:, 1]
+        area = np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))
+        if (area > 0) != (depth % 2 == 0):
+            ring = ring[::-1]
+        oriented.append(ring)
+    return oriented
+
+
+def findSharedEdges(regions, tolerance=0.005, cellSize=1.0):
+    """
+    Finds, for every directed edge of every region, the stretches lying against
+    an edge of another region running the other way (the two solids touch
+    there). Returns the edges as (region, ring, p, q) in ring order and, per
+    edge, a list of (t0, t1, otherRegion) with t measured from p (0) to q (1).
+    """
+    edges = []
+    for r, region in enumerate(regions):
+        for i, ring in enumerate(region["rings"]):
+            for p, q in zip(ring, np.roll(ring, -1, axis=0)):
+                if np.linalg.norm(q - p) > 1e-6:
+                    edges.append((r, i, p, q))
+
+    grid = {}
+    for k, (r, _, p, q) in enumerate(edges):
+        lo = np.floor((np.minimum(p, q) - tolerance) / cellSize).astype(int)
+        hi = np.floor((np.maximum(p, q) + tolerance) / cellSize).astype(int)
+        for cx in range(lo[0], hi[0] + 1):
+            for cy in range(lo[1], hi[1] + 1):
+                grid.setdefault((cx, cy), []).append(k)
+
+    shared = [[] for _ in edges]
+    for cell in grid.values():
+        for i, k in enumerate(cell):
+            for m in cell[i + 1:]:
+                (rk, _, pk, qk), (rm, _, pm, qm) = edges[k], edges[m]
+                if rk == rm:
+                    continue
+                length = np.linalg.norm(qk - pk)
+                direction = (qk - pk) / length
+                if np.dot(direction, (qm - pm) / np.linalg.norm(qm - pm)) > -0.999:
+                    continue
+                normal = np.array((-direction[1], direction[0]))
+                if abs(np.dot(pm - pk, normal)) > tolerance or abs(np.dot(qm - pk, normal)) > tolerance:
+                    continue
+                tp, tq = np.dot(pm - pk, direction) / length, np.dot(qm - pk, direction) / length
+                t0, t1 = max(0.0, min(tp, tq)), min(1.0, max(tp, tq))
+                if (t1 - t0) * length <= tolerance:
+                    continue
+                # Both edges of a pair share the same stretch, seen from each side
+                otherLength = np.linalg.norm(qm - pm)
+                s0, s1 = (np.dot(pk + direction * length * t - pm, qm - pm) / otherLength ** 2 for t in (t1, t0))
+                shared[k].append((t0, t1, rm))
+                shared[m].append((max(0.0, s0), min(1.0, s1), rk))
+    # An edge pair crossing several grid cells is found once per cell
+    return edges, [sorted(set(s)) for s in shared]
+
+
+def addWallFace(mesh, points):
+    """ Adds a face to a {"verts", "index", "faces"} builder, welding equal vertices. """
+    face = []
+    for point in points:
+        key = tuple(round(float(c), 5) for c in point)
+        if key not in mesh["index"]:
+            mesh["index"][key] = len(mesh["verts"])
+            mesh["verts"].append(key)
+        face.append(mesh["index"][key])
+    mesh["faces"].append(face)
+
+
+def buildWallMeshes(regions):
+    """
+    Builds the wall solids in plan (profile) space. Every region is a 2D
+    outline with the height ranges it is solid over (wall parts from 0 to the
+    ceiling, window openings below the sill and above the head, door openings
+    above the head). Caps close each range at the top and bottom, and a side
+    face is only emitted over the heights where the region touching that edge
+    is not solid, so sills, jambs and lintels come out as one closed surface
+    without 3D booleans. Returns a builder per owner object.
+    """
+    meshes = {}
+    edges, shared = findSharedEdges(regions)
+    cuts = [sorted({0.0, 1.0} | {t for t0, t1, _ in stretches for t in (t0, t1)}) for stretches in shared]
+
+    # The rings again with a point at every cut, and the heights at which some
+    # face starts or ends at each point: caps and sides then share vertices
+    refined, levels = {}, {}
+    for (r, i, p, q), edgeCuts in zip(edges, cuts):
+        for t in edgeCuts[:-1]:
+            point = p + (q - p) * t
+            refined.setdefault((r, i), []).append(point)
+            key = tuple(np.round(point, 5))
+            levels.setdefault(key, set()).update(z for span in regions[r]["spans"] for z in span)
+
+    for (r, i, p, q), stretches, edgeCuts in zip(edges, shared, cuts):
+        region = regions[r]
+        mesh = meshes.setdefault(region["owner"], {"verts": [], "index": {}, "faces": []})
+        for a, b in zip(edgeCuts, edgeCuts[1:]):
+            middle = (a + b) / 2
+            others = [span for t0, t1, other in stretches if t0 <= middle <= t1 for span in regions[other]["spans"]]
+            pa, pb = p + (q - p) * a, p + (q - p) * b
+            upB = sorted(levels.get(tuple(np.round(pb, 5)), ()))
+            upA = sorted(levels.get(tuple(np.round(pa, 5)), ()), reverse=True)
+            for z0, z1 in subtractSpans(region["spans"], others):
+                # Solid on the left of p->q, so this winding faces outwards
+                addWallFace(mesh, [(*pa, z0), (*pb, z0)] + [(*pb, z) for z in upB if z0 < z < z1]
+                            + [(*pb, z1), (*pa, z1)] + [(*pa, z) for z in upA if z0 < z < z1])
+
+    for r, region in enumerate(regions):
+        mesh = meshes.setdefault(region["owner"], {"verts": [], "index": {}, "faces": []})
+        rings = [np.array(refined[(r, i)]) for i in range(len(region["rings"])) if (r, i) in refined]
+        points = np.vstack(rings)
+        for a, b, c in tessellate_polygon([[Vector((x, y, 0.0)) for x, y in ring] for ring in rings]):
+            (ax, ay), (bx, by), (cx, cy) = points[a], points[b], points[c]
+            if (bx - ax) * (cy - ay) - (by - ay) * (cx - ax) < 0:
+                b, c = c, b
+            for z0, z1 in region["spans"]:
+                addWallFace(mesh, [(*points[a], z1), (*points[b], z1), (*points[c], z1)])
+                addWallFace(mesh, [(*points[c], z0), (*points[b], z0), (*points[a], z0)])
+    return meshes
+
+
+def getWallRegions(wallObjects):
+    """ Regions (solid from the floor to the ceiling) of the wall parts with closed outlines, and the parts drawn as loose lines. """
+    regions, fallback = [], []
+    for obj in wallObjects:
+        footprint = getFootprint(obj)
+        rings = [np.array(r, dtype=np.float64) for r in footprint["closed"] if len(r) >= 3]
+        if not rings or footprint["open"]:
+            fallback.append(obj)
+            continue
+        regions.append({"owner": obj, "rings": orientRings(rings), "spans": [(0.0, WALL_HEIGHT)]})
+    return regions, fallback
+
+
+def buildWalls(wallObjects, openings, targets=None):
+    """
+    Builds the meshes of 'targets' (by default all of 'wallObjects') with the
+    given openings filled in. The other walls are only context for the faces
+    the targets touch. An opening stays with the wall recorded as its owner
+    when that wall is given; otherwise it goes with the target it shares the
+    longest edge with (or the nearest one). Returns (walls, openings) built.
+    """
+    regions, _ = getWallRegions(wallObjects)
+    targets = set(wallObjects if targets is None else targets)
+    targetIndices = [i for i, region in enumerate(regions) if region["owner"] in targets]
+    if not targetIndices:
+        return 0, 0
+
+    wallVertices = np.vstack([ring for region in regions for ring in region["rings"]])
+    openingRegions = []
+    for opening in openings:
+        spans = getOpeningSpans(opening)
+        ring = snapToVertices(opening["corners"], wallVertices, OPENING_SNAP)
+        if not spans or len(ring) < 3:
+            continue
+        openingRegions.append({"owner": None, "rings": orientRings([ring]), "spans": spans, "opening": opening})
+
+    allRegions = regions + openingRegions
+    edges, shared = findSharedEdges(allRegions)
+    contact = {}
+    for (r, _, p, q), stretches in zip(edges, shared):
+        for t0, t1, other in stretches:
+            if r >= len(regions) and other in targetIndices:
+                key = (r, other)
+                contact[key] = contact.get(key, 0.0) + (t1 - t0) * np.linalg.norm(q - p)
+    recorded = {piece["element"]: obj for obj in wallObjects
+                for piece in json.loads(obj.get("wall_openings", "[]"))}
+    for index, region in enumerate(openingRegions, start=len(regions)):
+        owner = recorded.get(region["opening"]["element"])
+        if owner is not None:
+            region["owner"] = owner
+            continue
+        touching = {w: length for (o, w), length in contact.items() if o == index}
+        if touching:
+            nearest = max(touching, key=touching.get)
+        else:
+            center = region["rings"][0].mean(axis=0)
+            nearest = min(targetIndices,
+                          key=lambda w: np.min(np.linalg.norm(np.vstack(regions[w]["rings"]) - center, axis=1)))
+        region["owner"] = regions[nearest]["owner"]
+
+    meshes = buildWallMeshes(allRegions)
+    for obj in targets:
+        if obj not in meshes:
+            continue
+        built = meshes[obj]
+        toLocal = obj.matrix_world.inverted()
+        obj.data.clear_geometry()
+        obj.data.from_pydata([toLocal @ Vector(v) for v in built["verts"]], [], built["faces"])
+        obj.data.update()
+        pieces = [{"element": region["opening"]["element"],
+                   "corners": region["rings"][0].round(5).tolist(),
+                   "spans": [list(span) for span in region["spans"]]}
+                  for region in openingRegions if region["owner"] is obj]
+        if pieces:
+            obj["wall_openings"] = json.dumps(pieces)
+        elif "wall_openings" in obj:
+            del obj["wall_openings"]
+        applyCubeUVUnwrap(obj)
+    return len(targetIndices), sum(region["owner"] in targets for region in openingRegions)
+
+
+def mainWallOpenings(walls="integrated"):
+    """
+    Turns the wall parts into solid meshes with their openings built in. The
+    gap left in the wall for each door or window (the opening stored by
+    mainDoors/mainWindows) is filled with its sill and lintel, and the pieces
+    belong to the wall part they share the longest edge with. The window glass
+    stays a separate object; the stacked PRISMA_BASE_/PRISMA_TOP_ blocks of
+    the legacy mode are not needed.
+    """
+    if walls != "integrated":
+        return
+    wallObjects = [o for o in getWallObjects() if "footprint" in o]
+    _, fallback = getWallRegions(wallObjects)
+
+    # Extruded as before: loose lines have no inside to fill
+    for obj in fallback:
+        extrudeInZ(obj, height=WALL_HEIGHT)
+        recalcNormals(obj)
+        applyCubeUVUnwrap(obj)
+
+    built, openings = buildWalls(wallObjects, collectOpenings())
+    print(f"{built} walls built with {openings} openings ({len(fallback)} extruded from loose lines).")
+
+
 
 
 
@@ -201,6 +912,11 @@ def mergeVerticesByDistance(meshObj, threshold=0.0001):
 # ============================
 # FUNCTIONS FOR DOORS
 # ============================
+
+# How far from the leaf the frames of its opening are searched
+DOOR_FRAME_SEARCH = 0.5
+
+
 def groupAndExtrudeFramesPerDoor(doors, smallObjects, height=2.0):
     """
     For each door, finds nearby frames with numeric suffix > 2,
@@ -261,6 +977,7 @@ def mainDoors():
             float_angle = computeDoorAngle(door)
             door.name = f"{door.name}_{float_angle}R"
             print(f"Door '{door.name}': oriented angle = {float_angle}°")
+        storeDoorOpenings(doors, smallObjects, height=2.03)
         # Extrude all objects (doors and smallObjects) 2.03 units in Z
         for o in doors + smallObjects:
             extrudeInZ(o, height=2.03)
@@ -271,6 +988,47 @@ def mainDoors():
         print("Could not process the door curve.")
 
 
+def storeDoorOpenings(doors, smallObjects, height=2.03, defaultDepth=0.12):
+    """
+    Stores on each door the rectangle of its wall opening. The plan draws the
+    leaf open at 90 degrees from its pivot, so the opening runs from the pivot
+    along the perpendicular of the leaf, as long as the leaf, towards the side
+    the leaf is drawn on; its depth is taken from the frames around it.
+    """
+    if not doors:
+        return
+    framePoints = [getWorldVertexArray(o)[:, :2] for o in smallObjects if o.data.vertices]
+    framePoints = np.vstack(framePoints) if framePoints else np.zeros((0, 2))
+
+    for door in doors:
+        leaf = getWorldVertexArray(door)[:, :2]
+        pivot = np.array(door.location, dtype=np.float64)[:2]
+        (cx, cy), (w, h), angle = cv2.minAreaRect(leaf.astype(np.float32))
+        theta = np.radians(angle if w >= h else angle + 90.0)
+        along = np.array((np.cos(theta), np.sin(theta)))
+        if np.dot((cx, cy) - pivot, along) < 0:
+            along = -along
+        length = max(w, h)
+        side = np.array((-along[1], along[0]))
+
+        # The leaf is drawn on the opening side of its pivot
+        direction = side if np.dot((cx, cy) - pivot, side) >= 0 else -side
+        relative = framePoints - pivot
+        wallCoord = relative @ direction
+        depthCoord = relative @ along
+        inside = (wallCoord > -0.05) & (wallCoord < length + 0.05) & (np.abs(depthCoord) < DOOR_FRAME_SEARCH)
+        depth = float(np.clip(-depthCoord[inside].min(), 0.05, 0.5)) if inside.any() else defaultDepth
+
+        corners = [pivot - along * depth, pivot - along * depth + direction * length,
+                   pivot + along * 0.02 + direction * length, pivot + along * 0.02]
+        door["opening"] = json.dumps({
+            "kind": "door",
+            "corners": [[round(float(x), 5), round(float(y), 5)] for x, y in corners],
+            "sill": 0.0,
+            "head": height,
+        })
+
+
 def computeDoorAngle(doorObj):
     """
     After moving the origin of doorObj, computes the angle (0–360)
@@ -374,7 +1132,12 @@ def setOriginToClosestVertex(obj, smallObjects):
 # FUNCTIONS FOR WINDOWS
 # ============================
 
-def mainWindows():
+# Distances under which window segments are joined into one window
+WINDOW_VERTEX_THRESHOLD = 0.15
+WINDOW_CENTER_THRESHOLD = 0.5
+
+
+def mainWindows(walls="integrated"):
     curveName = "00_A_CARP_curve_"
     meshObj = convertCurveToMesh(curveName)
     if not meshObj:
@@ -384,21 +1147,34 @@ def mainWindows():
     parts = separateByLooseParts(meshObj)
     print(f"{len(parts)} segments obtained from the window mesh.")
 
-    mergedByVertices = unifyAllObjectsNearby(parts, threshold=0.15)
+    mergedByVertices = unifyAllObjectsNearby(parts, threshold=WINDOW_VERTEX_THRESHOLD)
     print(f"After merging by vertices, {len(mergedByVertices)} objects remain for windows.")
 
     for partObj in mergedByVertices:
         updateOriginToGeometricCenter(partObj)
 
-    finalObjects = unifyObjectsByCenters(mergedByVertices, threshold=0.5)
+    finalObjects = unifyObjectsByCenters(mergedByVertices, threshold=WINDOW_CENTER_THRESHOLD)
     print(f"After merging by centers, {len(finalObjects)} objects remain for windows.")
 
     tripleSolids = []
     for partObj in finalObjects:
-        solids = createTripleSolidsFromObject(
-            partObj, baseHeight=0.9, midHeight=1.3, topHeight=0.5
-        )
-        tripleSolids.extend(solids)
+        if walls == "integrated":
+            # Sill and lintel are part of the wall (mainWallOpenings), only the glass is separate
+            solids = [None, createThinPrismFromCorners(getObjectCorners(partObj), height=1.3, zOffset=0.9,
+                                                       namePrefix="PRISMA_MEDIO_" + partObj.name)]
+        else:
+            solids = createTripleSolidsFromObject(
+                partObj, baseHeight=0.9, midHeight=1.3, topHeight=0.5
+            )
+        tripleSolids.extend(s for s in solids if s)
+        # The glass keeps the opening it fills (used to find room portals)
+        topLeft, topRight, bottomLeft, bottomRight = getObjectCorners(partObj)
+        solids[1]["opening"] = json.dumps({
+            "kind": "window",
+            "corners": [[round(p.x, 5), round(p.y, 5)] for p in (bottomLeft, bottomRight, topRight, topLeft)],
+            "sill": 0.9,
+            "head": 0.9 + 1.3,
+        })
     print(f"{len(tripleSolids)} solids (triple set) have been created from windows.")
 
     for solid in tripleSolids:
@@ -613,7 +1389,7 @@ def mainFurniture():
     """
     orientation_parts = separate_orientations()
     midpoints_world = convert_lines_to_midpoint_points(orientation_parts)
-    for curveObj in list(bpy.data.objects):
+    for curveObj in getPlanObjects():
         if curveObj.type == 'CURVE' and not curveObj.name.startswith("00_"):
             print(f"\nProcessing '{curveObj.name}'...")
 
@@ -824,82 +1600,156 @@ def computeOrientationAngleFromMidpoints(curveObj, midpoints_world):
 # ============================
 # FUNCTIONS FOR FLOOR AND CEILING
 # ============================
-def createFloorFromCorners(corners, depth=1.0, z_offset=0.0, namePrefix="PRISM"):
+def getRegionOutlines(raster, mask, minArea=0.25, epsilon=1.0):
     """
-    Creates a prism from 4 points (Vector) in the order returned by getExtremePoints,
-    with a height `depth` and offset `z_offset` units in Z.
-    - corners: list of 4 mathutils.Vector, consistently ordered.
-    - depth: thickness of the prism along the base normal.
-    - z_offset: vertical offset applied to all geometry before creation.
+    Outlines of a region of the plan raster as (outer, holes) pairs of world
+    XY arrays, simplified with an 'epsilon' pixel tolerance. Pieces smaller
+    than 'minArea' m2 are dropped.
     """
-    # Apply Z offset to base vertices
-    base_verts = [Vector((v.x, v.y, v.z + z_offset)) for v in corners]
+    resolution = raster["resolution"]
+    contours, hierarchy = cv2.findContours(mask.astype(np.uint8), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    if hierarchy is None:
+        return []
 
-    # Calculate the base normal
-    v0, v1, v2, _ = base_verts
-    normal = (v1 - v0).cross(v2 - v0).normalized()
+    def toWorld(contour):
+        contour = cv2.approxPolyDP(contour, epsilon, True).reshape(-1, 2)
+        return raster["origin"] + contour * resolution
 
-    # Generate top face vertices by extruding along the normal
-    top_verts = [v + normal * depth for v in base_verts]
+    minPixels = minArea / resolution ** 2
+    outlines = []
+    for index, (_, _, firstHole, parent) in enumerate(hierarchy[0]):
+        if parent >= 0 or cv2.contourArea(contours[index]) < minPixels:
+            continue
+        holes = []
+        hole = firstHole
+        while hole >= 0:
+            if cv2.contourArea(contours[hole]) >= minPixels:
+                holes.append(toWorld(contours[hole]))
+            hole = hierarchy[0][hole][0]
+        outlines.append((toWorld(contours[index]), holes))
+    return outlines
 
-    # All vertices of the prism: base + top
-    verts = base_verts + top_verts
 
-    # Faces: base, top, and 4 lateral faces
-    faces = [
-        [0, 1, 2, 3],       # base
-        [4, 5, 6, 7],       # top
-        [0, 1, 5, 4],       # side 1
-        [1, 2, 6, 5],       # side 2
-        [2, 3, 7, 6],       # side 3
-        [3, 0, 4, 7],       # side 4
-    ]
+def snapToVertices(ring, vertices, tolerance):
+    """
+    Moves every point of a ring onto the nearest wall vertex within
+    'tolerance', so raster outlines end exactly on the wall corners.
+    """
+    if len(vertices):
+        distances = np.linalg.norm(ring[:, None, :] - vertices[None, :, :], axis=2)
+        nearest = distances.argmin(axis=1)
+        close = distances[np.arange(len(ring)), nearest] <= tolerance
+        ring = ring.copy()
+        ring[close] = vertices[nearest[close]]
+    # Points snapped onto the same vertex collapse into one
+    keep = np.any(np.abs(ring - np.roll(ring, 1, axis=0)) > 1e-9, axis=1)
+    return ring[keep]
+
+
+def createSlabFromOutline(outer, holes, depth=0.1, zOffset=0.0, name="SLAB"):
+    """
+    Creates a slab of thickness 'depth' whose top and bottom are the polygon
+    'outer' minus 'holes' (world XY arrays). The faces are triangulated with
+    Blender's scanline fill, which handles concave outlines and holes. Its
+    cost grows about quadratically with the points of the outline (1 s for
+    16,000 on a concave comb), which is negligible for the few dozen points
+    of an apartment outline.
+    """
+    rings = [r for r in [outer] + holes if len(r) >= 3]
+    if not rings:
+        return None
+    triangles = tessellate_polygon([[Vector((x, y, 0.0)) for x, y in ring] for ring in rings])
+    if not triangles:
+        print(f"Could not triangulate the outline of '{name}'.")
+        return None
 
-    mesh = bpy.data.meshes.new(namePrefix + "Mesh")
+    points = np.vstack(rings)
+    count = len(points)
+    verts = [(x, y, zOffset) for x, y in points] + [(x, y, zOffset + depth) for x, y in points]
+    faces = [(c, b, a) for a, b, c in triangles] + [(a + count, b + count, c + count) for a, b, c in triangles]
+    start = 0
+    for ring in rings:
+        n = len(ring)
+        for i in range(n):
+            a, b = start + i, start + (i + 1) % n
+            faces.append((a, b, b + count, a + count))
+        start += n
+
+    mesh = bpy.data.meshes.new(name + "Mesh")
     mesh.from_pydata(verts, [], faces)
     mesh.update()
-
-    obj = bpy.data.objects.new(namePrefix, mesh)
+    obj = bpy.data.objects.new(name, mesh)
     bpy.context.collection.objects.link(obj)
-    print(f"'{obj.name}' has been created (depth={depth}, z_offset={z_offset}).")
+    print(f"'{obj.name}' has been created ({len(triangles)} triangles per face, z_offset={zOffset}).")
     return obj
 
 
-def mainSurface():
+def createFloorAndCeiling(outer, holes, suffix):
+    created = []
+    # Lower floor: thickness 0.1, 0.1 lower; upper floor: thickness 0.1, at height 2.7
+    for prefix, zOffset in (("FLOOR_LOWER_", -0.1), ("FLOOR_UPPER_", 2.7)):
+        slab = createSlabFromOutline(outer, holes, depth=0.1, zOffset=zOffset, name=f"{prefix}{suffix}")
+        if slab:
+            recalcNormals(slab)
+            applyCubeUVUnwrap(slab)
+            created.append(slab)
+    return created
+
+
+def partitionByCells(raster):
+    """
+    Splits the whole building (everything but the exterior) between the
+    rooms: walls and openings go to the nearest room, so per-room slabs
+    also cover thresholds and the space under the walls.
     """
-    Selects curves, gets their 4 corners, and creates two prism-planes:
-      1) with thickness 0.1, offset -0.1 in Z
-      2) with thickness 0.1, offset +2.8 in Z
+    labels = raster["labels"]
+    _, nearest = cv2.distanceTransformWithLabels((labels <= 0).astype(np.uint8), cv2.DIST_L2, 3,
+                                                 labelType=cv2.DIST_LABEL_CCOMP)
+    inCell = labels > 0
+    lookup = np.zeros(nearest.max() + 1, dtype=np.int32)
+    lookup[nearest[inCell]] = labels[inCell]
+    owners = lookup[nearest]
+    owners[labels == 0] = 0
+    return owners
+
+
+def mainSurface(slabs="building"):
     """
-    prefix = "00_A_MUROS"
-    curves = [o for o in bpy.data.objects if o.type == 'CURVE' and o.name.startswith(prefix)]
-    if not curves:
-        print(f"No curves found with prefix '{prefix}'.")
+    Creates the floor and ceiling slabs from the real outline of the plan:
+    the walls, openings and rooms of the plan raster, with the corners
+    snapped back onto the wall vertices. With slabs="room" every room gets
+    its own pair of slabs (tagged with 'cell_id') instead of one per building.
+    """
+    raster = buildPlanRaster()
+    if raster is None:
         return
 
-    for curve in curves:
-        meshObj = convertCurveToMesh(curve.name)
-        if not meshObj:
-            continue
-
-        corners = getExtremePoints(meshObj)
-        base_name = meshObj.name
-
-        # Lower floor: thickness 0.1, 0.1 lower
-        floor = createFloorFromCorners(corners,
-                               depth=0.1,
-                               z_offset=-0.1,
-                               namePrefix=f"FLOOR_LOWER_{base_name}")
-        recalcNormals(floor)
-        applyCubeUVUnwrap(floor)
-
-        # Upper floor: thickness 0.1, at height 2.8
-        ceiling = createFloorFromCorners(corners,
-                               depth=0.1,
-                               z_offset=2.7,
-                               namePrefix=f"FLOOR_UPPER_{base_name}")
-        recalcNormals(ceiling)
-        applyCubeUVUnwrap(ceiling)
+    wallVertices = np.array([p for o in getWallObjects() for chains in getFootprint(o).values()
+                             for chain in chains for p in chain], dtype=np.float64).reshape(-1, 2)
+    tolerance = 2.0 * raster["resolution"]
+
+    def snapped(outer, holes):
+        return (snapToVertices(outer, wallVertices, tolerance),
+                [snapToVertices(h, wallVertices, tolerance) for h in holes])
+
+    labels = raster["labels"]
+    if slabs == "room":
+        owners = partitionByCells(raster)
+        for cell in raster["cells"]:
+            region = owners == cell["id"]
+            # Grow one pixel into the rooms with a higher id, so neighbouring
+            # outlines meet on the same pixel centers without overlapping
+            grown = cv2.dilate(region.astype(np.uint8), np.ones((3, 3), np.uint8)) > 0
+            region |= grown & (owners > cell["id"])
+            for part, (outer, holes) in enumerate(getRegionOutlines(raster, region)):
+                suffix = f"ROOM_{cell['id']:02d}" + (f"_{part}" if part else "")
+                for slab in createFloorAndCeiling(*snapped(outer, holes), suffix):
+                    slab["cell_id"] = cell["id"]
+    else:
+        # Everything that is not exterior: walls, openings and rooms
+        for part, (outer, holes) in enumerate(getRegionOutlines(raster, labels != 0)):
+            suffix = "00_A_MUROS_curve_" + (f".{part:03d}" if part else "")
+            createFloorAndCeiling(*snapped(outer, holes), suffix)
 
 
 
@@ -935,29 +1785,3614 @@ def mainLights():
 
 
 # ============================
-# MAIN
+# FUNCTIONS FOR ROOMS
 # ============================
 
-def mainScript(savePath):
-    parseNames()
-    mainSurface()
-    mainFurniture()
-    mainWalls()
-    mainDoors()
-    mainWindows()
-    mainLights()
-    saveBlend(savePath)
+def collectOpenings():
+    """ Door and window openings stored by mainDoors/mainWindows. """
+    openings = []
+    for obj in getPlanObjects():
+        if "opening" in obj:
+            opening = json.loads(obj["opening"])
+            opening["element"] = obj.name
+            opening["corners"] = np.array(opening["corners"], dtype=np.float64)
+            openings.append(opening)
+    return openings
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="Script to generate walls, doors and windows in Blender"
-    )
-    parser.add_argument(
-        "--base-path",
-        required=True,
-        dest="savePath",
-        help="Base path of your project (where the blender/ folder is located)"
-    )
-    args = parser.parse_args(sys.argv[sys.argv.index("--") + 1:])
-    mainScript(args.savePath)
+def getWallObjects():
+    return [o for o in getPlanObjects() if o.type == 'MESH' and o.name.startswith("00_A_MUROS")]
+
+
+def buildPlanRaster(resolution=0.02, minRoomArea=1.0, margin=0.5, sealGap=0.1, maxPixels=16_000_000):
+    """
+    Rasterizes the wall footprints and the door/window openings and labels the
+    free space left between them. Every enclosed region of at least
+    'minRoomArea' m2 becomes a room cell (ids from 1, ordered by position);
+    the region connected to the border is the exterior (0) and walls,
+    openings and slivers are -1. Gaps narrower than 'sealGap' between walls
+    and openings are closed. The resolution is coarsened if the plan would
+    need more than 'maxPixels'.
+    """
+    footprints = [getFootprint(o) for o in getWallObjects()]
+    openings = collectOpenings()
+    points = [p for fp in footprints for chain in fp["closed"] + fp["open"] for p in chain]
+    points += [p for op in openings for p in op["corners"].tolist()]
+    if not points:
+        print("No wall footprints found, rooms cannot be computed.")
+        return None
+
+    points = np.array(points, dtype=np.float64)
+    low = points.min(axis=0) - margin
+    high = points.max(axis=0) + margin
+    extent = high - low
+    if extent[0] * extent[1] / resolution ** 2 > maxPixels:
+        resolution = float(np.sqrt(extent[0] * extent[1] / maxPixels))
+        print(f"Plan raster coarsened to {resolution:.3f} m per pixel.")
+    width, height = (np.ceil(extent / resolution).astype(int) + 1).tolist()
+
+    def toPixels(chain):
+        return np.round((np.asarray(chain, dtype=np.float64) - low) / resolution).astype(np.int32)
+
+    walls = np.zeros((height, width), dtype=np.uint8)
+    for fp in footprints:
+        closed = [toPixels(c) for c in fp["closed"] if len(c) >= 3]
+        # Loops inside another loop of the same wall are holes
+        areas = [abs(cv2.contourArea(c)) for c in closed]
+        order = np.argsort(areas)[::-1]
+        part = np.zeros_like(walls)
+        for idx in order:
+            loop = closed[idx]
+            inside = any(cv2.pointPolygonTest(closed[j].reshape(-1, 1, 2), tuple(map(float, loop[0])), False) > 0
+                         for j in order if areas[j] > areas[idx])
+            cv2.fillPoly(part, [loop], 0 if inside else 1)
+        walls |= part
+        for chain in closed:
+            cv2.polylines(walls, [chain], True, 1, 1)
+        for chain in fp["open"]:
+            cv2.polylines(walls, [toPixels(chain)], False, 1, 1)
+
+    barrier = walls.copy()
+    for opening in openings:
+        cv2.fillPoly(barrier, [toPixels(opening["corners"])], 1)
+    # Seal the slivers left where openings and walls do not quite meet
+    seal = 2 * int(np.ceil(sealGap / resolution / 2)) + 1
+    barrier = cv2.morphologyEx(barrier, cv2.MORPH_CLOSE, np.ones((seal, seal), np.uint8))
+
+    count, components, stats, centroids = cv2.connectedComponentsWithStats(
+        (1 - barrier).astype(np.uint8), connectivity=4, ltype=cv2.CV_32S)
+
+    labels = np.full((height, width), -1, dtype=np.int32)
+    borderLabels = set(np.unique(np.concatenate((components[0], components[-1],
+                                                 components[:, 0], components[:, -1])))) - {0}
+    minPixels = minRoomArea / resolution ** 2
+    rooms = []
+    for label in range(1, count):
+        if label in borderLabels:
+            labels[components == label] = 0
+        elif stats[label, cv2.CC_STAT_AREA] >= minPixels:
+            rooms.append(label)
+    # Stable ids: sorted by centroid (Y then X)
+    rooms.sort(key=lambda l: (round(centroids[l][1]), round(centroids[l][0])))
+
+    cells = []
+    for cellId, label in enumerate(rooms, start=1):
+        x, y, w, h, area = stats[label]
+        mask = (components[y:y + h, x:x + w] == label)
+        labels[y:y + h, x:x + w][mask] = cellId
+        contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contour = max(contours, key=cv2.contourArea)
+        contour = cv2.approxPolyDP(contour, 1.0, True).reshape(-1, 2) + (x, y)
+        polygon = low + contour * resolution
+        cells.append({
+            "id": cellId,
+            "area": round(float(area * resolution ** 2), 3),
+            "center": [round(float(v), 4) for v in low + centroids[label] * resolution],
+            "bounds": [round(float(v), 4) for v in np.concatenate((low + np.array((x, y)) * resolution,
+                                                                   low + np.array((x + w, y + h)) * resolution))],
+            "polygon": [round(float(v), 4) for v in polygon.ravel()],
+        })
+
+    print(f"Plan raster {width}x{height} at {resolution:.3f} m: {len(cells)} rooms found.")
+    return {
+        "origin": low,
+        "resolution": resolution,
+        "walls": walls,
+        "labels": labels,
+        "cells": cells,
+        "openings": openings,
+        "toPixels": toPixels,
+    }
+
+
+def findPortals(raster, searchDistance=0.6):
+    """
+    For every opening, walks from its center to both sides along the short
+    axis of its rectangle until a cell (or the exterior) is reached.
+    """
+    resolution = raster["resolution"]
+    portals = []
+    for portalId, opening in enumerate(raster["openings"], start=1):
+        corners = opening["corners"]
+        center = corners.mean(axis=0)
+        sideA = corners[1] - corners[0]
+        sideB = corners[2] - corners[1]
+        along, across = (sideA, sideB) if np.linalg.norm(sideA) >= np.linalg.norm(sideB) else (sideB, sideA)
+        normal = across / max(np.linalg.norm(across), 1e-9)
+
+        halfDepth = np.linalg.norm(across) / 2.0
+        cells = []
+        for sign in (1.0, -1.0):
+            found = -1
+            for step in np.arange(halfDepth, halfDepth + searchDistance, resolution):
+                found = lookupCell(raster, center + sign * normal * step)
+                if found >= 0:
+                    break
+            cells.append(found)
+
+        portals.append({
+            "id": portalId,
+            "kind": opening["kind"],
+            "element": opening["element"],
+            "cells": cells,
+            "center": [round(float(v), 4) for v in center],
+            "width": round(float(np.linalg.norm(along)), 3),
+            "sill": opening["sill"],
+            "head": opening["head"],
+        })
+    return portals
+
+
+def getElementCells(obj, raster, dilation=3):
+    """
+    Cells touched by an element: its footprint (walls) or its convex hull
+    (everything else) is drawn in a window of the label image, grown by a few
+    pixels so walls also pick up the rooms on both sides.
+    """
+    labels = raster["labels"]
+    height, width = labels.shape
+    if "footprint" in obj:
+        fp = json.loads(obj["footprint"])
+        chains = [raster["toPixels"](c) for c in fp["closed"] + fp["open"] if c]
+    else:
+        xy = getWorldVertexArray(obj)[:, :2]
+        chains = [cv2.convexHull(raster["toPixels"](xy).reshape(-1, 1, 2)).reshape(-1, 2)]
+    if not chains:
+        return []
+
+    allPoints = np.vstack(chains)
+    x0, y0 = np.maximum(allPoints.min(axis=0) - dilation, 0)
+    x1, y1 = np.minimum(allPoints.max(axis=0) + dilation + 1, (width, height))
+    if x0 >= x1 or y0 >= y1:
+        return []
+    mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    for chain in chains:
+        local = (chain - (x0, y0)).astype(np.int32)
+        if len(local) >= 3:
+            cv2.fillPoly(mask, [local], 1)
+        cv2.polylines(mask, [local], True, 1, 1)
+    mask = cv2.dilate(mask, np.ones((2 * dilation + 1, 2 * dilation + 1), np.uint8))
+    found = np.unique(labels[y0:y1, x0:x1][mask > 0])
+    return [int(c) for c in found if c > 0]
+
+
+def lookupCell(raster, point):
+    """ Label of the raster pixel under a world XY point (-1 outside the raster). """
+    labels = raster["labels"]
+    px, py = raster["toPixels"]([point])[0]
+    if 0 <= py < labels.shape[0] and 0 <= px < labels.shape[1]:
+        return int(labels[py, px])
+    return -1
+
+
+def tagElementCells(obj, raster, portalCells):
+    """
+    Stores the cells of an element on it ('cell_id' is the main one, 'cell_ids'
+    all of them) and returns its entry for the cell graph.
+    """
+    cells = portalCells.get(obj.name) or getElementCells(obj, raster)
+    xy = getWorldVertexArray(obj)[:, :2]
+    center = (xy.min(axis=0) + xy.max(axis=0)) / 2.0
+    # Main cell: the one under the element center, if it is one of its cells
+    centerCell = lookupCell(raster, center)
+    obj["cell_id"] = centerCell if centerCell in cells else (cells[0] if cells else 0)
+    obj["cell_ids"] = ",".join(str(c) for c in cells)
+    return {
+        "name": obj.name,
+        "id": obj["element_id"],
+        "cells": cells,
+        "center": [round(float(v), 4) for v in center],
+    }
+
+
+def assignElementIds():
+    """ Gives every element a stable id that survives later renames. """
+    nextId = 1 + max((int(o["element_id"][1:]) for o in bpy.data.objects if "element_id" in o), default=0)
+    for obj in getPlanObjects():
+        if "element_id" not in obj:
+            obj["element_id"] = f"E{nextId:05d}"
+            nextId += 1
+
+
+def mainRooms(outputBase):
+    """
+    Derives room cells from the wall footprints, detects the door and window
+    portals between them, tags every generated element with its cells
+    ('cell_id' is the main one, 'cell_ids' all of them) and writes the
+    cell/portal graph to <output>_cells.json for occlusion culling in Unity.
+    """
+    raster = buildPlanRaster()
+    if raster is None:
+        return None
+
+    portals = findPortals(raster)
+    portalCells = {p["element"]: [c for c in p["cells"] if c > 0] for p in portals}
+
+    assignElementIds()
+    elements = []
+    for obj in getPlanObjects():
+        if obj.type != 'MESH' or not obj.data.vertices:
+            continue
+        elements.append(tagElementCells(obj, raster, portalCells))
+
+    graph = {
+        "resolution": raster["resolution"],
+        "cells": raster["cells"],
+        "portals": portals,
+        "elements": elements,
+    }
+    path = getSidecarPath(outputBase, "cells")
+    digest = writeJsonAtomic(path, graph)
+    emitEvent("output", path=path, sha256=digest, bytes=os.path.getsize(path))
+    print(f"Rooms: {len(raster['cells'])} cells, {len(portals)} portals, {len(elements)} elements tagged.")
+    return raster
+
+
+
+
+
+
+
+
+# ============================
+# FUNCTIONS FOR COLLISION PROXIES
+# ============================
+
+COLLIDER_PREFIX = "COL_"
+# Name given to the furniture blocks by mainFurniture
+FURNITURE_NAME = re.compile(r"_\d+(\.\d+)?L_\d+(\.\d+)?W_\d+(\.\d+)?R$")
+FURNITURE_COLLIDER_HEIGHT = 0.9
+MAX_WALL_THICKNESS = 0.6
+
+
+def insideRings(point, rings):
+    """ Even-odd test against all the rings of a footprint (outer and holes). """
+    inside = False
+    for ring in rings:
+        if cv2.pointPolygonTest(ring, (float(point[0]), float(point[1])), False) >= 0:
+            inside = not inside
+    return inside
+
+
+def boxInsideRings(origin, direction, side, along, rings, step=0.05):
+    """ Samples the box spanned from 'origin' by 'along' (on 'direction') and 'side' against the footprint. """
+    count = max(2, int(np.ceil((along[1] - along[0]) / step)) + 1)
+    for t in np.linspace(along[0] + 0.01, along[1] - 0.01, count):
+        for s in (0.1, 0.5, 0.9):
+            if not insideRings(origin + direction * t + side * s, rings):
+                return False
+    return True
+
+
+def getWallBoxes(footprint, maxThickness=MAX_WALL_THICKNESS, minOverlap=0.01, parallelCos=0.996):
+    """
+    Splits a wall outline into oriented rectangles, one per straight run: every
+    edge is paired with the closest antiparallel edge facing it through the
+    wall (its other face) and the pair becomes a box spanning both edges, or
+    only their common part when the longer box would leave the wall.
+    Returns a list of (center, (length, thickness), angle in radians).
+    """
+    rings = [np.array(r, dtype=np.float32) for r in footprint["closed"] if len(r) >= 3]
+    starts, ends = [], []
+    for ring in rings:
+        starts.append(ring)
+        ends.append(np.roll(ring, -1, axis=0))
+    if not rings:
+        return []
+    starts = np.vstack(starts).astype(np.float64)
+    ends = np.vstack(ends).astype(np.float64)
+    lengths = np.linalg.norm(ends - starts, axis=1)
+    valid = lengths > 1e-6
+    starts, ends, lengths = starts[valid], ends[valid], lengths[valid]
+    directions = (ends - starts) / lengths[:, None]
+    normals = np.stack((-directions[:, 1], directions[:, 0]), axis=1)
+
+    boxes, pairs = [], set()
+    for i in range(len(starts)):
+        d, n = directions[i], normals[i]
+        # Antiparallel edges within the wall thickness, on either side
+        offsets = (starts + ends) / 2 @ n - starts[i] @ n
+        a, b = (starts - starts[i]) @ d, (ends - starts[i]) @ d
+        low, high = np.minimum(a, b), np.maximum(a, b)
+        overlap = np.minimum(high, lengths[i]) - np.maximum(low, 0.0)
+        candidates = (directions @ d < -parallelCos) & (np.abs(offsets) > 1e-3) \
+            & (np.abs(offsets) <= maxThickness) & (overlap > minOverlap)
+        # The strip between both faces has to be wall, not a gap between two runs
+        for j in np.argsort(np.abs(offsets)):
+            if not candidates[j]:
+                continue
+            middle = starts[i] + d * (max(low[j], 0.0) + overlap[j] / 2) + n * offsets[j] / 2
+            if insideRings(middle, rings):
+                break
+        else:
+            continue
+        if (min(i, j), max(i, j)) in pairs:
+            continue
+        pairs.add((min(i, j), max(i, j)))
+
+        side = n * offsets[j]
+        along = (min(low[j], 0.0), max(high[j], lengths[i]))
+        if not boxInsideRings(starts[i], d, side, along, rings):
+            along = (max(low[j], 0.0), min(high[j], lengths[i]))
+        center = starts[i] + d * (along[0] + along[1]) / 2 + side / 2
+        boxes.append((center, (along[1] - along[0], abs(offsets[j])), atan2(d[1], d[0])))
+
+    if not boxes:
+        # Pillars, curved or loose-line walls: one box around the whole outline
+        points = np.vstack(rings + [np.array(c, dtype=np.float32) for c in footprint["open"] if c])
+        (cx, cy), (w, h), angle = cv2.minAreaRect(points.astype(np.float32))
+        boxes.append((np.array((cx, cy)), (w, h), radians(angle)))
+    return boxes
+
+
+def createColliderProxy(name, center, size, angle, zRange, parent=None):
+    """
+    Empty drawn as a unit cube and scaled to the box, which Unity turns into a
+    BoxCollider. Proxies of moving elements (doors) are parented to them.
+    """
+    proxy = bpy.data.objects.new(name, None)
+    proxy.empty_display_type = 'CUBE'
+    proxy.empty_display_size = 0.5
+    bpy.context.collection.objects.link(proxy)
+    zLow, zHigh = zRange
+    proxy.matrix_world = Matrix.LocRotScale(
+        Vector((float(center[0]), float(center[1]), (zLow + zHigh) / 2)),
+        Euler((0.0, 0.0, angle)),
+        Vector((max(float(size[0]), 0.01), max(float(size[1]), 0.01), max(zHigh - zLow, 0.01))))
+    if parent is not None:
+        proxy.parent = parent
+        proxy.matrix_parent_inverse = parent.matrix_world.inverted()
+    proxy["collider"] = "box"
+    return proxy
+
+
+def getColliderKind(obj):
+    """ "wall", "door" or "furniture" for the elements that get box proxies, None for the rest. """
+    if obj.type != 'MESH' or not obj.data.vertices:
+        return None
+    if obj.name.startswith("00_A_MUROS") and obj.data.polygons:
+        return "wall"
+    if obj.name.startswith("PUERTA") and obj.data.polygons:
+        return "door"
+    if not obj.name.startswith("00_") and FURNITURE_NAME.search(obj.name):
+        return "furniture"
+    return None
+
+
+def getColliderElements():
+    """ (kind, object) of the walls, doors and furniture blocks of the plan. """
+    return [(getColliderKind(obj), obj) for obj in getPlanObjects() if getColliderKind(obj)]
+
+
+def createElementColliders(kind, obj):
+    """ Creates the box proxies of one wall, door or furniture block and returns their entries for the JSON. """
+    world = getWorldVertexArray(obj)
+    zRange = (float(world[:, 2].min()), float(world[:, 2].max()))
+    parent = None
+    if kind == "wall":
+        boxes = getWallBoxes(getFootprint(obj))
+        # Sills and lintels built into the wall by mainWallOpenings
+        for piece in json.loads(obj.get("wall_openings", "[]")):
+            (cx, cy), (w, h), angle = cv2.minAreaRect(np.array(piece["corners"], dtype=np.float32))
+            boxes += [(np.array((cx, cy)), (w, h), radians(angle), tuple(span)) for span in piece["spans"]]
+    elif kind == "door":
+        (cx, cy), (w, h), angle = cv2.minAreaRect(world[:, :2].astype(np.float32))
+        boxes = [(np.array((cx, cy)), (w, h), radians(angle))]
+        parent = obj
+    else:
+        corners = getExtremePoints(obj)
+        alongX, alongY = corners[1] - corners[0], corners[2] - corners[1]
+        center = sum(corners, Vector()) / 4
+        boxes = [((center.x, center.y), (alongX.length, alongY.length), atan2(alongX.y, alongX.x))]
+        zRange = (zRange[0], zRange[0] + FURNITURE_COLLIDER_HEIGHT)
+
+    entries = []
+    for index, (center, size, angle, *span) in enumerate(boxes):
+        boxRange = span[0] if span else zRange
+        name = f"{COLLIDER_PREFIX}{obj.name}" + (f"_{index}" if len(boxes) > 1 else "")
+        proxy = createColliderProxy(name, center, size, angle, boxRange, parent)
+        proxy["collider_of"] = obj.name
+        for key in ("element_id", "cell_id"):
+            if key in obj:
+                proxy[key] = obj[key]
+        entry = {
+            "name": proxy.name,
+            "kind": kind,
+            "element": obj.name,
+            "center": [round(float(v), 4) for v in (center[0], center[1], sum(boxRange) / 2)],
+            "size": [round(float(v), 4) for v in proxy.scale],
+            "angle": round(degrees(angle), 3),
+        }
+        if "element_id" in obj:
+            entry["elementId"] = obj["element_id"]
+        if kind == "door":
+            entry["hinge"] = [round(float(v), 4) for v in obj.matrix_world.translation]
+        entries.append(entry)
+    return entries
+
+
+def mainColliders(outputBase):
+    """
+    Emits box collision proxies next to the render meshes: one box per straight
+    wall run, the oriented box of every furniture block (the one mainFurniture
+    computed with getExtremePoints) and a box on each door leaf, parented to
+    the door so it turns with its hinge. The proxies are listed in
+    <output>_colliders.json.
+    """
+    proxies = []
+    renderTriangles = 0
+    for kind, obj in getColliderElements():
+        renderTriangles += sum(len(p.vertices) - 2 for p in obj.data.polygons)
+        proxies += createElementColliders(kind, obj)
+
+    path = getSidecarPath(outputBase, "colliders")
+    digest = writeJsonAtomic(path, {"proxies": proxies, "meshColliderTriangles": renderTriangles})
+    emitEvent("output", path=path, sha256=digest, bytes=os.path.getsize(path))
+    print(f"Collision proxies: {len(proxies)} boxes replace mesh colliders with {renderTriangles} triangles.")
+    return proxies
+
+
+
+
+
+
+
+
+# ============================
+# FUNCTIONS FOR NAVIGATION
+# ============================
+
+NAVIGATION_NAME = "NAV_AREA"
+# Diameter a wheelchair needs to turn around
+TURNING_DIAMETER = 1.5
+
+
+def rasterizeFurniture(raster):
+    """ Oriented boxes of the furniture blocks drawn on a mask of the plan raster. """
+    mask = np.zeros(raster["labels"].shape, dtype=np.uint8)
+    for kind, obj in getColliderElements():
+        if kind == "furniture":
+            box = cv2.boxPoints(cv2.minAreaRect(getWorldVertexArray(obj)[:, :2].astype(np.float32)))
+            cv2.fillPoly(mask, [raster["toPixels"](box)], 1)
+    return mask > 0
+
+
+def createFlatMesh(outlines, z, name):
+    """ One mesh with the triangulated (outer, holes) outlines at height 'z', facing up. """
+    verts, faces = [], []
+    for outer, holes in outlines:
+        rings = [r for r in [outer] + holes if len(r) >= 3]
+        if not rings:
+            continue
+        triangles = tessellate_polygon([[Vector((x, y, 0.0)) for x, y in ring] for ring in rings])
+        points = np.vstack(rings)
+        start = len(verts)
+        verts += [(x, y, z) for x, y in points]
+        for a, b, c in triangles:
+            # Counter-clockwise, so every face points up
+            (ax, ay), (bx, by), (cx, cy) = points[a], points[b], points[c]
+            if (bx - ax) * (cy - ay) - (by - ay) * (cx - ax) < 0:
+                b, c = c, b
+            faces.append((start + a, start + b, start + c))
+    if not faces:
+        return None
+
+    mesh = bpy.data.meshes.new(name + "Mesh")
+    mesh.from_pydata(verts, [], faces)
+    mesh.update()
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.collection.objects.link(obj)
+    return obj
+
+
+def mainNavigation(outputBase, agentRadius=0.3, z=0.01):
+    """
+    Computes the walkable area: the rooms and door thresholds of the plan
+    raster minus the furniture boxes, shrunk by 'agentRadius' from every wall
+    and obstacle. It is triangulated into NAV_AREA (a navigation and teleport
+    surface for Unity) and <output>_navigation.json records the clearances:
+    the clear width of every door and, per room, the walkable area and the
+    largest circle that fits in it. Door widths and circles come from
+    measureDoorWidths and measureRoomCircles, the same as in the audit.
+    """
+    raster = buildPlanRaster()
+    if raster is None:
+        return None
+    resolution = raster["resolution"]
+    labels = raster["labels"]
+
+    # Everything inside the building but walls, windows and furniture (door thresholds included)
+    windows = np.zeros(labels.shape, dtype=np.uint8)
+    for opening in raster["openings"]:
+        if opening["kind"] != "door":
+            cv2.fillPoly(windows, [raster["toPixels"](opening["corners"])], 1)
+    free = (labels != 0) & (raster["walls"] == 0) & (windows == 0) & ~rasterizeFurniture(raster)
+    # Distance (m) from every free pixel to the closest wall, obstacle or exterior
+    clearance = cv2.distanceTransform(free.astype(np.uint8), cv2.DIST_L2, 5) * resolution
+    walkable = clearance > agentRadius
+    count, components = cv2.connectedComponents(walkable.astype(np.uint8), connectivity=8)
+
+    outlines = getRegionOutlines(raster, walkable, minArea=4 * resolution ** 2)
+    navObj = createFlatMesh(outlines, z, NAVIGATION_NAME)
+    if navObj is not None:
+        navObj["agent_radius"] = agentRadius
+
+    # Door widths and turning circles are measured like the accessibility audit does
+    obstacles = getAccessibilityObstacles()
+    index = buildSpatialIndex(obstacles["bounds"])
+    doors, _ = measureDoorWidths(index, obstacles, getDoorSwings())
+    doorReport = [{"element": door["element"], "width": door["width"], "clearWidth": door["clearWidth"],
+                   "passable": door["clearWidth"] > 2.0 * agentRadius} for door in doors]
+
+    _, circles = measureRoomCircles(index, obstacles, raster["cells"])
+    circles = {room["id"]: room["maxCircle"] for room in circles}
+    roomReport = []
+    for cell in raster["cells"]:
+        inside = labels == cell["id"]
+        reachable = components[inside & walkable]
+        maxCircle = circles.get(cell["id"], 0.0)
+        roomReport.append({
+            "id": cell["id"],
+            "area": cell["area"],
+            "walkableArea": round(float(np.count_nonzero(inside & walkable)) * resolution ** 2, 3),
+            "maxCircle": maxCircle,
+            "turningCircle": maxCircle >= TURNING_DIAMETER,
+            "component": int(np.bincount(reachable).argmax()) if reachable.size else 0,
+        })
+
+    report = {
+        "agentRadius": agentRadius,
+        "resolution": resolution,
+        "walkableArea": round(float(np.count_nonzero(walkable)) * resolution ** 2, 3),
+        "components": count - 1,
+        "triangles": len(navObj.data.polygons) if navObj else 0,
+        "doors": doorReport,
+        "rooms": roomReport,
+    }
+    path = getSidecarPath(outputBase, "navigation")
+    digest = writeJsonAtomic(path, report)
+    emitEvent("output", path=path, sha256=digest, bytes=os.path.getsize(path))
+    blocked = sum(not d["passable"] for d in doorReport)
+    print(f"Navigation: {report['walkableArea']} m2 walkable in {count - 1} areas, "
+          f"{report['triangles']} triangles, {blocked} of {len(doorReport)} doors too narrow "
+          f"for an agent radius of {agentRadius} m.")
+    return report
+
+
+
+
+
+
+
+
+# ============================
+# SPATIAL INDEX
+# ============================
+
+# Boxes per node of the packed R-tree
+RTREE_CAPACITY = 16
+
+
+def sortTileRecursive(boxes, capacity):
+    """ Sort-Tile-Recursive order of (N, 4) boxes: vertical slices by x, each sorted by y. """
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2.0
+    slices = int(np.ceil(np.sqrt(np.ceil(len(boxes) / capacity))))
+    sliceSize = slices * capacity
+    byX = np.argsort(centers[:, 0], kind="stable")
+    return np.concatenate([part[np.argsort(centers[part, 1], kind="stable")]
+                           for part in np.split(byX, np.arange(sliceSize, len(boxes), sliceSize))])
+
+
+def buildSpatialIndex(boxes, capacity=RTREE_CAPACITY):
+    """
+    Packs (N, 4) boxes (xmin, ymin, xmax, ymax) into a static R-tree. Items
+    and nodes are stored in Sort-Tile-Recursive order, so every node is a
+    contiguous range ('start', 'count') of the level below; 'levels' go from
+    the parents of the items up to the single root node. Boxes are kept as
+    (4, N) rows, so the queries work on contiguous coordinate arrays.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    order = sortTileRecursive(boxes, capacity) if len(boxes) else np.zeros(0, dtype=np.int64)
+    index = {"items": order, "boxes": np.ascontiguousarray(boxes[order].T), "levels": []}
+    current = boxes[order]
+    while len(current):
+        starts = np.arange(0, len(current), capacity)
+        nodeBoxes = np.column_stack([
+            np.minimum.reduceat(current[:, 0], starts), np.minimum.reduceat(current[:, 1], starts),
+            np.maximum.reduceat(current[:, 2], starts), np.maximum.reduceat(current[:, 3], starts),
+        ])
+        nodeOrder = sortTileRecursive(nodeBoxes, capacity)
+        index["levels"].append({
+            "boxes": np.ascontiguousarray(nodeBoxes[nodeOrder].T),
+            "start": starts[nodeOrder],
+            "count": np.minimum(capacity, len(current) - starts)[nodeOrder],
+        })
+        if len(nodeBoxes) == 1:
+            break
+        current = nodeBoxes[nodeOrder]
+    return index
+
+
+def expandRanges(start, count):
+    """ Concatenated aranges [start, start + count) of every row. """
+    offsets = np.repeat(np.cumsum(count) - count, count)
+    return np.arange(int(count.sum())) - offsets + np.repeat(start, count)
+
+
+def getBoxDistanceBounds(px, py, boxes):
+    """
+    Squared MINDIST and MINMAXDIST of (probe, box) pairs, for probe
+    coordinates 'px', 'py' and (4, N) boxes, one pair per column. No item of
+    a box is closer than its MINDIST, and as every side of a box touches one
+    of its items, some item lies within its MINMAXDIST (nearest side on one
+    axis, farthest on the other).
+    """
+    x0, y0, x1, y1 = boxes
+    dx = np.maximum(np.maximum(x0 - px, px - x1), 0.0)
+    dy = np.maximum(np.maximum(y0 - py, py - y1), 0.0)
+    ax0, ax1, ay0, ay1 = np.abs(px - x0), np.abs(px - x1), np.abs(py - y0), np.abs(py - y1)
+    nearX, farX = np.minimum(ax0, ax1), np.maximum(ax0, ax1)
+    nearY, farY = np.minimum(ay0, ay1), np.maximum(ay0, ay1)
+    minMax = np.minimum(nearX * nearX + farY * farY, farX * farX + nearY * nearY)
+    return dx * dx + dy * dy, minMax
+
+
+def queryNearest(index, points, distance, bound=None):
+    """
+    Nearest item of every point, all points at once: the tree is walked level
+    by level on flat (probe, node) pairs, pruned by box distances, and
+    'distance(probes, items)' gives the exact distance of the remaining
+    pairs. 'bound' is an optional upper bound of the distance of every
+    point. Returns the distances (inf without items) and the item indices (-1).
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    best = np.full(len(points), np.inf)
+    nearest = np.full(len(points), -1, dtype=np.int64)
+    if not index["levels"] or not len(points):
+        return best, nearest
+
+    xs, ys = np.ascontiguousarray(points.T)
+    bound = np.full(len(points), np.inf) if bound is None else np.square(bound) + 1e-12
+    probes = np.arange(len(points))
+    nodes = np.zeros(len(points), dtype=np.int64)
+    levels = [(level["boxes"], level["start"], level["count"]) for level in reversed(index["levels"])]
+    for boxes, start, count in levels + [(index["boxes"], None, None)]:
+        minDist, minMax = getBoxDistanceBounds(np.take(xs, probes), np.take(ys, probes), np.take(boxes, nodes, axis=1))
+        # Boxes farther than the closest MINMAXDIST of the probe are dropped; pairs stay sorted by probe
+        runs = np.flatnonzero(np.diff(probes, prepend=-1))
+        bound[probes[runs]] = np.minimum(bound[probes[runs]], np.minimum.reduceat(minMax, runs))
+        keep = minDist <= np.take(bound, probes)
+        probes, nodes = probes[keep], nodes[keep]
+        if start is not None:
+            counts = count[nodes]
+            nodes = expandRanges(start[nodes], counts)
+            probes = np.repeat(probes, counts)
+    items = index["items"][nodes]
+
+    distances = distance(probes, items)
+    order = np.lexsort((distances, probes))
+    probes, first = np.unique(probes[order], return_index=True)
+    best[probes] = distances[order][first]
+    nearest[probes] = items[order][first]
+    return best, nearest
+
+
+def queryOverlaps(index, boxes):
+    """ (query, item) index pairs of the (N, 4) query boxes and the items whose boxes overlap them. """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if not index["levels"] or not len(boxes):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    queries = np.arange(len(boxes))
+    nodes = np.zeros(len(boxes), dtype=np.int64)
+    levels = [(level["boxes"], level["start"], level["count"]) for level in reversed(index["levels"])]
+    for nodeBoxes, start, count in levels + [(index["boxes"], None, None)]:
+        q = boxes[queries].T
+        x0, y0, x1, y1 = np.take(nodeBoxes, nodes, axis=1)
+        keep = (q[0] <= x1) & (x0 <= q[2]) & (q[1] <= y1) & (y0 <= q[3])
+        queries, nodes = queries[keep], nodes[keep]
+        if start is not None:
+            counts = count[nodes]
+            nodes = expandRanges(start[nodes], counts)
+            queries = np.repeat(queries, counts)
+    return queries, index["items"][nodes]
+
+
+
+
+
+
+
+
+# ============================
+# FUNCTIONS FOR ACCESSIBILITY
+# ============================
+
+# Spacing (m) of the clearance probes of the heatmap and along door thresholds
+PROBE_STEP = 0.1
+THRESHOLD_STEP = 0.01
+# Cell size (m) of the coarse grid whose clearance bounds the nearest obstacle queries
+SEED_SIZE = 0.8
+# Clear width a door needs, and a passage next to furniture (m)
+DOOR_CLEAR_WIDTH = 0.80
+PASSAGE_WIDTH = 0.90
+# Narrower gaps (furniture pushed together or against a wall) are not passages
+MIN_PASSAGE_GAP = 0.25
+# Obstacle kinds of the audit index; door leaves are left out, they can be closed
+OBSTACLE_KINDS = ("wall", "window", "furniture")
+
+
+def getRectangleBox(corners):
+    """ Center, unit axis and half sizes of a rectangle given by its 4 corners in order. """
+    corners = np.asarray(corners, dtype=np.float64)
+    sideA, sideB = corners[1] - corners[0], corners[2] - corners[1]
+    lengthA, lengthB = np.linalg.norm(sideA), np.linalg.norm(sideB)
+    return corners.mean(axis=0), sideA / max(lengthA, 1e-9), (lengthA / 2.0, lengthB / 2.0)
+
+
+def getAccessibilityObstacles():
+    """
+    Every wall face (one zero-width box per footprint edge), window opening
+    and furniture block of the plan as an oriented box: arrays 'center',
+    'axis' (unit, along the first half size), 'half' and 'kind' (index into
+    OBSTACLE_KINDS), 'elements' with the object of each box and their
+    axis-aligned 'bounds'.
+    """
+    centers, axes, halves, kinds, elements = [], [], [], [], []
+    for wall in getWallObjects():
+        footprint = getFootprint(wall)
+        chains = [ring + ring[:1] for ring in footprint["closed"] if len(ring) >= 2] + footprint["open"]
+        for chain in chains:
+            points = np.asarray(chain, dtype=np.float64).reshape(-1, 2)
+            sides = points[1:] - points[:-1]
+            lengths = np.linalg.norm(sides, axis=1)
+            valid = lengths > 1e-6
+            centers.append((points[:-1] + points[1:])[valid] / 2.0)
+            axes.append(sides[valid] / lengths[valid, None])
+            halves.append(np.column_stack([lengths[valid] / 2.0, np.zeros(np.count_nonzero(valid))]))
+            kinds += [0] * int(np.count_nonzero(valid))
+            elements += [wall.name] * int(np.count_nonzero(valid))
+
+    rectangles = [(1, o["element"], o["corners"]) for o in collectOpenings() if o["kind"] == "window"]
+    for kind, obj in getColliderElements():
+        if kind == "furniture":
+            rect = cv2.minAreaRect(np.ascontiguousarray(getWorldVertexArray(obj)[:, :2]))
+            rectangles.append((2, obj.name, cv2.boxPoints(rect)))
+    for kind, element, corners in rectangles:
+        center, axis, half = getRectangleBox(corners)
+        centers.append(center[None])
+        axes.append(axis[None])
+        halves.append(np.array([half]))
+        kinds.append(kind)
+        elements.append(element)
+
+    obstacles = {
+        "center": np.vstack(centers) if centers else np.zeros((0, 2)),
+        "axis": np.vstack(axes) if axes else np.zeros((0, 2)),
+        "half": np.vstack(halves) if halves else np.zeros((0, 2)),
+        "kind": np.array(kinds, dtype=np.int8),
+        "elements": elements,
+    }
+    ax, ay = np.abs(obstacles["axis"]).T
+    hx, hy = obstacles["half"].T
+    extent = np.column_stack([ax * hx + ay * hy, ay * hx + ax * hy])
+    obstacles["bounds"] = np.hstack([obstacles["center"] - extent, obstacles["center"] + extent])
+    return obstacles
+
+
+def closestPointOnBoxes(points, obstacles, items):
+    """ Closest point of each box 'items' to the matching point (the point itself when inside). """
+    center, axis, half = obstacles["center"][items], obstacles["axis"][items], obstacles["half"][items]
+    normal = np.column_stack([-axis[:, 1], axis[:, 0]])
+    local = points - center
+    u = np.clip(np.einsum("ij,ij->i", local, axis), -half[:, 0], half[:, 0])
+    v = np.clip(np.einsum("ij,ij->i", local, normal), -half[:, 1], half[:, 1])
+    return center + axis * u[:, None] + normal * v[:, None]
+
+
+def getBoxDistance(obstacles, points):
+    """ Distance function of queryNearest between the points and the obstacle boxes, on coordinate arrays. """
+    px, py = np.ascontiguousarray(points.T)
+    cx, cy = np.ascontiguousarray(obstacles["center"].T)
+    ax, ay = np.ascontiguousarray(obstacles["axis"].T)
+    hx, hy = np.ascontiguousarray(obstacles["half"].T)
+
+    def distance(probes, items):
+        dx, dy = np.take(px, probes) - np.take(cx, items), np.take(py, probes) - np.take(cy, items)
+        axisX, axisY = np.take(ax, items), np.take(ay, items)
+        u = np.maximum(np.abs(dx * axisX + dy * axisY) - np.take(hx, items), 0.0)
+        v = np.maximum(np.abs(dy * axisX - dx * axisY) - np.take(hy, items), 0.0)
+        return np.sqrt(u * u + v * v)
+    return distance
+
+
+def getClearance(index, obstacles, points, seedSize=SEED_SIZE):
+    """
+    Distance from every point to the closest obstacle of the index (0 inside
+    one). The clearance of the centers of a coarse grid is found first: it
+    changes by at most the distance moved, so it bounds the clearance of the
+    points around them and most of the tree is pruned at the root.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if not len(points):
+        return np.zeros(0)
+    cells = np.floor((points - points.min(axis=0)) / seedSize).astype(np.int64)
+    keys, inverse = np.unique(cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1], return_inverse=True)
+    seeds = points.min(axis=0) + (np.column_stack(np.divmod(keys, cells[:, 1].max() + 1)) + 0.5) * seedSize
+    seedClearance = queryNearest(index, seeds, getBoxDistance(obstacles, seeds))[0]
+    bound = seedClearance[inverse] + np.linalg.norm(points - seeds[inverse], axis=1)
+    return queryNearest(index, points, getBoxDistance(obstacles, points), bound)[0]
+
+
+def getBoxCorners(obstacles, items):
+    """ (N, 4, 2) corners of the boxes 'items', in order around each box. """
+    axis = obstacles["axis"][items]
+    normal = np.column_stack([-axis[:, 1], axis[:, 0]])
+    half = obstacles["half"][items]
+    signs = np.array([(-1, -1), (1, -1), (1, 1), (-1, 1)], dtype=np.float64)
+    return (obstacles["center"][items][:, None]
+            + signs[None, :, :1] * (axis * half[:, :1])[:, None]
+            + signs[None, :, 1:] * (normal * half[:, 1:])[:, None])
+
+
+def segmentsCross(a0, a1, b0, b1):
+    """ Whether the segments a0-a1 and b0-b1 (broadcast arrays of points) properly cross. """
+    def side(p, q, r):
+        (px, py), (qx, qy), (rx, ry) = np.moveaxis(p, -1, 0), np.moveaxis(q, -1, 0), np.moveaxis(r, -1, 0)
+        return np.sign((qx - px) * (ry - py) - (qy - py) * (rx - px))
+    return (side(a0, a1, b0) * side(a0, a1, b1) < 0) & (side(b0, b1, a0) * side(b0, b1, a1) < 0)
+
+
+def measureBoxGaps(obstacles, first, second):
+    """
+    Gap between the boxes of every (first, second) pair, the middle of the
+    gap and the unit direction across it. The closest points of two disjoint
+    convex polygons include a corner of one of them; crossing edges mean they
+    overlap (gap 0).
+    """
+    cornersA, cornersB = getBoxCorners(obstacles, first), getBoxCorners(obstacles, second)
+    pairs = len(first)
+    candidates = []
+    for corners, other in ((cornersA, second), (cornersB, first)):
+        points = corners.reshape(-1, 2)
+        closest = closestPointOnBoxes(points, obstacles, np.repeat(other, 4))
+        candidates.append((np.linalg.norm(points - closest, axis=1).reshape(pairs, 4),
+                           ((points + closest) / 2.0).reshape(pairs, 4, 2),
+                           (closest - points).reshape(pairs, 4, 2)))
+    gaps = np.hstack([c[0] for c in candidates])
+    best = gaps.argmin(axis=1)
+    gap = gaps[np.arange(pairs), best]
+    middle = np.concatenate([c[1] for c in candidates], axis=1)[np.arange(pairs), best]
+    across = np.concatenate([c[2] for c in candidates], axis=1)[np.arange(pairs), best]
+    across /= np.maximum(np.linalg.norm(across, axis=1), 1e-9)[:, None]
+
+    edgesA = cornersA[:, :, None], np.roll(cornersA, -1, axis=1)[:, :, None]
+    edgesB = cornersB[:, None], np.roll(cornersB, -1, axis=1)[:, None]
+    crossing = segmentsCross(edgesA[0], edgesA[1], edgesB[0], edgesB[1]).any(axis=(1, 2))
+    gap[crossing] = 0.0
+    return gap, middle, across
+
+
+def getDoorSwings():
+    """
+    Door leaves with their opening, leaf thickness and swing: the quarter
+    circle around the hinge, as long as the leaf, centered on the angle of
+    computeDoorAngle (the bisector of the open leaf and the closed one).
+    """
+    swings = []
+    for opening in collectOpenings():
+        door = bpy.data.objects.get(opening["element"])
+        if opening["kind"] != "door" or door is None or not door.data.vertices:
+            continue
+        (_, _), (w, h), _ = cv2.minAreaRect(np.ascontiguousarray(getWorldVertexArray(door)[:, :2]))
+        hinge = np.array(door.matrix_world.translation, dtype=np.float64)[:2]
+        radius = float(max(w, h))
+        angles = np.radians(computeDoorAngle(door)) + np.linspace(-np.pi / 4, np.pi / 4, 9)
+        sector = np.vstack([hinge, hinge + radius * np.column_stack([np.cos(angles), np.sin(angles)])])
+        swings.append({
+            "element": door.name,
+            "corners": opening["corners"],
+            "thickness": float(min(w, h)),
+            "sector": sector,
+            "bounds": np.concatenate([sector.min(axis=0), sector.max(axis=0)]),
+        })
+    return swings
+
+
+def loadRoomCells(outputBase):
+    """ Room polygons of <output>_cells.json, written by the rooms stage; the plan raster is rebuilt without it. """
+    path = getSidecarPath(outputBase, "cells")
+    if os.path.isfile(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["cells"]
+    raster = buildPlanRaster()
+    return raster["cells"] if raster is not None else []
+
+
+def pointsInPolygon(points, polygon):
+    """ Even-odd test of (N, 2) points against a (M, 2) polygon, every edge at once. """
+    x, y = points[:, :1], points[:, 1:]
+    x0, y0 = polygon[:, 0], polygon[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crosses = ((y0 > y) != (y1 > y)) & (x < (x1 - x0) * (y - y0) / (y1 - y0) + x0)
+    return np.count_nonzero(crosses, axis=1) % 2 == 1
+
+
+def getRoomProbes(cells, step):
+    """ Grid of probes ('step' apart) over the rooms: origin, (rows, cols), points and room id of each (0 outside). """
+    polygons = [np.asarray(c["polygon"], dtype=np.float64).reshape(-1, 2) for c in cells]
+    if not polygons:
+        return np.zeros(2), (0, 0), np.zeros((0, 2)), np.zeros(0, dtype=np.int32)
+    allPoints = np.vstack(polygons)
+    origin = np.floor(allPoints.min(axis=0) / step) * step
+    cols, rows = (int(n) + 1 for n in np.ceil((allPoints.max(axis=0) - origin) / step))
+    xs, ys = np.meshgrid(origin[0] + step * np.arange(cols), origin[1] + step * np.arange(rows))
+    points = np.column_stack([xs.ravel(), ys.ravel()])
+
+    rooms = np.zeros(len(points), dtype=np.int32)
+    for cell, polygon in zip(cells, polygons):
+        low, high = polygon.min(axis=0), polygon.max(axis=0)
+        candidates = np.flatnonzero((rooms == 0) & (points >= low).all(axis=1) & (points <= high).all(axis=1))
+        rooms[candidates[pointsInPolygon(points[candidates], polygon)]] = cell["id"]
+    return origin, (rows, cols), points, rooms
+
+
+def lookupProbes(origin, shape, step, points):
+    """ Flat index of the grid probe closest to every point, -1 outside the grid. """
+    cols, rows = np.round((np.asarray(points).reshape(-1, 2) - origin) / step).astype(int).T
+    inside = (rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])
+    return np.where(inside, rows * shape[1] + cols, -1)
+
+
+def getLongestRun(free):
+    """ Length of the longest run of True values. """
+    edges = np.diff(np.concatenate([[0], free.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    return int((ends - starts).max()) if len(starts) else 0
+
+
+def writeHeatmapImage(path, clearance, maxClearance):
+    """ Clearance heatmap as a PNG, north up: blue where a turning circle fits, red at obstacles, black outside. """
+    scaled = np.clip(clearance / maxClearance, 0.0, 1.0)
+    image = cv2.applyColorMap(((1.0 - scaled) * 255).astype(np.uint8), cv2.COLORMAP_JET)
+    image[clearance < 0] = 0
+    ok, data = cv2.imencode(".png", image[::-1])
+    if not ok:
+        return None
+    tmp = getTempPath(path)
+    with open(tmp, "wb") as f:
+        f.write(data.tobytes())
+    os.replace(tmp, path)
+    emitEvent("output", path=path, sha256=hashlib.sha256(data.tobytes()).hexdigest(), bytes=len(data))
+    return os.path.basename(path)
+
+
+def findNarrowPassages(index, obstacles, heatmap, passageWidth):
+    """
+    Passage violations: gaps between a furniture block and the obstacles
+    around it (found on the index) that are narrower than 'passageWidth' but
+    still wide enough to be walked into, inside a room and open at both ends
+    on the clearance 'heatmap' (origin, shape, step, clearance).
+    """
+    origin, shape, step, clearance = heatmap
+    furniture = np.flatnonzero(obstacles["kind"] == OBSTACLE_KINDS.index("furniture"))
+    if not clearance.size or not len(furniture):
+        return []
+    queries, items = queryOverlaps(index, obstacles["bounds"][furniture] + np.array([-1, -1, 1, 1]) * passageWidth)
+    first = furniture[queries]
+    keep = (items != first) & ((obstacles["kind"][items] != obstacles["kind"][first]) | (items > first))
+    first, items = first[keep], items[keep]
+    gaps, middles, across = measureBoxGaps(obstacles, first, items)
+
+    # Open at both ends: the heatmap half a passage away on either side is in a room and no narrower
+    along = np.column_stack([-across[:, 1], across[:, 0]]) * passageWidth / 2.0
+    through = (gaps >= MIN_PASSAGE_GAP) & (gaps < passageWidth)
+    for side in (-1.0, 1.0):
+        end = lookupProbes(origin, shape, step, middles + side * along)
+        through &= (end >= 0) & (clearance[np.maximum(end, 0)] >= gaps / 2.0 - step)
+    narrow = {}
+    for a, b, gap, middle in zip(first[through], items[through], gaps[through], middles[through]):
+        key = (obstacles["elements"][a], obstacles["elements"][b])
+        if key not in narrow or gap < narrow[key][0]:
+            narrow[key] = (float(gap), middle)
+    # Any contact between the same two elements closes the gap
+    contacts = {(obstacles["elements"][a], obstacles["elements"][b])
+                for a, b, gap in zip(first, items, gaps) if gap < MIN_PASSAGE_GAP}
+
+    # Narrowest first; the same spot seen from a neighbouring piece of furniture is reported once
+    violations, centers = [], []
+    for key, (gap, middle) in sorted(narrow.items(), key=lambda item: item[1][0]):
+        if key in contacts or any(np.linalg.norm(middle - c) < passageWidth / 2.0 for c in centers):
+            continue
+        centers.append(middle)
+        violations.append({"type": "passage", "elements": list(key), "value": round(gap, 3),
+                           "required": passageWidth, "center": [round(float(c), 3) for c in middle]})
+    return violations
+
+
+def measureRoomCircles(index, obstacles, cells, probeStep=PROBE_STEP):
+    """
+    Clearance of a probe grid over the rooms, as (origin, shape, clearance
+    per probe, -1 outside the rooms), and the largest circle of every room:
+    {"id", "maxCircle", "center"}. Shared by the navigation report and the
+    audit, so both give the same turning circles.
+    """
+    origin, shape, points, rooms = getRoomProbes(cells, probeStep)
+    clearance = np.full(len(rooms), -1.0)
+    clearance[rooms > 0] = getClearance(index, obstacles, points[rooms > 0])
+    circles = []
+    for cell in cells:
+        inside = np.flatnonzero(rooms == cell["id"])
+        if not len(inside):
+            continue
+        best = inside[clearance[inside].argmax()]
+        center = origin + probeStep * np.array(np.unravel_index(best, shape)[::-1])
+        circles.append({"id": cell["id"], "maxCircle": round(2.0 * float(clearance[best]), 3),
+                        "center": [round(float(c), 3) for c in center]})
+    return (origin, shape, clearance), circles
+
+
+def getThresholdLine(swing):
+    """ Center, width and probes (THRESHOLD_STEP apart) of the line through the middle of a door threshold. """
+    center, axis, half = getRectangleBox(swing["corners"])
+    along = axis if half[0] >= half[1] else np.array([-axis[1], axis[0]])
+    width = 2.0 * float(max(half))
+    steps = np.linspace(-width / 2.0, width / 2.0, max(2, int(np.ceil(width / THRESHOLD_STEP)) + 1))
+    return center, width, center + np.outer(steps, along)
+
+
+def measureDoorWidths(index, obstacles, swings):
+    """
+    Free width along the threshold of every door, minus the leaf standing open
+    in it: {"element", "center", "width", "clearWidth"} per door, and the
+    number of probes. Shared by the navigation report and the audit, so both
+    judge a door the same way.
+    """
+    lines = [getThresholdLine(swing) for swing in swings]
+    points = np.vstack([line for _, _, line in lines]) if lines else np.zeros((0, 2))
+    thresholdClearance = getClearance(index, obstacles, points)
+    doors = []
+    offset = 0
+    for swing, (center, width, line) in zip(swings, lines):
+        free = thresholdClearance[offset:offset + len(line)] > THRESHOLD_STEP / 2.0
+        offset += len(line)
+        clearWidth = max(0.0, getLongestRun(free) * width / (len(line) - 1) - swing["thickness"])
+        doors.append({"element": swing["element"], "center": [round(float(c), 3) for c in center],
+                      "width": round(width, 3), "clearWidth": round(clearWidth, 3)})
+    return doors, len(points)
+
+
+def mainAccessibility(outputBase, probeStep=PROBE_STEP, turningDiameter=TURNING_DIAMETER,
+                      doorClearWidth=DOOR_CLEAR_WIDTH, passageWidth=PASSAGE_WIDTH):
+    """
+    Accessibility audit of the plan. Walls, windows and furniture go into one
+    R-tree, and every check is a batch query on it: the clearance of a probe
+    grid over the rooms (a heatmap, and the largest turning circle of each
+    room), the free width along every door threshold, the furniture inside
+    every door swing and the gaps between furniture and the closest obstacles.
+    <output>_accessibility.json lists the violations and the heatmap,
+    <output>_accessibility.png draws it.
+    """
+    start = time.perf_counter()
+    obstacles = getAccessibilityObstacles()
+    index = buildSpatialIndex(obstacles["bounds"])
+    cells = loadRoomCells(outputBase)
+
+    # Clearance heatmap and turning circles
+    (origin, shape, clearance), roomCircles = measureRoomCircles(index, obstacles, cells, probeStep)
+    violations = []
+    roomReport = []
+    for room in roomCircles:
+        roomReport.append(dict(room, turningCircle=room["maxCircle"] >= turningDiameter))
+        if room["maxCircle"] < turningDiameter:
+            violations.append({"type": "turningCircle", "room": room["id"], "elements": [],
+                               "value": room["maxCircle"], "required": turningDiameter, "center": room["center"]})
+
+    # Free width along the threshold of every door
+    swings = getDoorSwings()
+    widths, thresholdProbes = measureDoorWidths(index, obstacles, swings)
+    doorReport = []
+    for door in widths:
+        doorReport.append({"element": door["element"], "width": door["width"],
+                           "clearWidth": door["clearWidth"], "swingBlockedBy": []})
+        if door["clearWidth"] < doorClearWidth:
+            violations.append({"type": "doorWidth", "elements": [door["element"]], "value": door["clearWidth"],
+                               "required": doorClearWidth, "center": door["center"]})
+
+    # Furniture inside the door swings
+    doors, items = queryOverlaps(index, np.array([s["bounds"] for s in swings]).reshape(-1, 4))
+    furniture = obstacles["kind"][items] == OBSTACLE_KINDS.index("furniture")
+    corners = getBoxCorners(obstacles, items[furniture]).astype(np.float32)
+    for door, item, box in zip(doors[furniture], items[furniture], corners):
+        area, _ = cv2.intersectConvexConvex(swings[door]["sector"].astype(np.float32), box)
+        if area > 1e-4:
+            doorReport[door]["swingBlockedBy"].append(obstacles["elements"][item])
+    for swing, door in zip(swings, doorReport):
+        if door["swingBlockedBy"]:
+            violations.append({"type": "doorSwing", "elements": [door["element"]] + door["swingBlockedBy"],
+                               "value": len(door["swingBlockedBy"]), "required": 0,
+                               "center": [round(float(c), 3) for c in swing["sector"][0]]})
+
+    violations += findNarrowPassages(index, obstacles, (origin, shape, probeStep, clearance), passageWidth)
+
+    seconds = time.perf_counter() - start
+    imageName = writeHeatmapImage(f"{outputBase}_accessibility.png", clearance.reshape(shape),
+                                  turningDiameter / 2.0) if clearance.size else None
+    report = {
+        "rules": {"turningDiameter": turningDiameter, "doorClearWidth": doorClearWidth,
+                  "passageWidth": passageWidth, "minPassageGap": MIN_PASSAGE_GAP},
+        "obstacles": {kind: int(np.count_nonzero(obstacles["kind"] == i)) for i, kind in enumerate(OBSTACLE_KINDS)},
+        "indexLevels": len(index["levels"]),
+        "probes": int(np.count_nonzero(clearance >= 0)) + thresholdProbes,
+        "seconds": round(seconds, 4),
+        "violations": violations,
+        "rooms": roomReport,
+        "doors": doorReport,
+        # values[row * cols + col]: clearance (cm) at origin + (col, row) * step, -1 outside the rooms
+        "heatmap": {
+            "image": imageName,
+            "origin": [round(float(c), 4) for c in origin],
+            "step": probeStep,
+            "shape": list(shape),
+            "values": np.where(clearance < 0, -1, np.round(clearance * 100.0)).astype(int).tolist(),
+        },
+    }
+    path = getSidecarPath(outputBase, "accessibility")
+    digest = writeJsonAtomic(path, report)
+    emitEvent("output", path=path, sha256=digest, bytes=os.path.getsize(path))
+    print(f"Accessibility: {report['probes']} probes against {len(obstacles['kind'])} obstacles, "
+          f"{len(violations)} violations in {seconds * 1000:.1f} ms.")
+    return report
+
+
+
+
+
+
+
+
+# ============================
+# FUNCTIONS FOR LIGHTMAP UVS
+# ============================
+
+# Geometry that never moves: walls, slabs, door frames and window solids
+LIGHTMAP_PREFIXES = ("00_A_MUROS", "FLOOR_", "00_A_PUERTAS", "PRISMA_")
+LIGHTMAP_UV_NAME = "UVMap_Lightmap"
+
+
+def getStaticObjects():
+    return [o for o in getPlanObjects()
+            if o.type == 'MESH' and o.data.polygons and o.name.startswith(LIGHTMAP_PREFIXES)]
+
+
+def gatherMeshBatch(objects):
+    """
+    Reads every object with foreach_get into one set of arrays: world vertex
+    positions, loop vertices (global indices), loops per face, face normals
+    (world) and the object of every face.
+    """
+    coords, loops, totals, normals, faceObjects = [], [], [], [], []
+    vertexOffset = 0
+    for index, obj in enumerate(objects):
+        mesh = obj.data
+        coords.append(getWorldVertexArray(obj))
+        objLoops, objTotals = getTopologyArrays(mesh)
+        loops.append(objLoops + vertexOffset)
+        totals.append(objTotals)
+        objNormals = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+        mesh.polygons.foreach_get("normal", objNormals)
+        normalMatrix = np.array(obj.matrix_world.to_3x3().inverted_safe().transposed(), dtype=np.float64)
+        objNormals = objNormals.reshape(-1, 3).astype(np.float64) @ normalMatrix.T
+        normals.append(objNormals / np.maximum(np.linalg.norm(objNormals, axis=1, keepdims=True), 1e-12))
+        faceObjects.append(np.full(len(objTotals), index, dtype=np.int32))
+        vertexOffset += len(mesh.vertices)
+    return {
+        "coords": np.vstack(coords),
+        "loops": np.concatenate(loops),
+        "totals": np.concatenate(totals),
+        "normals": np.vstack(normals),
+        "faceObjects": np.concatenate(faceObjects),
+    }
+
+
+def findCharts(batch, angleQuantum=1e-3, distanceQuantum=1e-3):
+    """
+    Splits the faces into charts: connected faces of one object lying on the
+    same plane. Returns the chart of every face and the plane group of every
+    chart (normal shared by its faces).
+    """
+    coords, loops, totals, normals = batch["coords"], batch["loops"], batch["totals"], batch["normals"]
+    faceCount = len(totals)
+    loopFaces = np.repeat(np.arange(faceCount), totals)
+    firstLoop = np.concatenate(([0], np.cumsum(totals)[:-1]))
+    localIndex = np.arange(len(loops)) - firstLoop[loopFaces]
+    nextLoops = firstLoop[loopFaces] + (localIndex + 1) % totals[loopFaces]
+
+    # Plane of every face: object, quantized normal and distance to the origin
+    anchor = coords[loops[firstLoop]]
+    distance = np.einsum("ij,ij->i", normals, anchor)
+    planeKeys = np.column_stack((batch["faceObjects"],
+                                 np.round(normals / angleQuantum).astype(np.int64),
+                                 np.round(distance / distanceQuantum).astype(np.int64)))
+    _, planeOfFace = np.unique(planeKeys, axis=0, return_inverse=True)
+    planeOfFace = planeOfFace.ravel()
+
+    # Faces of the same plane sharing an edge belong to the same chart
+    a, b = loops, loops[nextLoops]
+    edgeKeys = np.column_stack((planeOfFace[loopFaces], np.minimum(a, b), np.maximum(a, b)))
+    _, edgeIds = np.unique(edgeKeys, axis=0, return_inverse=True)
+    order = np.argsort(edgeIds.ravel(), kind="stable")
+    sortedEdges = edgeIds.ravel()[order]
+    shared = np.nonzero(sortedEdges[1:] == sortedEdges[:-1])[0]
+    faceA, faceB = loopFaces[order[shared]], loopFaces[order[shared + 1]]
+
+    labels = np.arange(faceCount)
+    while True:
+        merged = labels.copy()
+        np.minimum.at(merged, faceA, labels[faceB])
+        np.minimum.at(merged, faceB, labels[faceA])
+        merged = merged[merged]
+        if np.array_equal(merged, labels):
+            break
+        labels = merged
+    _, chartOfFace = np.unique(labels, return_inverse=True)
+    return chartOfFace.ravel(), loopFaces
+
+
+def projectCharts(batch, chartOfFace, loopFaces):
+    """
+    Flattens every chart onto its plane: U runs horizontally along walls (or
+    along X on slabs), V follows the slope. Returns the per-loop coordinates
+    in meters and the bounds of every chart.
+    """
+    normals = batch["normals"]
+    up = np.array((0.0, 0.0, 1.0))
+    tangents = np.cross(up, normals)
+    flat = np.linalg.norm(tangents, axis=1) < 1e-3
+    tangents[flat] = (1.0, 0.0, 0.0)
+    tangents /= np.linalg.norm(tangents, axis=1, keepdims=True)
+    bitangents = np.cross(normals, tangents)
+
+    points = batch["coords"][batch["loops"]]
+    uv = np.column_stack((np.einsum("ij,ij->i", points, tangents[loopFaces]),
+                          np.einsum("ij,ij->i", points, bitangents[loopFaces])))
+
+    chartCount = chartOfFace.max() + 1
+    loopCharts = chartOfFace[loopFaces]
+    low = np.full((chartCount, 2), np.inf)
+    high = np.full((chartCount, 2), -np.inf)
+    np.minimum.at(low, loopCharts, uv)
+    np.maximum.at(high, loopCharts, uv)
+    return uv, low, high
+
+
+def placeOnShelves(shelves, top, sizes, atlasSize):
+    """
+    Shelf packing of 'sizes' (w, h) in texels. Returns the positions and the
+    new shelves/top, or None if something does not fit.
+    """
+    shelves = [list(shelf) for shelf in shelves]
+    positions = {}
+    for index in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        w, h = sizes[index]
+        for shelf in shelves:
+            y, height, x = shelf
+            if h <= height and x + w <= atlasSize:
+                positions[index] = (x, y)
+                shelf[2] += w
+                break
+        else:
+            if top + h > atlasSize or w > atlasSize:
+                return None
+            shelves.append([top, h, w])
+            positions[index] = (0, top)
+            top += h
+    return [positions[i] for i in range(len(sizes))], shelves, top
+
+
+def packObjectCharts(chartSizes, atlasSize):
+    """
+    Packs the charts object by object (all charts of an object go to the same
+    atlas, so each renderer needs a single lightmap). Objects too large for an
+    empty atlas are scaled down. Returns per object (atlas, positions, scale).
+    """
+    atlases = []   # [shelves, top]
+    placements = [None] * len(chartSizes)
+    order = sorted(range(len(chartSizes)), key=lambda i: -max((h for _, h in chartSizes[i]), default=0))
+    for objIndex in order:
+        sizes = chartSizes[objIndex]
+        scale = 1.0
+        while True:
+            scaled = [(max(1, int(np.ceil(w * scale))), max(1, int(np.ceil(h * scale)))) for w, h in sizes]
+            for atlasIndex, (shelves, top) in enumerate(atlases):
+                result = placeOnShelves(shelves, top, scaled, atlasSize)
+                if result:
+                    positions, atlases[atlasIndex][0], atlases[atlasIndex][1] = result
+                    placements[objIndex] = (atlasIndex, positions, scale)
+                    break
+            else:
+                result = placeOnShelves([], 0, scaled, atlasSize)
+                if result:
+                    positions, shelves, top = result
+                    atlases.append([shelves, top])
+                    placements[objIndex] = (len(atlases) - 1, positions, scale)
+            if placements[objIndex] is not None:
+                break
+            scale *= 0.5
+    return placements, len(atlases)
+
+
+def mainLightmaps(outputBase, texelDensity=20.0, atlasSize=1024, padding=4):
+    """
+    Generates a second, non-overlapping UV layer (UVMap_Lightmap) for the
+    static geometry. Charts (connected coplanar faces) are found and
+    flattened for all objects at once with numpy, sized at 'texelDensity'
+    texels per meter plus 'padding' texels on every side, and packed into
+    shared atlases of 'atlasSize' texels. Every object keeps all its charts in
+    one atlas, stored in 'lightmap_atlas'; the layout is written to
+    <output>_lightmaps.json. The copies of an instanced mesh (mainInstancing)
+    keep sharing it: its charts are laid out once and reused by every copy,
+    as Unity gives each renderer its own lightmap area anyway.
+    """
+    objects, instances = [], {}
+    for obj in getStaticObjects():
+        if "instance_of" in obj:
+            instances.setdefault(obj.data, []).append(obj)
+            continue
+        if obj.data.users > 1:
+            obj.data = obj.data.copy()
+        objects.append(obj)
+    copies = {members[0]: members for members in instances.values()}
+    objects += list(copies)
+    if not objects:
+        print("No static geometry found, lightmap UVs skipped.")
+        return
+
+    batch = gatherMeshBatch(objects)
+    chartOfFace, loopFaces = findCharts(batch)
+    uv, low, high = projectCharts(batch, chartOfFace, loopFaces)
+
+    chartSizes = np.ceil((high - low) * texelDensity).astype(int) + 2 * padding
+    chartObjects = np.zeros(len(low), dtype=np.int32)
+    chartObjects[chartOfFace] = batch["faceObjects"]
+    chartsPerObject = [np.nonzero(chartObjects == i)[0] for i in range(len(objects))]
+    placements, atlasCount = packObjectCharts(
+        [[tuple(chartSizes[c]) for c in charts] for charts in chartsPerObject], atlasSize)
+
+    # Chart origin (texels) and scale for every chart, then all UVs at once
+    chartOrigin = np.zeros((len(low), 2))
+    chartScale = np.ones(len(low))
+    for objIndex, charts in enumerate(chartsPerObject):
+        _, positions, scale = placements[objIndex]
+        chartOrigin[charts] = positions
+        chartScale[charts] = scale
+    loopCharts = chartOfFace[loopFaces]
+    texels = chartOrigin[loopCharts] + (padding + (uv - low[loopCharts]) * texelDensity) * chartScale[loopCharts, None]
+    lightmapUV = (texels / atlasSize).astype(np.float32)
+
+    atlases = [{"index": i, "objects": [], "charts": 0, "texels": 0} for i in range(atlasCount)]
+    loopStart = 0
+    for objIndex, obj in enumerate(objects):
+        mesh = obj.data
+        layer = mesh.uv_layers.get(LIGHTMAP_UV_NAME) or mesh.uv_layers.new(name=LIGHTMAP_UV_NAME)
+        loopCount = len(mesh.loops)
+        layer.data.foreach_set("uv", lightmapUV[loopStart:loopStart + loopCount].ravel())
+        loopStart += loopCount
+
+        atlasIndex, _, scale = placements[objIndex]
+        for member in copies.get(obj, [obj]):
+            member["lightmap_atlas"] = atlasIndex
+            atlases[atlasIndex]["objects"].append(member.name)
+        charts = chartsPerObject[objIndex]
+        atlases[atlasIndex]["charts"] += len(charts)
+        atlases[atlasIndex]["texels"] += int(np.prod(chartSizes[charts] * scale, axis=1).sum())
+        if scale < 1.0:
+            print(f"'{obj.name}' does not fit in a {atlasSize}px atlas, lightmap scaled by {scale}.")
+
+    for atlas in atlases:
+        atlas["fill"] = round(atlas.pop("texels") / atlasSize ** 2, 3)
+    layout = {
+        "uvLayer": LIGHTMAP_UV_NAME,
+        "texelDensity": texelDensity,
+        "atlasSize": atlasSize,
+        "padding": padding,
+        "atlases": atlases,
+        # Objects sharing the charts of one instanced mesh
+        "instances": {members[0].data.name: [o.name for o in members] for members in copies.values()},
+    }
+    path = getSidecarPath(outputBase, "lightmaps")
+    digest = writeJsonAtomic(path, layout)
+    emitEvent("output", path=path, sha256=digest, bytes=os.path.getsize(path))
+    print(f"Lightmap UVs: {len(objects)} objects, {len(low)} charts in {atlasCount} atlas(es) "
+          f"of {atlasSize}px at {texelDensity} texels/m.")
+
+
+
+
+
+
+
+
+# ============================
+# FUNCTIONS FOR MERGING
+# ============================
+
+# (category, name prefixes, prefix of the merged objects). The merged names
+# keep a prefix GenerateModel.cs knows, so they get the same material.
+MERGE_CATEGORIES = [
+    ("walls", ("00_A_MUROS", "PRISMA_TOP_00_A_CARP", "PRISMA_BASE_00_A_CARP"), "00_A_MUROS_MERGED"),
+    ("glazing", ("PRISMA_MEDIO_00_A_CARP",), "PRISMA_MEDIO_00_A_CARP_MERGED"),
+    ("frames", ("00_A_PUERTAS",), "00_A_PUERTAS_MERGED"),
+    ("floor", ("FLOOR_LOWER",), "FLOOR_LOWER_MERGED"),
+    ("ceiling", ("FLOOR_UPPER",), "FLOOR_UPPER_MERGED"),
+]
+
+# 16-bit index buffers in Unity
+MERGE_MAX_VERTICES = 65535
+
+
+def getMergeCategory(obj):
+    for category, prefixes, mergedPrefix in MERGE_CATEGORIES:
+        if obj.name.startswith(prefixes) and "_MERGED" not in obj.name:
+            return category, mergedPrefix
+    return None, None
+
+
+def buildMergedMesh(objects, name):
+    """
+    Concatenates the world-space geometry, UV layers, materials and smooth
+    flags of 'objects' into a new mesh, with foreach_get/foreach_set only.
+    Faces keep the order of 'objects'; returns the mesh and, per object, its
+    (vertexStart, vertexCount, faceStart, faceCount, triangleStart, triangleCount).
+    """
+    uvNames = []
+    materials = []
+    for obj in objects:
+        uvNames += [layer.name for layer in obj.data.uv_layers if layer.name not in uvNames]
+        materials += [m for m in obj.data.materials if m not in materials]
+
+    coords, loops, totals, smooth, materialIndices, ranges = [], [], [], [], [], []
+    uvs = {uvName: [] for uvName in uvNames}
+    vertexStart = faceStart = triangleStart = 0
+    for obj in objects:
+        mesh = obj.data
+        objLoops, objTotals = getTopologyArrays(mesh)
+        coords.append(getWorldVertexArray(obj))
+        loops.append(objLoops + vertexStart)
+        totals.append(objTotals)
+
+        flags = np.empty(len(mesh.polygons), dtype=bool)
+        mesh.polygons.foreach_get("use_smooth", flags)
+        smooth.append(flags)
+        indices = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get("material_index", indices)
+        remap = np.array([materials.index(m) for m in mesh.materials] or [0], dtype=np.int32)
+        materialIndices.append(remap[np.minimum(indices, len(remap) - 1)])
+
+        for uvName in uvNames:
+            data = np.zeros(len(mesh.loops) * 2, dtype=np.float32)
+            layer = mesh.uv_layers.get(uvName)
+            if layer:
+                layer.data.foreach_get("uv", data)
+            uvs[uvName].append(data)
+
+        triangles = int((objTotals - 2).sum())
+        ranges.append((vertexStart, len(mesh.vertices), faceStart, len(objTotals), triangleStart, triangles))
+        vertexStart += len(mesh.vertices)
+        faceStart += len(objTotals)
+        triangleStart += triangles
+
+    coords, loops, totals = np.vstack(coords), np.concatenate(loops), np.concatenate(totals)
+    merged = bpy.data.meshes.new(name)
+    merged.vertices.add(len(coords))
+    merged.vertices.foreach_set("co", coords.astype(np.float32).ravel())
+    merged.loops.add(len(loops))
+    merged.loops.foreach_set("vertex_index", loops)
+    merged.polygons.add(len(totals))
+    merged.polygons.foreach_set("loop_start", np.concatenate(([0], np.cumsum(totals)[:-1])).astype(np.int32))
+    merged.polygons.foreach_set("loop_total", totals)
+    merged.polygons.foreach_set("use_smooth", np.concatenate(smooth))
+    merged.polygons.foreach_set("material_index", np.concatenate(materialIndices))
+    merged.update(calc_edges=True)
+    for material in materials:
+        merged.materials.append(material)
+    for uvName in uvNames:
+        merged.uv_layers.new(name=uvName).data.foreach_set("uv", np.concatenate(uvs[uvName]))
+    return merged, ranges
+
+
+def mainMerge(outputBase, merge="category"):
+    """
+    Merges the static elements sharing a material category (walls, glazing,
+    frames, floor, ceiling) into a few combined meshes to cut draw calls:
+    one per category and lightmap atlas, or also per room with merge="room",
+    each capped at MERGE_MAX_VERTICES. A face attribute 'element_index' and
+    <output>_merged.json keep the face, triangle and vertex range of every
+    element so Unity can still pick or hide single elements. Instanced copies
+    (mainInstancing) are left out and drawn as instances of their shared mesh.
+    """
+    if merge == "none":
+        print("Merging disabled.")
+        return
+
+    groups = {}
+    for obj in getPlanObjects():
+        if obj.type != 'MESH' or not obj.data.polygons:
+            continue
+        # Instanced copies stay separate renderers of their shared mesh
+        if "instance_of" in obj:
+            continue
+        category, mergedPrefix = getMergeCategory(obj)
+        if category is None:
+            continue
+        cell = obj.get("cell_id", 0) if merge == "room" else None
+        key = (category, mergedPrefix, cell, obj.get("lightmap_atlas", -1), obj.parent)
+        groups.setdefault(key, []).append(obj)
+
+    index = []
+    mergedObjects = []
+    for (category, mergedPrefix, cell, atlas, parent), members in sorted(
+            groups.items(), key=lambda item: (item[0][0], item[0][2] or 0, item[0][3])):
+        members.sort(key=lambda o: o.get("element_id", o.name))
+        # Split into chunks below the vertex cap
+        chunks, current, count = [], [], 0
+        for obj in members:
+            if current and count + len(obj.data.vertices) > MERGE_MAX_VERTICES:
+                chunks.append(current)
+                current, count = [], 0
+            current.append(obj)
+            count += len(obj.data.vertices)
+        chunks.append(current)
+
+        suffix = (f"_C{cell:02d}" if cell is not None else "") + (f"_A{atlas}" if atlas >= 0 else "")
+        for chunkIndex, chunk in enumerate(chunks):
+            name = f"{mergedPrefix}{suffix}_{chunkIndex}"
+            mesh, ranges = buildMergedMesh(chunk, name)
+            elementIndex = np.repeat(np.arange(len(chunk), dtype=np.int32), [r[3] for r in ranges])
+            mesh.attributes.new(name="element_index", type='INT', domain='FACE').data.foreach_set("value", elementIndex)
+
+            mergedObj = bpy.data.objects.new(name, mesh)
+            (chunk[0].users_collection[0] if chunk[0].users_collection else bpy.context.collection).objects.link(mergedObj)
+            if parent is not None:
+                mergedObj.parent = parent
+                mergedObj.matrix_parent_inverse = parent.matrix_world.inverted()
+            cells = sorted({int(c) for o in chunk for c in str(o.get("cell_ids", "")).split(",") if c})
+            mergedObj["category"] = category
+            mergedObj["cell_id"] = cell if cell is not None else (cells[0] if len(cells) == 1 else 0)
+            mergedObj["cell_ids"] = ",".join(str(c) for c in cells)
+            if atlas >= 0:
+                mergedObj["lightmap_atlas"] = atlas
+            mergedObj["merged_elements"] = len(chunk)
+
+            elements = []
+            for obj, (vStart, vCount, fStart, fCount, tStart, tCount) in zip(chunk, ranges):
+                elements.append({
+                    "name": obj.name,
+                    "id": obj.get("element_id", ""),
+                    "cells": [int(c) for c in str(obj.get("cell_ids", "")).split(",") if c],
+                    "vertexStart": vStart, "vertexCount": vCount,
+                    "faceStart": fStart, "faceCount": fCount,
+                    "triangleStart": tStart, "triangleCount": tCount,
+                })
+            index.append({"name": name, "category": category, "cells": cells, "elements": elements})
+            mergedObjects.append(mergedObj)
+            for obj in chunk:
+                bpy.data.objects.remove(obj)
+
+    addMergedToCellGraph(outputBase, mergedObjects)
+    path = getSidecarPath(outputBase, "merged")
+    digest = writeJsonAtomic(path, {"maxVertices": MERGE_MAX_VERTICES, "objects": index})
+    emitEvent("output", path=path, sha256=digest, bytes=os.path.getsize(path))
+    merged = sum(len(entry["elements"]) for entry in index)
+    print(f"Merge: {merged} static elements combined into {len(mergedObjects)} objects.")
+
+
+def addMergedToCellGraph(outputBase, mergedObjects):
+    """ Lists the merged objects in <output>_cells.json so room culling also handles them. """
+    path = getSidecarPath(outputBase, "cells")
+    if not mergedObjects or not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        graph = json.load(f)
+    for obj in mergedObjects:
+        xy = getWorldVertexArray(obj)[:, :2]
+        graph["elements"].append({
+            "name": obj.name,
+            "id": "",
+            "cells": [int(c) for c in obj["cell_ids"].split(",") if c],
+            "center": [round(float(v), 4) for v in (xy.min(axis=0) + xy.max(axis=0)) / 2.0],
+        })
+    digest = writeJsonAtomic(path, graph)
+    emitEvent("output", path=path, sha256=digest, bytes=os.path.getsize(path))
+
+
+
+
+
+
+
+
+# ============================
+# FUNCTIONS FOR INSTANCING
+# ============================
+
+# Walls and slabs are unique per plan, instancing them only costs time
+INSTANCE_EXCLUDED_PREFIXES = ("00_A_MUROS", "FLOOR_")
+
+
+def getInstancePivot(obj, world):
+    """
+    Point the instance frame of 'obj' is built on: its origin when the object
+    has one of its own (door hinges, furniture centers), or the centroid of
+    its vertices when rebasePlan baked its transform (frames, glass...), as
+    the origin of those is the world origin and says nothing about them.
+    """
+    if obj.matrix_world == Matrix.Identity(4):
+        return world.mean(axis=0)
+    return np.array(obj.matrix_world.translation, dtype=np.float64)
+
+
+def getCanonicalFrame(obj, quantum=0.001):
+    """
+    Puts the geometry of 'obj' in a normalized frame: translated to its pivot
+    (getInstancePivot) and rotated about Z so the principal XY axis lies on X.
+    The four 90 degree variants of that rotation are hashed and the smallest
+    hash wins, so translated and rotated copies of the same block get the
+    same key.
+    Returns (key, angle in radians, pivot as Vector).
+    """
+    world = getWorldVertexArray(obj).astype(np.float64)
+    origin = getInstancePivot(obj, world)
+    relative = world - origin
+
+    xy = relative[:, :2]
+    centered = xy - xy.mean(axis=0)
+    cxx = float(np.dot(centered[:, 0], centered[:, 0]))
+    cyy = float(np.dot(centered[:, 1], centered[:, 1]))
+    cxy = float(np.dot(centered[:, 0], centered[:, 1]))
+    principal = 0.5 * atan2(2.0 * cxy, cxx - cyy)
+
+    loops, totals = getTopologyArrays(obj.data)
+    topology = loops.tobytes() + totals.tobytes()
+
+    best = None
+    for k in range(4):
+        angle = principal + k * np.pi / 2.0
+        c, s = np.cos(-angle), np.sin(-angle)
+        canon = np.column_stack((c * relative[:, 0] - s * relative[:, 1],
+                                 s * relative[:, 0] + c * relative[:, 1],
+                                 relative[:, 2]))
+        quantized = np.round(canon / quantum).astype(np.int64)
+        key = hashlib.sha1(quantized.tobytes() + topology).hexdigest()
+        if best is None or key < best[0]:
+            best = (key, angle)
+
+    return best[0], best[1], Vector(origin.tolist())
+
+
+def setMatrixKeepingChildren(obj, matrix):
+    children = [(child, child.matrix_world.copy()) for child in obj.children]
+    obj.matrix_world = matrix
+    bpy.context.view_layer.update()
+    for child, childMatrix in children:
+        child.matrix_world = childMatrix
+
+
+def mainInstancing(minInstances=2, quantum=0.001):
+    """
+    Finds repeated blocks (sofas, toilets, sinks, doors...) by hashing their
+    canonicalized geometry, builds one shared mesh datablock per hash and turns
+    every copy into an instance of it with its own transform. Copies are
+    identical up to 'quantum' (1 mm by default). UVs are taken from the first
+    copy of each group. It runs before the lightmaps and the merge, so
+    repeated window frames, glass and fixtures are shared as well.
+    """
+    groups = {}
+    for obj in getPlanObjects():
+        if obj.type != 'MESH' or not obj.data.vertices:
+            continue
+        if obj.name.startswith(INSTANCE_EXCLUDED_PREFIXES):
+            continue
+        key, angle, origin = getCanonicalFrame(obj, quantum)
+        groups.setdefault(key, []).append((obj, angle, origin))
+
+    instancedObjects = 0
+    savedVertices = 0
+    sharedMeshes = 0
+    for key, members in groups.items():
+        if len(members) < minInstances:
+            continue
+
+        firstObj, firstAngle, firstOrigin = members[0]
+        firstFrame = Matrix.Translation(firstOrigin) @ Matrix.Rotation(firstAngle, 4, 'Z')
+        sharedMesh = firstObj.data.copy()
+        sharedMesh.name = f"INSTANCE_{key[:12]}"
+        sharedMesh.transform(firstFrame.inverted() @ firstObj.matrix_world)
+        sharedMesh.update()
+        sharedMeshes += 1
+
+        for obj, angle, origin in members:
+            oldMesh = obj.data
+            obj.data = sharedMesh
+            setMatrixKeepingChildren(obj, Matrix.Translation(origin) @ Matrix.Rotation(angle, 4, 'Z'))
+            obj["instance_of"] = sharedMesh.name
+            if oldMesh.users == 0:
+                bpy.data.meshes.remove(oldMesh)
+            instancedObjects += 1
+        savedVertices += len(sharedMesh.vertices) * (len(members) - 1)
+        print(f"'{sharedMesh.name}' shared by {len(members)} objects (e.g. '{firstObj.name}').")
+
+    print(f"Instancing: {instancedObjects} objects now use {sharedMeshes} shared meshes "
+          f"({savedVertices} vertices saved).")
+    return instancedObjects, sharedMeshes
+
+
+
+
+
+
+
+
+# ============================
+# FUNCTIONS FOR EXPORT OPTIMIZATION
+# ============================
+
+# Meshes Unity renders straight from the .blend (furniture is replaced by prefabs)
+EXPORT_PREFIXES = LIGHTMAP_PREFIXES + ("PUERTA",)
+VERTEX_CACHE_SIZE = 32
+
+
+def getCornerNormals(mesh):
+    """ Per-loop normals (as split by Unity on import). """
+    normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+    if hasattr(mesh, "corner_normals"):
+        mesh.corner_normals.foreach_get("vector", normals)
+    else:
+        mesh.calc_normals_split()
+        mesh.loops.foreach_get("normal", normals)
+    return normals.reshape(-1, 3)
+
+
+def getRenderArrays(mesh):
+    """
+    Triangulated view of a mesh as the GPU sees it: loops of every triangle,
+    polygon of every triangle, and the render vertex of every loop (a Blender
+    vertex is split wherever its normal or UVs differ).
+    """
+    mesh.calc_loop_triangles()
+    triLoops = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("loops", triLoops)
+    triPolygons = np.empty(len(mesh.loop_triangles), dtype=np.int32)
+    mesh.loop_triangles.foreach_get("polygon_index", triPolygons)
+
+    loopVertices, _ = getTopologyArrays(mesh)
+    normals = getCornerNormals(mesh)
+    uvLayers = {}
+    for layer in mesh.uv_layers:
+        uv = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+        layer.data.foreach_get("uv", uv)
+        uvLayers[layer.name] = uv.reshape(-1, 2)
+
+    keys = np.column_stack([loopVertices.astype(np.float32), np.round(normals, 4)] +
+                           [np.round(uv, 6) for uv in uvLayers.values()])
+    _, firstLoop, renderVertexOfLoop = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    return {
+        "triLoops": triLoops.reshape(-1, 3),
+        "triPolygons": triPolygons,
+        "loopVertices": loopVertices,
+        "normals": normals,
+        "uvLayers": uvLayers,
+        "renderVertexOfLoop": renderVertexOfLoop.ravel(),
+        "renderVertexLoop": firstLoop,
+    }
+
+
+def simulateACMR(indices, cacheSize=VERTEX_CACHE_SIZE):
+    """ Average cache miss ratio (misses per triangle) of a FIFO post-transform cache. """
+    if len(indices) == 0:
+        return 0.0
+    cache = []
+    inCache = set()
+    misses = 0
+    for index in indices.tolist():
+        if index not in inCache:
+            misses += 1
+            cache.append(index)
+            inCache.add(index)
+            if len(cache) > cacheSize:
+                inCache.discard(cache.pop(0))
+    return misses / (len(indices) / 3)
+
+
+def optimizeVertexCache(triangles, vertexCount, cacheSize=VERTEX_CACHE_SIZE):
+    """
+    Tom Forsyth's linear-speed vertex cache optimization: greedily emits the
+    triangle with the best score, where vertices score higher when they are
+    recently used (LRU position) and when few triangles still need them.
+    Returns the new order of the triangles.
+    """
+    triangleCount = len(triangles)
+    if triangleCount == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    def vertexScore(position, remaining):
+        if remaining == 0:
+            return -1.0
+        score = 0.0
+        if position >= 0:
+            score = 0.75 if position < 3 else (1.0 - (position - 3) / (cacheSize - 3)) ** 1.5
+        return score + 2.0 * remaining ** -0.5
+
+    trianglesOfVertex = [[] for _ in range(vertexCount)]
+    for t, tri in enumerate(triangles.tolist()):
+        for v in tri:
+            trianglesOfVertex[v].append(t)
+    remaining = [len(ts) for ts in trianglesOfVertex]
+    position = [-1] * vertexCount
+    scores = [vertexScore(-1, remaining[v]) for v in range(vertexCount)]
+    triangleList = triangles.tolist()
+    triangleScore = [sum(scores[v] for v in tri) for tri in triangleList]
+    emitted = [False] * triangleCount
+
+    order = []
+    cache = []
+    best = max(range(triangleCount), key=triangleScore.__getitem__)
+    nextUnemitted = 0
+    while len(order) < triangleCount:
+        if best < 0:
+            # Nothing useful in the cache: restart from the first pending triangle
+            while emitted[nextUnemitted]:
+                nextUnemitted += 1
+            best = nextUnemitted
+        emitted[best] = True
+        order.append(best)
+        tri = triangleList[best]
+        for v in tri:
+            trianglesOfVertex[v].remove(best)
+            remaining[v] -= 1
+            if v in cache:
+                cache.remove(v)
+        cache = tri + cache
+        dropped = cache[cacheSize:]
+        cache = cache[:cacheSize]
+
+        touched = set(tri)
+        for v in dropped:
+            position[v] = -1
+            touched.add(v)
+        for p, v in enumerate(cache):
+            position[v] = p
+            touched.add(v)
+        for v in touched:
+            scores[v] = vertexScore(position[v], remaining[v])
+
+        best, bestScore = -1, -1.0
+        for v in cache:
+            for t in trianglesOfVertex[v]:
+                score = sum(scores[w] for w in triangleList[t])
+                triangleScore[t] = score
+                if score > bestScore:
+                    best, bestScore = t, score
+    return np.array(order, dtype=np.int64)
+
+
+# Attribute data types: (foreach property, values per element, array type)
+ATTRIBUTE_LAYOUTS = {
+    'FLOAT': ("value", 1, np.float32),
+    'INT': ("value", 1, np.int32),
+    'INT8': ("value", 1, np.int32),
+    'BOOLEAN': ("value", 1, bool),
+    'FLOAT2': ("vector", 2, np.float32),
+    'INT32_2D': ("value", 2, np.int32),
+    'FLOAT_VECTOR': ("vector", 3, np.float32),
+    'FLOAT_COLOR': ("color", 4, np.float32),
+    'BYTE_COLOR': ("color", 4, np.float32),
+    'QUATERNION': ("value", 4, np.float32),
+}
+
+
+def readAttributes(mesh, skipped):
+    """ (name, domain, type, values) of the generic attributes of a mesh, except 'skipped' and the internal ones. """
+    attributes = []
+    for attribute in mesh.attributes:
+        layout = ATTRIBUTE_LAYOUTS.get(attribute.data_type)
+        if layout is None or attribute.name in skipped or attribute.name.startswith("."):
+            continue
+        key, width, dtype = layout
+        values = np.empty(len(attribute.data) * width, dtype=dtype)
+        attribute.data.foreach_get(key, values)
+        attributes.append((attribute.name, attribute.domain, attribute.data_type, values.reshape(len(attribute.data), width)))
+    return attributes
+
+
+def writeAttributes(mesh, attributes, remaps):
+    """ Writes back what readAttributes read, picking the old element of every new one ('remaps' per domain, -1: zero). """
+    for name, domain, dataType, values in attributes:
+        remap = remaps.get(domain)
+        if remap is None:
+            continue
+        key = ATTRIBUTE_LAYOUTS[dataType][0]
+        newValues = np.zeros((len(remap), values.shape[1]), dtype=values.dtype)
+        newValues[remap >= 0] = values[remap[remap >= 0]]
+        attribute = mesh.attributes.get(name) or mesh.attributes.new(name=name, type=dataType, domain=domain)
+        attribute.data.foreach_set(key, newValues.ravel())
+
+
+def getEdgeKeys(mesh, vertexCount, vertexIds=None):
+    """ One integer per edge from its two (optionally renumbered) vertices, whatever their order. """
+    vertices = np.empty(len(mesh.edges) * 2, dtype=np.int64)
+    mesh.edges.foreach_get("vertices", vertices)
+    vertices = vertices.reshape(-1, 2)
+    if vertexIds is not None:
+        vertices = vertexIds[vertices]
+    return vertices.min(axis=1) * vertexCount + vertices.max(axis=1)
+
+
+def optimizeMeshOrder(mesh, cacheSize=VERTEX_CACHE_SIZE):
+    """
+    Reorders a mesh for the GPU: triangles by optimizeVertexCache (inside each
+    merged element, so their ranges stay contiguous) and vertices by first use.
+    The mesh is rebuilt as triangles, keeping its UVs, custom normals and
+    generic attributes (colors, element_index, ...). Returns its render arrays
+    before and after, plus the ACMR of both orders.
+    """
+    before = getRenderArrays(mesh)
+    triangles = before["renderVertexOfLoop"][before["triLoops"]]
+    acmrBefore = simulateACMR(triangles.ravel(), cacheSize)
+
+    elementAttribute = mesh.attributes.get("element_index")
+    segments = np.zeros(len(triangles), dtype=np.int32)
+    if elementAttribute:
+        polygonElements = np.empty(len(mesh.polygons), dtype=np.int32)
+        elementAttribute.data.foreach_get("value", polygonElements)
+        segments = polygonElements[before["triPolygons"]]
+    # Every element is optimized on its own vertices, numbered from 0
+    grouped = np.argsort(segments, kind="stable")
+    bounds = np.flatnonzero(np.diff(segments[grouped])) + 1
+    order = []
+    for members in np.split(grouped, bounds):
+        localVertices, localTriangles = np.unique(triangles[members], return_inverse=True)
+        localOrder = optimizeVertexCache(localTriangles.reshape(-1, 3), len(localVertices), cacheSize)
+        order.append(members[localOrder])
+    order = np.concatenate(order)
+    acmrAfter = simulateACMR(triangles[order].ravel(), cacheSize)
+
+    # Polygon data carried by every triangle
+    triPolygons = before["triPolygons"][order]
+    smooth = np.empty(len(mesh.polygons), dtype=bool)
+    mesh.polygons.foreach_get("use_smooth", smooth)
+    materials = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", materials)
+
+    # Vertices renumbered by first use
+    triLoops = before["triLoops"][order].ravel()
+    oldVertices = before["loopVertices"][triLoops]
+    _, firstUse = np.unique(oldVertices, return_index=True)
+    vertexOrder = oldVertices[np.sort(firstUse)]
+    newIndex = np.empty(len(mesh.vertices), dtype=np.int32)
+    newIndex[vertexOrder] = np.arange(len(vertexOrder), dtype=np.int32)
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    coords = coords.reshape(-1, 3)[vertexOrder]
+
+    uvLayers = {name: uv[triLoops] for name, uv in before["uvLayers"].items()}
+    customNormals = before["normals"][triLoops] if mesh.has_custom_normals else None
+    attributes = readAttributes(mesh, {"position", "material_index", "sharp_face", "custom_normal", *uvLayers})
+    oldVertexCount = len(mesh.vertices)
+    oldEdgeKeys = getEdgeKeys(mesh, oldVertexCount)
+    colors = mesh.color_attributes
+    activeColor, defaultColor = getattr(colors, "active_color_name", ""), getattr(colors, "default_color_name", "")
+
+    mesh.clear_geometry()
+    mesh.vertices.add(len(coords))
+    mesh.vertices.foreach_set("co", coords.ravel())
+    mesh.loops.add(len(triLoops))
+    mesh.loops.foreach_set("vertex_index", newIndex[oldVertices])
+    mesh.polygons.add(len(order))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, len(triLoops), 3, dtype=np.int32))
+    mesh.polygons.foreach_set("loop_total", np.full(len(order), 3, dtype=np.int32))
+    mesh.polygons.foreach_set("use_smooth", smooth[triPolygons])
+    mesh.polygons.foreach_set("material_index", materials[triPolygons])
+    mesh.update(calc_edges=True)
+    for name, uv in uvLayers.items():
+        layer = mesh.uv_layers.get(name) or mesh.uv_layers.new(name=name)
+        layer.data.foreach_set("uv", uv.ravel())
+
+    # Edges are rebuilt: old edges are found by their vertices, the new diagonals get zeros
+    oldEdges = np.argsort(oldEdgeKeys)
+    newEdgeKeys = getEdgeKeys(mesh, oldVertexCount, vertexOrder)
+    found = np.minimum(np.searchsorted(oldEdgeKeys, newEdgeKeys, sorter=oldEdges), len(oldEdges) - 1)
+    edgeRemap = np.where(oldEdgeKeys[oldEdges[found]] == newEdgeKeys, oldEdges[found], -1) if len(oldEdges) else None
+    writeAttributes(mesh, attributes, {'POINT': vertexOrder, 'CORNER': triLoops, 'FACE': triPolygons,
+                                       'EDGE': edgeRemap})
+    if activeColor in colors:
+        colors.active_color_name = activeColor
+    if defaultColor in colors:
+        colors.default_color_name = defaultColor
+    if customNormals is not None:
+        if hasattr(mesh, "use_auto_smooth"):
+            mesh.use_auto_smooth = True
+        mesh.normals_split_custom_set(customNormals)
+
+    return before, getRenderArrays(mesh), acmrBefore, acmrAfter
+
+
+def encodeMeshData(mesh, arrays):
+    """
+    Packs the render vertices of a mesh: positions as 16-bit integers relative
+    to the mesh bounds, normals as 8-bit signed integers (xyz + padding), the
+    lightmap UVs as 16-bit integers over the [0, 1] atlas and the other UVs as
+    half floats, plus 16-bit indices when possible. Returns the bytes of every
+    stream and the layout entry.
+    """
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    coords = coords.reshape(-1, 3)
+
+    # Render vertices ordered by first use in the (already optimized) triangles
+    triangles = arrays["renderVertexOfLoop"][arrays["triLoops"]].ravel()
+    _, firstUse = np.unique(triangles, return_index=True)
+    renderOrder = triangles[np.sort(firstUse)]
+    remap = np.empty(len(arrays["renderVertexLoop"]), dtype=np.int64)
+    remap[renderOrder] = np.arange(len(renderOrder))
+    loops = arrays["renderVertexLoop"][renderOrder]
+
+    positions = coords[arrays["loopVertices"][loops]]
+    low = positions.min(axis=0)
+    size = np.maximum(positions.max(axis=0) - low, 1e-6)
+    quantized = np.zeros((len(loops), 4), dtype=np.uint16)
+    quantized[:, :3] = np.round((positions - low) / size * 65535.0).astype(np.uint16)
+
+    normals = np.zeros((len(loops), 4), dtype=np.int8)
+    normals[:, :3] = np.round(np.clip(arrays["normals"][loops], -1.0, 1.0) * 127.0).astype(np.int8)
+
+    # Half floats only resolve 2^-11 near 1.0 (half a texel of a 1024 atlas),
+    # enough to bleed over the chart padding, so the lightmap UVs are unorm16
+    uvStreams, uvFormats = {}, []
+    for i, (name, uv) in enumerate(arrays["uvLayers"].items()):
+        if name == LIGHTMAP_UV_NAME:
+            uvStreams[f"uv{i}"] = np.round(np.clip(uv[loops], 0.0, 1.0) * 65535.0).astype(np.uint16).tobytes()
+            uvFormats.append("unorm16")
+        else:
+            uvStreams[f"uv{i}"] = uv[loops].astype(np.float16).tobytes()
+            uvFormats.append("float16")
+
+    indices = remap[triangles]
+    indexFormat = 16 if len(loops) <= 65535 else 32
+    streams = {
+        "positions": quantized.tobytes(),
+        "normals": normals.tobytes(),
+        **uvStreams,
+        "indices": indices.astype(np.uint16 if indexFormat == 16 else np.uint32).tobytes(),
+    }
+    layout = {
+        "vertexCount": int(len(loops)),
+        "indexCount": int(len(indices)),
+        "indexFormat": indexFormat,
+        "boundsMin": [round(float(v), 6) for v in low],
+        "boundsSize": [round(float(v), 6) for v in size],
+        "uvLayers": list(arrays["uvLayers"]),
+        "uvFormats": uvFormats,
+    }
+    return streams, layout
+
+
+def updateMergedIndex(outputBase):
+    """
+    Merged meshes are triangulated and reordered by mainOptimize: refreshes
+    the element ranges of <output>_merged.json from their 'element_index'.
+    """
+    path = getSidecarPath(outputBase, "merged")
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        index = json.load(f)
+
+    for entry in index["objects"]:
+        obj = bpy.data.objects.get(entry["name"])
+        attribute = obj.data.attributes.get("element_index") if obj and obj.type == 'MESH' else None
+        if attribute is None:
+            continue
+        faceElements = np.empty(len(obj.data.polygons), dtype=np.int32)
+        attribute.data.foreach_get("value", faceElements)
+        loops, totals = getTopologyArrays(obj.data)
+        loopElements = np.repeat(faceElements, totals)
+        for elementIndex, element in enumerate(entry["elements"]):
+            faces = np.nonzero(faceElements == elementIndex)[0]
+            vertices = loops[loopElements == elementIndex]
+            if not len(faces):
+                continue
+            element.update(faceStart=int(faces[0]), faceCount=int(len(faces)),
+                           triangleStart=int(faces[0]), triangleCount=int(len(faces)),
+                           vertexStart=int(vertices.min()), vertexCount=int(vertices.max() - vertices.min() + 1))
+
+    digest = writeJsonAtomic(path, index)
+    emitEvent("output", path=path, sha256=digest, bytes=os.path.getsize(path))
+
+
+def getFloatBufferSize(arrays):
+    """ Bytes of the render vertices and indices as Unity imports them by default. """
+    vertexCount = len(arrays["renderVertexLoop"])
+    indexSize = 2 if vertexCount <= 65535 else 4
+    return vertexCount * (12 + 12 + 8 * len(arrays["uvLayers"])) + arrays["triLoops"].size * indexSize
+
+
+def mainOptimize(outputBase, quantize=False, cacheSize=VERTEX_CACHE_SIZE):
+    """
+    Reorders every exported mesh for post-transform vertex cache and fetch
+    locality and reports the ACMR and buffer sizes before and after in
+    <output>_meshopt.json. With 'quantize' the packed vertex streams are also
+    written to <output>_meshdata.bytes (layout in the report), which
+    QuantizedMeshLoader.cs can load instead of the imported meshes.
+    """
+    meshes = {}
+    for obj in getPlanObjects():
+        if obj.type == 'MESH' and obj.data.polygons and obj.name.startswith(EXPORT_PREFIXES):
+            meshes.setdefault(obj.data, []).append(obj.name)
+    if not meshes:
+        print("No meshes to optimize.")
+        return
+
+    report = []
+    blob = bytearray()
+    for mesh, objectNames in meshes.items():
+        before, after, acmrBefore, acmrAfter = optimizeMeshOrder(mesh, cacheSize)
+        entry = {
+            "mesh": mesh.name,
+            "objects": objectNames,
+            "triangles": int(len(after["triPolygons"])),
+            "renderVertices": int(len(after["renderVertexLoop"])),
+            "acmrBefore": round(acmrBefore, 3),
+            "acmrAfter": round(acmrAfter, 3),
+            "bytesFloat": getFloatBufferSize(before),
+        }
+        if quantize:
+            streams, layout = encodeMeshData(mesh, after)
+            layout["offsets"] = {}
+            for name, data in streams.items():
+                blob += bytes(-len(blob) % 4)
+                layout["offsets"][name] = len(blob)
+                blob += data
+            entry.update(layout, bytesQuantized=sum(len(data) for data in streams.values()))
+        report.append(entry)
+    updateMergedIndex(outputBase)
+
+    totals = {
+        "triangles": sum(e["triangles"] for e in report),
+        "acmrBefore": round(sum(e["acmrBefore"] * e["triangles"] for e in report) / max(1, sum(e["triangles"] for e in report)), 3),
+        "acmrAfter": round(sum(e["acmrAfter"] * e["triangles"] for e in report) / max(1, sum(e["triangles"] for e in report)), 3),
+        "bytesFloat": sum(e["bytesFloat"] for e in report),
+    }
+    if quantize:
+        totals["bytesQuantized"] = sum(e["bytesQuantized"] for e in report)
+        dataPath = f"{outputBase}_meshdata.bytes"
+        tmp = getTempPath(dataPath)
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, dataPath)
+        emitEvent("output", path=dataPath, sha256=hashlib.sha256(blob).hexdigest(), bytes=len(blob))
+
+    path = getSidecarPath(outputBase, "meshopt")
+    digest = writeJsonAtomic(path, {"cacheSize": cacheSize, "quantized": quantize, "totals": totals, "meshes": report})
+    emitEvent("output", path=path, sha256=digest, bytes=os.path.getsize(path))
+    print(f"Mesh optimization: {len(report)} meshes, ACMR {totals['acmrBefore']} -> {totals['acmrAfter']}"
+          + (f", {totals['bytesFloat']} -> {totals['bytesQuantized']} bytes." if quantize else "."))
+
+
+
+
+
+
+
+
+# ============================
+# TILED PROCESSING
+# ============================
+
+# Stages that only look at nearby elements, so they can run tile by tile
+TILED_STAGES = ("furniture", "walls", "doors", "windows")
+# Layers whose splines are spread over the tiles, and the stage that builds them.
+# The furniture blocks (curves not starting with "00_") are copied whole.
+TILED_LAYERS = {
+    "00_A_MUROS_curve_": "walls",
+    "00_A_PUERTAS_curve_": "doors",
+    "00_A_CARP_curve_": "windows",
+    "00_Orientacion_curve_": "furniture",
+}
+# Margin around a tile within which elements are loaded as well: the largest merge threshold
+TILE_HALO = max(WINDOW_VERTEX_THRESHOLD, WINDOW_CENTER_THRESHOLD, DOOR_FRAME_SEARCH)
+TILE_SOURCE_SUFFIX = "_source"
+CURVE_SETTINGS = ("dimensions", "fill_mode", "resolution_u", "offset", "extrude", "bevel_depth")
+SPLINE_SETTINGS = ("use_cyclic_u", "use_endpoint_u", "use_bezier_u", "order_u", "resolution_u",
+                   "material_index", "use_smooth")
+
+
+def getTileGroup(obj):
+    if obj.name in TILED_LAYERS:
+        return TILED_LAYERS[obj.name]
+    if obj.type == 'CURVE' and not obj.name.startswith("00_"):
+        return "furniture"
+    return None
+
+
+def getSplinePoints(spline):
+    """World-independent (local) XYZ of the control points of a spline."""
+    if spline.type == 'BEZIER':
+        co = np.empty(len(spline.bezier_points) * 3, dtype=np.float64)
+        spline.bezier_points.foreach_get("co", co)
+        return co.reshape(-1, 3)
+    co = np.empty(len(spline.points) * 4, dtype=np.float64)
+    spline.points.foreach_get("co", co)
+    return co.reshape(-1, 4)[:, :3]
+
+
+def getSplineBoxes(obj):
+    """(xmin, ymin, xmax, ymax) in world space of every spline of a curve object."""
+    matrix = np.array(obj.matrix_world)
+    boxes = []
+    for spline in obj.data.splines:
+        world = getSplinePoints(spline) @ matrix[:3, :3].T + matrix[:3, 3]
+        boxes.append((*world[:, :2].min(axis=0), *world[:, :2].max(axis=0)))
+    return boxes
+
+
+def getObjectBox(obj):
+    corners = np.array([obj.matrix_world @ Vector(c) for c in obj.bound_box])
+    return (*corners[:, :2].min(axis=0), *corners[:, :2].max(axis=0))
+
+
+def planTiles(tileSize):
+    """
+    Lists the plan elements (layer splines and furniture blocks) with their
+    boxes, and the tiles of 'tileSize' that any of them overlaps.
+    Returns ([(source object, spline index or None for whole objects, box)], [(i, j)]).
+    """
+    elements = []
+    for obj in getPlanObjects():
+        group = getTileGroup(obj)
+        if group is None:
+            continue
+        if obj.type == 'CURVE' and obj.name in TILED_LAYERS:
+            elements += [(obj, index, box) for index, box in enumerate(getSplineBoxes(obj))]
+        else:
+            elements.append((obj, None, getObjectBox(obj)))
+
+    keys = set()
+    for _, _, box in elements:
+        low = np.floor(np.array(box[:2]) / tileSize).astype(np.int64)
+        high = np.floor(np.array(box[2:]) / tileSize).astype(np.int64)
+        keys.update((i, j) for i in range(low[0], high[0] + 1) for j in range(low[1], high[1] + 1))
+    return elements, sorted(keys)
+
+
+def selectTileElements(elements, boxes, region, halo=TILE_HALO):
+    """Elements whose box touches 'region' (xmin, ymin, xmax, ymax) grown by 'halo', as {source object: [indices]}."""
+    hits = np.nonzero((boxes[:, 0] <= region[2] + halo) & (boxes[:, 2] >= region[0] - halo)
+                      & (boxes[:, 1] <= region[3] + halo) & (boxes[:, 3] >= region[1] - halo))[0]
+    content = {}
+    for h in hits:
+        obj, index, _ = elements[h]
+        content.setdefault(obj, []).append(index)
+    return content
+
+
+def getOutputPoints(obj):
+    """World XY of the vertices (or control points) of an object built by a tile, or its location."""
+    if obj.type == 'MESH' and obj.data.vertices:
+        return getWorldVertexArray(obj)[:, :2].astype(np.float64)
+    if obj.type == 'CURVE' and obj.data.splines:
+        matrix = np.array(obj.matrix_world)
+        points = np.vstack([getSplinePoints(spline) for spline in obj.data.splines])
+        return (points @ matrix[:3, :3].T + matrix[:3, 3])[:, :2]
+    return np.array([obj.matrix_world.translation[:2]], dtype=np.float64)
+
+
+def copySpline(spline, curveData):
+    copy = curveData.splines.new(spline.type)
+    if spline.type == 'BEZIER':
+        points, target = spline.bezier_points, copy.bezier_points
+        target.add(len(points) - 1)
+        for p, q in zip(points, target):
+            q.handle_left_type, q.handle_right_type = p.handle_left_type, p.handle_right_type
+        for key in ("co", "handle_left", "handle_right"):
+            values = np.empty(len(points) * 3, dtype=np.float32)
+            points.foreach_get(key, values)
+            target.foreach_set(key, values)
+    else:
+        points, target = spline.points, copy.points
+        target.add(len(points) - 1)
+        values = np.empty(len(points) * 4, dtype=np.float32)
+        points.foreach_get("co", values)
+        target.foreach_set("co", values)
+    for attr in SPLINE_SETTINGS:
+        setattr(copy, attr, getattr(spline, attr))
+
+
+def createTileCurve(source, splineIndices, name, collection):
+    """New curve object 'name' holding only the given splines of 'source'."""
+    curveData = bpy.data.curves.new(name, 'CURVE')
+    for attr in CURVE_SETTINGS:
+        setattr(curveData, attr, getattr(source.data, attr))
+    for mat in source.data.materials:
+        curveData.materials.append(mat)
+    for index in splineIndices:
+        copySpline(source.data.splines[index], curveData)
+    obj = bpy.data.objects.new(name, curveData)
+    obj.matrix_world = source.matrix_world
+    collection.objects.link(obj)
+    return obj
+
+
+def loadTileElements(content, sourceNames, collection):
+    """Copies the elements of 'content' into 'collection' under the names of their sources."""
+    for obj, indices in content.items():
+        if None not in indices:
+            createTileCurve(obj, indices, sourceNames[obj.name], collection)
+        else:
+            copy = obj.copy()
+            copy.data = obj.data.copy()
+            copy.name = sourceNames[obj.name]
+            collection.objects.link(copy)
+
+
+def appendTileObjects(path, collection):
+    """
+    Appends a finished tile. Its materials come back as copies ('Wall.001');
+    they are replaced by the materials already in the session.
+    """
+    materials = set(bpy.data.materials)
+    objects = appendPlanObjects(path, collection)
+    for mat in set(bpy.data.materials) - materials:
+        original = bpy.data.materials.get(re.sub(r"\.\d{3}$", "", mat.name))
+        if original in materials:
+            mat.user_remap(original)
+    return objects
+
+
+def runTiles(options, stages, firstIndex, total):
+    """
+    Runs 'stages' tile by tile. Every tile gets its own collection holding
+    copies of the elements that touch the tile grown by TILE_HALO (under the
+    usual layer names), so the stages and their pairwise searches only see one
+    tile and its surroundings. Elements near a border are thus processed by
+    every tile they touch, but each result is kept by one tile only: the one
+    holding its lowest (x, y) vertex. A result touching the tile but reaching
+    beyond the processed region may be missing pieces (a wall chain, a window
+    across the border), so the region is grown to cover it and the tile is
+    run again until every such result lies inside it.
+    Finished tiles are written to a temporary .blend and unloaded, so only the
+    source layers and one tile are in memory; they are appended back at the
+    end, as the stages after these ones work on the whole plan.
+    """
+    tileSize = options["tileSize"]
+    scene = bpy.context.scene
+    target = bpy.context.collection
+    elements, keys = planTiles(tileSize)
+    boxes = np.array([box for _, _, box in elements], dtype=np.float64).reshape(-1, 4)
+    emitEvent("tiles_planned", tiles=len(keys), tileSize=tileSize, halo=TILE_HALO)
+
+    # The original layers stay out of sight under another name
+    sourceCollection = bpy.data.collections.new("TILE_SOURCE")
+    scene.collection.children.link(sourceCollection)
+    getLayerCollection(sourceCollection).exclude = True
+    sourceNames = {}
+    for obj in {obj for obj, _, _ in elements}:
+        for collection in obj.users_collection:
+            collection.objects.unlink(obj)
+        sourceCollection.objects.link(obj)
+        name = obj.name
+        obj.name = f"{name}{TILE_SOURCE_SUFFIX}"
+        sourceNames[obj.name] = name
+
+    tilePaths = []
+    grown = 0
+    with tempfile.TemporaryDirectory(prefix="tiles_") as tileDirectory:
+        for tileIndex, key in enumerate(keys):
+            label = f"{key[0]}_{key[1]}"
+            tileBox = np.array([key[0], key[1], key[0] + 1, key[1] + 1], dtype=np.float64) * tileSize
+            region = tileBox.copy()
+            collection = bpy.data.collections.new(f"TILE_{label}")
+            scene.collection.children.link(collection)
+            bpy.context.view_layer.active_layer_collection = getLayerCollection(collection)
+            while True:
+                content = selectTileElements(elements, boxes, region)
+                loadTileElements(content, sourceNames, collection)
+                emitEvent("tile_started", tile=label, index=tileIndex, total=len(keys),
+                          elements=sum(len(indices) for indices in content.values()),
+                          region=[round(float(v), 3) for v in region])
+                for stageIndex, (name, func, argNames) in enumerate(stages):
+                    position = firstIndex + len(stages) * tileIndex / len(keys) + stageIndex / len(keys)
+                    runStage(name, func, firstIndex + stageIndex, total, options.get("memoryReport"),
+                             progress=(position, position + 1 / len(keys)), tile=label,
+                             **{argName: options[argName] for argName in argNames})
+
+                # Completing a result can only lower its lowest vertex, so one
+                # that already starts left of the tile never ends up owned by it
+                outputs = list(collection.objects)
+                points = [getOutputPoints(obj) for obj in outputs]
+                cut = [p for p in points
+                       if p[:, 0].min() >= tileBox[0] and (np.floor(p / tileSize) == key).all(axis=1).any()
+                       and ((p.min(axis=0) < region[:2] - 1e-6).any() or (p.max(axis=0) > region[2:] + 1e-6).any())]
+                if not cut:
+                    break
+                for p in cut:
+                    region = np.concatenate((np.minimum(region[:2], p.min(axis=0)), np.maximum(region[2:], p.max(axis=0))))
+                bpy.data.batch_remove(outputs)
+                purgeOrphanData()
+                grown += 1
+                emitEvent("tile_grown", tile=label, results=len(cut))
+
+            # Keep what this tile owns, write it out and unload the tile
+            kept = [obj for obj, p in zip(outputs, points)
+                    if tuple(np.floor(p[np.lexsort((p[:, 1], p[:, 0]))[0]] / tileSize).astype(np.int64)) == key]
+            if kept:
+                path = os.path.join(tileDirectory, f"tile_{label}.blend")
+                bpy.data.libraries.write(path, set(kept))
+                tilePaths.append(path)
+            bpy.data.batch_remove(outputs)
+            bpy.data.collections.remove(collection)
+            purgeOrphanData()
+            emitEvent("tile_finished", tile=label, index=tileIndex, total=len(keys), objects=len(kept))
+
+        # Stitch: every result was kept by exactly one tile
+        bpy.context.view_layer.active_layer_collection = getLayerCollection(target)
+        bpy.data.batch_remove(list(sourceCollection.objects))
+        bpy.data.collections.remove(sourceCollection)
+        purgeOrphanData()
+        for path in tilePaths:
+            appendTileObjects(path, target)
+    purgeOrphanData()
+    print(f"Tiled processing: {len(keys)} tiles of {tileSize} m (halo {TILE_HALO} m), grown {grown} times.")
+
+
+# ============================
+# BATCH (MULTI-FLOOR)
+# ============================
+
+LEVEL_PREFIX = "LEVEL_"
+LEVEL_TAG_SEPARATOR = "@"
+
+
+def loadManifest(manifestPath):
+    """
+    Reads a building manifest:
+      {
+        "mode": "combined" | "per-floor",
+        "output": "building.blend"  (or a folder in per-floor mode),
+        "floors": [{"name": "P1", "plan": "plans/p1.blend", "elevation": 3.0}, ...],
+        "slabs": "building" | "room",  (optional, overrides --slabs)
+        "texelDensity": 20.0,          (optional, overrides --texel-density)
+        "merge": "none" | "category" | "room",  (optional, overrides --merge)
+        "quantize": false,             (optional, overrides --quantize)
+        "tileSize": 0.0,               (optional, overrides --tile-size)
+        "agentRadius": 0.3,            (optional, overrides --agent-radius)
+        "walls": "integrated" | "legacy",  (optional, overrides --walls)
+        "origin": "local" | "world",   (optional, overrides --origin)
+        "originOffset": [x, y, z]      (optional, overrides --origin-offset)
+      }
+    Relative paths are resolved against the manifest folder.
+    """
+    with open(manifestPath, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    baseDir = os.path.dirname(os.path.abspath(manifestPath))
+    manifest["mode"] = manifest.get("mode", "combined")
+    if manifest["mode"] not in ("combined", "per-floor"):
+        raise ValueError(f"Unknown manifest mode '{manifest['mode']}'.")
+    if manifest.get("slabs", "building") not in ("building", "room"):
+        raise ValueError(f"Unknown slabs option '{manifest['slabs']}'.")
+    if manifest.get("merge", "category") not in ("none", "category", "room"):
+        raise ValueError(f"Unknown merge option '{manifest['merge']}'.")
+    if manifest.get("walls", "integrated") not in ("integrated", "legacy"):
+        raise ValueError(f"Unknown walls option '{manifest['walls']}'.")
+    if manifest.get("origin", "world") not in ("local", "world"):
+        raise ValueError(f"Unknown origin option '{manifest['origin']}'.")
+    if "originOffset" in manifest:
+        if len(manifest["originOffset"]) != 3:
+            raise ValueError(f"Invalid origin offset {manifest['originOffset']}.")
+        manifest["originOffset"] = [float(c) for c in manifest["originOffset"]]
+    if "texelDensity" in manifest:
+        manifest["texelDensity"] = float(manifest["texelDensity"])
+    if "agentRadius" in manifest:
+        manifest["agentRadius"] = float(manifest["agentRadius"])
+        if manifest["agentRadius"] <= 0:
+            raise ValueError(f"Invalid agent radius {manifest['agentRadius']}.")
+    if "tileSize" in manifest:
+        manifest["tileSize"] = float(manifest["tileSize"])
+        if manifest["tileSize"] < 0:
+            raise ValueError(f"Invalid tile size {manifest['tileSize']}.")
+    if "output" not in manifest:
+        raise ValueError(f"The manifest '{manifestPath}' has no 'output'.")
+    manifest["output"] = os.path.normpath(os.path.join(baseDir, manifest["output"]))
+
+    floors = manifest.get("floors", [])
+    if not floors:
+        raise ValueError(f"The manifest '{manifestPath}' does not list any floor.")
+    names = set()
+    for floor in floors:
+        if floor["name"] in names or LEVEL_TAG_SEPARATOR in floor["name"]:
+            raise ValueError(f"Invalid or duplicated floor name '{floor['name']}'.")
+        names.add(floor["name"])
+        floor["plan"] = os.path.normpath(os.path.join(baseDir, floor["plan"]))
+        floor["elevation"] = float(floor.get("elevation", 0.0))
+    return manifest
+
+
+def getLayerCollection(collection):
+    if collection == bpy.context.scene.collection:
+        return bpy.context.view_layer.layer_collection
+    return bpy.context.view_layer.layer_collection.children[collection.name]
+
+
+def appendPlanObjects(planPath, collection):
+    with bpy.data.libraries.load(planPath, link=False) as (dataFrom, dataTo):
+        dataTo.objects = list(dataFrom.objects)
+    objects = [o for o in dataTo.objects if o is not None]
+    for objItem in objects:
+        collection.objects.link(objItem)
+    print(f"{len(objects)} objects appended from '{planPath}'.")
+    return objects
+
+
+def createLevelEmpty(floorName, elevation, collection, objects):
+    """
+    Creates the empty that carries the floor elevation and parents every
+    top-level object of the floor to it (identity inverse, so the geometry
+    computed at Z=0 simply moves up with the level).
+    """
+    levelObj = bpy.data.objects.new(f"{LEVEL_PREFIX}{floorName}", None)
+    collection.objects.link(levelObj)
+    levelObj.location = (0.0, 0.0, elevation)
+    for objItem in objects:
+        if objItem.parent is None and objItem != levelObj:
+            objItem.parent = levelObj
+    print(f"Level '{levelObj.name}' created at elevation {elevation}.")
+    return levelObj
+
+
+def tagFloorObjects(objects, floorName):
+    """
+    Prefixes the names with '<floor>@' so the next floor can reuse the plain
+    layer names (00_A_MUROS_curve_, PUERTA, ...). Unity strips the tag.
+    """
+    for objItem in objects:
+        if objItem.name.startswith(LEVEL_PREFIX):
+            continue
+        objItem.name = f"{floorName}{LEVEL_TAG_SEPARATOR}{objItem.name}"
+
+
+def duplicateLevel(sourceCollection, collection, floorName):
+    """
+    Copies an already processed floor into 'collection'. The copies share the
+    mesh and curve datablocks with the source floor.
+    """
+    mapping = {}
+    for objItem in sourceCollection.objects:
+        if objItem.name.startswith(LEVEL_PREFIX):
+            continue
+        copyObj = objItem.copy()
+        collection.objects.link(copyObj)
+        copyObj.name = f"{floorName}{LEVEL_TAG_SEPARATOR}{objItem.name.split(LEVEL_TAG_SEPARATOR, 1)[-1]}"
+        mapping[objItem] = copyObj
+    for copyObj in mapping.values():
+        if copyObj.parent in mapping:
+            copyObj.parent = mapping[copyObj.parent]
+        elif copyObj.parent is not None:
+            copyObj.parent = None
+    return list(mapping.values())
+
+
+def meshFingerprint(mesh):
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    loops, totals = getTopologyArrays(mesh)
+
+    digest = hashlib.sha1()
+    for array in (coords, loops, totals):
+        digest.update(array.tobytes())
+    digest.update("|".join(m.name if m else "" for m in mesh.materials).encode("utf-8"))
+    lightmap = mesh.uv_layers.get(LIGHTMAP_UV_NAME)
+    if lightmap:
+        uv = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+        lightmap.data.foreach_get("uv", uv)
+        digest.update(uv.tobytes())
+    return digest.hexdigest()
+
+
+# Properties that do not change how a material or node renders
+FINGERPRINT_SKIPPED_PROPERTIES = {"rna_type", "name", "label", "location", "width", "width_hidden", "height",
+                                  "select", "hide", "show_options", "show_preview", "show_texture", "parent",
+                                  "color", "use_custom_color", "use_fake_user", "tag", "preview", "original"}
+
+
+def getRnaFingerprint(struct):
+    """ Values of the editable settings of a datablock or node; IDs are referred to by their file or base name. """
+    values = []
+    for prop in struct.bl_rna.properties:
+        key = prop.identifier
+        if key in FINGERPRINT_SKIPPED_PROPERTIES or prop.type == 'COLLECTION':
+            continue
+        # Read-only values are runtime state (session ids, counters), except the datablocks pointed to
+        if prop.is_readonly and prop.type != 'POINTER':
+            continue
+        value = getattr(struct, key, None)
+        if prop.type == 'POINTER':
+            if not isinstance(value, bpy.types.ID):
+                continue
+            value = getattr(value, "filepath", "") or re.sub(r"\.\d{3}$", "", value.name)
+        elif prop.type == 'FLOAT':
+            value = np.round(np.array(value, dtype=np.float64).ravel(), 5).tolist()
+        elif getattr(prop, "is_array", False) or prop.type == 'ENUM' and prop.is_enum_flag:
+            value = sorted(value) if prop.type == 'ENUM' else list(value)
+        values.append((key, value))
+    return values
+
+
+def getSocketValue(socket):
+    value = socket.default_value
+    if isinstance(value, bpy.types.ID):
+        return getattr(value, "filepath", "") or re.sub(r"\.\d{3}$", "", value.name)
+    if isinstance(value, str):
+        return value
+    return np.round(np.array(value, dtype=np.float64).ravel(), 5).tolist()
+
+
+def materialFingerprint(mat):
+    """ Hash of the settings of a material and of its node tree (nodes, input values and links). """
+    digest = hashlib.sha1(repr(getRnaFingerprint(mat)).encode("utf-8"))
+    if mat.node_tree is not None:
+        nodes = sorted(mat.node_tree.nodes, key=lambda n: n.name)
+        order = {node.name: i for i, node in enumerate(nodes)}
+        for node in nodes:
+            inputs = [(s.identifier, getSocketValue(s)) for s in node.inputs if hasattr(s, "default_value")]
+            digest.update(repr((node.bl_idname, getRnaFingerprint(node), inputs)).encode("utf-8"))
+        links = sorted((order[l.from_node.name], l.from_socket.identifier, order[l.to_node.name], l.to_socket.identifier)
+                       for l in mat.node_tree.links)
+        digest.update(repr(links).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def shareIdenticalData():
+    """
+    Floors coming from different plans often contain byte-identical meshes and
+    the same materials (appended as 'Name.001'). Copies of a material with
+    the same settings and node tree, and meshes with the same geometry, are
+    remapped to a single datablock and removed; a 'Name.001' that differs
+    from 'Name' is kept.
+    """
+    removedMaterials = 0
+    materialKeepers = {}
+    # Shortest names first, so the original 'Name' is kept over its 'Name.001' copies
+    for mat in sorted(bpy.data.materials, key=lambda m: (len(m.name), m.name)):
+        key = (re.sub(r"\.\d{3}$", "", mat.name), materialFingerprint(mat))
+        keeper = materialKeepers.setdefault(key, mat)
+        if keeper != mat:
+            mat.user_remap(keeper)
+            bpy.data.materials.remove(mat)
+            removedMaterials += 1
+
+    keepers = {}
+    removedMeshes = 0
+    for mesh in list(bpy.data.meshes):
+        if mesh.users == 0:
+            continue
+        key = meshFingerprint(mesh)
+        keeper = keepers.setdefault(key, mesh)
+        if keeper != mesh:
+            mesh.user_remap(keeper)
+            bpy.data.meshes.remove(mesh)
+            removedMeshes += 1
+
+    print(f"Shared data: {removedMeshes} duplicated meshes and {removedMaterials} duplicated materials removed.")
+    return removedMeshes, removedMaterials
+
+
+def processCombined(manifest, runOptions):
+    """
+    Converts every floor inside one Blender session and saves a single scene
+    with one collection (and one LEVEL_ empty) per floor. Floors that reuse a
+    plan already converted are copied instead of being processed again.
+    """
+    bpy.ops.wm.read_homefile(use_empty=True)
+    floors = manifest["floors"]
+    total = len(floors) * len(PIPELINE_STAGES)
+    processedPlans = {}
+    levelCollections = []
+
+    for floorIndex, floor in enumerate(floors):
+        collection = bpy.data.collections.new(f"{LEVEL_PREFIX}{floor['name']}")
+        bpy.context.scene.collection.children.link(collection)
+        levelCollections.append(collection)
+        bpy.context.view_layer.active_layer_collection = getLayerCollection(collection)
+
+        emitEvent("floor_started", floor=floor["name"], plan=floor["plan"],
+                  percent=round(100.0 * floorIndex / len(floors), 1))
+        sourceCollection = processedPlans.get(floor["plan"])
+        if sourceCollection is not None:
+            objects = duplicateLevel(sourceCollection, collection, floor["name"])
+            emitEvent("floor_reused", floor=floor["name"], source=sourceCollection.name,
+                      percent=round(100.0 * (floorIndex + 1) / len(floors), 1))
+        else:
+            appendPlanObjects(floor["plan"], collection)
+            options = dict(runOptions, outputBase=f"{os.path.splitext(manifest['output'])[0]}_{floor['name']}")
+            runPipeline(options, floorIndex * len(PIPELINE_STAGES), total)
+            objects = list(collection.all_objects)
+            tagFloorObjects(objects, floor["name"])
+            processedPlans[floor["plan"]] = collection
+
+        createLevelEmpty(floor["name"], floor["elevation"], collection, objects)
+        # Hide the finished floor from the next ones
+        getLayerCollection(collection).exclude = True
+        emitEvent("floor_finished", floor=floor["name"], objects=len(collection.all_objects))
+
+    for collection in levelCollections:
+        getLayerCollection(collection).exclude = False
+    if runOptions["origin"] == "world":
+        restorePlanOrigin()
+    shareIdenticalData()
+    purgeOrphanData()
+
+    savePath = manifest["output"]
+    digest = saveBlend(savePath)
+    emitEvent("output", path=savePath, sha256=digest, bytes=os.path.getsize(savePath))
+
+
+def processPerFloor(manifest, runOptions):
+    """
+    Converts every floor inside one Blender session, writing one .blend per
+    floor (<output>/<floor>.blend). Repeated plans reuse the first result.
+    """
+    outputDir = manifest["output"]
+    os.makedirs(outputDir, exist_ok=True)
+    floors = manifest["floors"]
+    total = len(floors) * len(PIPELINE_STAGES)
+    processedPlans = {}
+
+    for floorIndex, floor in enumerate(floors):
+        savePath = os.path.join(outputDir, f"{floor['name']}.blend")
+        emitEvent("floor_started", floor=floor["name"], plan=floor["plan"],
+                  percent=round(100.0 * floorIndex / len(floors), 1))
+
+        sourcePath = processedPlans.get(floor["plan"])
+        if sourcePath is not None:
+            bpy.ops.wm.open_mainfile(filepath=sourcePath)
+            levelObj = next(o for o in bpy.data.objects if o.name.startswith(LEVEL_PREFIX))
+            levelObj.name = f"{LEVEL_PREFIX}{floor['name']}"
+            levelObj.location = (0.0, 0.0, floor["elevation"])
+            emitEvent("floor_reused", floor=floor["name"], source=sourcePath)
+        else:
+            bpy.ops.wm.open_mainfile(filepath=floor["plan"])
+            options = dict(runOptions, outputBase=os.path.splitext(savePath)[0])
+            runPipeline(options, floorIndex * len(PIPELINE_STAGES), total)
+            # Opening the next plan clears the scene, so its offset is passed on
+            if runOptions["originOffset"] is None:
+                runOptions = dict(runOptions, originOffset=list(bpy.context.scene[ORIGIN_PROPERTY]))
+            createLevelEmpty(floor["name"], floor["elevation"], bpy.context.scene.collection,
+                             list(bpy.context.scene.objects))
+            if runOptions["origin"] == "world":
+                restorePlanOrigin()
+            processedPlans[floor["plan"]] = savePath
+
+        digest = saveBlend(savePath)
+        emitEvent("output", path=savePath, sha256=digest, bytes=os.path.getsize(savePath))
+        emitEvent("floor_finished", floor=floor["name"], objects=len(bpy.data.objects),
+                  percent=round(100.0 * (floorIndex + 1) / len(floors), 1))
+
+
+def mainBatch(manifestPath, memoryReport=False, runOptions=None):
+    manifest = loadManifest(manifestPath)
+    emitEvent("run_started", manifest=manifestPath, mode=manifest["mode"],
+              floors=[f["name"] for f in manifest["floors"]],
+              stages=[name for name, _, _ in PIPELINE_STAGES])
+    start = time.perf_counter()
+    # Settings given in the manifest win over the command line ones
+    runOptions = dict(DEFAULT_RUN_OPTIONS, **(runOptions or {}))
+    runOptions.update({k: manifest[k] for k in DEFAULT_RUN_OPTIONS if k in manifest})
+    runOptions["memoryReport"] = startMemoryReport(memoryReport)
+    try:
+        if manifest["mode"] == "combined":
+            processCombined(manifest, runOptions)
+        else:
+            processPerFloor(manifest, runOptions)
+        writeMemoryReport(os.path.splitext(manifest["output"])[0], runOptions["memoryReport"])
+    except Exception as e:
+        emitEvent("run_failed", manifest=manifestPath, message=str(e))
+        raise
+    emitEvent("run_finished", manifest=manifestPath, seconds=round(time.perf_counter() - start, 3), percent=100.0)
+
+
+
+
+
+
+
+
+# ============================
+# DELTA PACKAGING
+# ============================
+
+DELTA_SUFFIX = "_delta"
+# Vertices and transforms are compared at this precision (m)
+DELTA_QUANTUM = 1e-3
+# Elements of the same kind whose origin moved less than this are the same element, modified
+DELTA_ORIGIN_QUANTUM = 0.01
+
+
+def getDeltaKind(name):
+    """ Element type from its name: without the level tag, the '.001' counters and the size/angle suffixes. """
+    name = re.sub(r"\.\d{3}", "", name.split(LEVEL_TAG_SEPARATOR, 1)[-1])
+    return re.sub(r"(_-?\d+(\.\d+)?[LWR])+$", "", name)
+
+
+def getFrameOffset():
+    """ What turns the coordinates of the open file into CAD coordinates (see rebasePlan). """
+    if ORIGIN_EMPTY_NAME in bpy.data.objects:
+        return np.zeros(3)
+    return np.array(bpy.context.scene.get(ORIGIN_PROPERTY, (0.0, 0.0, 0.0)), dtype=np.float64)
+
+
+def getFaceRows(obj, vertexIds):
+    """
+    One row per face: its vertex ids sorted (padded with -1), material index
+    and normal (1/100), with the rows sorted, so the order of the vertices
+    and faces of the mesh does not matter.
+    """
+    mesh = obj.data
+    loops, totals = getTopologyArrays(mesh)
+    if len(totals) == 0:
+        return np.zeros((0, 0), dtype=np.int64)
+    ids = np.full((len(totals), totals.max()), -1, dtype=np.int64)
+    faceOfLoop = np.repeat(np.arange(len(totals)), totals)
+    starts = np.cumsum(totals) - totals
+    ids[faceOfLoop, np.arange(len(loops)) - starts[faceOfLoop]] = vertexIds[loops]
+    ids.sort(axis=1)
+
+    materials = np.empty(len(totals), dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", materials)
+    normals = np.empty(len(totals) * 3, dtype=np.float32)
+    mesh.polygons.foreach_get("normal", normals)
+    normalMatrix = np.array(obj.matrix_world.to_3x3().inverted_safe().transposed(), dtype=np.float64)
+    normals = normals.reshape(-1, 3).astype(np.float64) @ normalMatrix.T
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+
+    rows = np.column_stack([ids, materials, np.round(normals * 100).astype(np.int64) + 0])
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+def getGeometryHash(obj, offset):
+    """
+    Hash of an object as it is seen: transform or, for meshes, pivot,
+    vertices in CAD coordinates, faces and materials. Names, custom properties, lightmap
+    UVs and the order of vertices and faces are left out, as they change
+    with the rest of the plan.
+    """
+    digest = hashlib.sha1(obj.type.encode("utf-8"))
+    matrix = np.array(obj.matrix_world, dtype=np.float64)[:3]
+    matrix[:, 3] += offset
+    # Meshes only count their pivot (the hinge of a door): the axes of the
+    # object may differ while the geometry in world space is the same
+    if obj.type == 'MESH':
+        matrix = matrix[:, 3]
+    # + 0.0 turns -0.0 into 0.0
+    digest.update((np.round(matrix / DELTA_QUANTUM) + 0.0).astype(np.int64).tobytes())
+    if obj.type == 'MESH':
+        world = np.round((getWorldVertexArray(obj).astype(np.float64) + offset) / DELTA_QUANTUM) + 0.0
+        # Vertices numbered by position
+        vertices, vertexIds = np.unique(world.astype(np.int64), axis=0, return_inverse=True)
+        digest.update(vertices.tobytes())
+        digest.update(getFaceRows(obj, vertexIds.ravel()).tobytes())
+        digest.update("|".join(m.name if m else "" for m in obj.data.materials).encode("utf-8"))
+    elif obj.type == 'EMPTY':
+        digest.update(obj.empty_display_type.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def getDeltaElements():
+    """ name -> (kind, geometry hash, origin cell, parent name) of every object of the open file. """
+    offset = getFrameOffset()
+    elements = {}
+    for obj in bpy.context.scene.objects:
+        origin = np.round((np.array(obj.matrix_world.translation, dtype=np.float64) + offset) / DELTA_ORIGIN_QUANTUM)
+        # The export empty of --origin world is at a different place whenever the offsets differ
+        digest = ORIGIN_EMPTY_NAME if obj.name == ORIGIN_EMPTY_NAME else getGeometryHash(obj, offset)
+        elements[obj.name] = (getDeltaKind(obj.name), digest, tuple(origin.astype(np.int64).tolist()),
+                              obj.parent.name if obj.parent else None)
+    return elements
+
+
+def matchDeltaElements(base, target):
+    """
+    Pairs the objects of two conversions of a plan. Equal geometry and
+    position: shared. Same kind at the same origin: modified. The rest is
+    removed (only in the base) or added (only in the target). A shared object
+    whose parent is not shared becomes modified, since hiding or adding the
+    parent in Unity takes its children along.
+    """
+    byHash = {}
+    for name in sorted(base):
+        byHash.setdefault(base[name][1], []).append(name)
+    shared = {}
+    for name in sorted(target):
+        candidates = byHash.get(target[name][1])
+        if candidates:
+            shared[name] = candidates.pop(0)
+
+    modified = {}
+    while True:
+        orphans = [name for name, baseName in shared.items() if shared.get(target[name][3]) != base[baseName][3]]
+        if not orphans:
+            break
+        for name in orphans:
+            modified[name] = shared.pop(name)
+
+    pairedBase = set(shared.values()) | set(modified.values())
+    byOrigin = {}
+    for name in sorted(base):
+        if name not in pairedBase:
+            byOrigin.setdefault((base[name][0], base[name][2]), []).append(name)
+    for name in sorted(target):
+        candidates = byOrigin.get((target[name][0], target[name][2]))
+        if name not in shared and name not in modified and candidates:
+            modified[name] = candidates.pop(0)
+
+    pairedBase = set(shared.values()) | set(modified.values())
+    return {
+        "shared": len(shared),
+        "removed": sorted(name for name in base if name not in pairedBase),
+        "modified": [{"base": modified[name], "target": name} for name in sorted(modified)],
+        "added": sorted(name for name in target if name not in shared and name not in modified),
+    }
+
+
+def packDelta(keep, shift):
+    """
+    Leaves only the 'keep' objects in the open file, in the frame of the base
+    model ('shift' apart). Objects whose parent goes keep their world transform.
+    """
+    keep = set(keep)
+    for obj in list(bpy.context.scene.objects):
+        if obj.name in keep and obj.parent is not None and obj.parent.name not in keep:
+            matrix = obj.matrix_world.copy()
+            obj.parent = None
+            obj.matrix_world = matrix
+    bpy.data.batch_remove([o for o in bpy.data.objects if o.name not in keep])
+    if shift.any():
+        for obj in bpy.context.scene.objects:
+            if obj.parent is None:
+                matrix = obj.matrix_world.copy()
+                matrix.translation += Vector(shift.tolist())
+                obj.matrix_world = matrix
+
+
+def buildDelta(basePath, targetPath):
+    bpy.ops.wm.open_mainfile(filepath=basePath)
+    baseOffset = getFrameOffset()
+    baseElements = getDeltaElements()
+    bpy.ops.wm.open_mainfile(filepath=targetPath)
+    targetOffset = getFrameOffset()
+    targetElements = getDeltaElements()
+
+    delta = matchDeltaElements(baseElements, targetElements)
+    packDelta(delta["added"] + [pair["target"] for pair in delta["modified"]], targetOffset - baseOffset)
+    if ORIGIN_EMPTY_NAME not in bpy.data.objects:
+        bpy.context.scene[ORIGIN_PROPERTY] = baseOffset.tolist()
+    print(f"Delta: {delta['shared']} shared, {len(delta['modified'])} modified, "
+          f"{len(delta['added'])} added and {len(delta['removed'])} removed objects.")
+    return delta
+
+
+def mainDelta(basePath, targetPath):
+    """
+    Packages a converted model (the reform) as a delta of another conversion
+    of the same plan (the original), so Unity keeps one full model plus the
+    elements that differ. Objects are matched by geometry hash and position
+    (see matchDeltaElements). Writes next to 'targetPath':
+      <target>_delta.blend: the added and modified objects of the target
+      <target>_delta.json:  {"base", "target", "shared",
+                             "removed": [base names],
+                             "modified": [{"base", "target"}],
+                             "added": [target names]}
+    """
+    emitEvent("run_started", base=basePath, target=targetPath, stages=["delta"])
+    start = time.perf_counter()
+    outputBase = os.path.splitext(targetPath)[0] + DELTA_SUFFIX
+    try:
+        delta = runStage("delta", buildDelta, 0, 1, basePath=basePath, targetPath=targetPath)
+        savePath = f"{outputBase}.blend"
+        digest = saveBlend(savePath)
+        emitEvent("output", path=savePath, sha256=digest, bytes=os.path.getsize(savePath))
+
+        jsonPath = f"{outputBase}.json"
+        report = {"base": os.path.basename(basePath), "target": os.path.basename(targetPath), **delta}
+        digest = writeJsonAtomic(jsonPath, report)
+        emitEvent("output", path=jsonPath, sha256=digest, bytes=os.path.getsize(jsonPath))
+    except Exception as e:
+        emitEvent("run_failed", base=basePath, target=targetPath, message=str(e))
+        raise
+    emitEvent("run_finished", base=basePath, target=targetPath,
+              seconds=round(time.perf_counter() - start, 3), percent=100.0)
+
+
+
+
+
+
+
+
+# ============================
+# EDIT SESSION
+# ============================
+
+# Stages run before an edit session; lightmaps, merging, instancing and the
+# export optimization would bake or merge the elements the edits work on
+EDIT_SESSION_STAGES = ("names", "origin", "furniture", "walls", "doors", "windows", "openings", "surface",
+                       "lights", "rooms", "colliders", "navigation", "accessibility")
+# Cell size (m) of the grid of element boxes, and how far around an edit elements are rebuilt
+EDIT_GRID_SIZE = 1.0
+EDIT_HALO = 1.0
+MIN_DOOR_WIDTH = 0.3
+
+
+def getElementBox(obj):
+    xy = getWorldVertexArray(obj)[:, :2]
+    return xy.min(axis=0), xy.max(axis=0)
+
+
+def getGridCells(low, high):
+    (x0, y0), (x1, y1) = np.floor(low / EDIT_GRID_SIZE).astype(int), np.floor(high / EDIT_GRID_SIZE).astype(int)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def indexElement(index, obj):
+    """ Adds (or moves) an element in the index: by element id, and by its XY box on a uniform grid. """
+    elementId = obj["element_id"]
+    unindexElement(index, elementId)
+    low, high = getElementBox(obj)
+    index["objects"][elementId] = obj
+    index["boxes"][elementId] = (low, high)
+    for cell in getGridCells(low, high):
+        index["grid"].setdefault(cell, set()).add(elementId)
+
+
+def unindexElement(index, elementId):
+    if elementId in index["boxes"]:
+        for cell in getGridCells(*index["boxes"].pop(elementId)):
+            index["grid"][cell].discard(elementId)
+        del index["objects"][elementId]
+
+
+def buildElementIndex():
+    """ Index of the elements tagged by mainRooms (the navigation area is rebuilt on save, so it is left out). """
+    index = {"objects": {}, "boxes": {}, "grid": {}}
+    for obj in getPlanObjects():
+        if obj.type == 'MESH' and obj.data.vertices and "element_id" in obj and not obj.name.startswith(NAVIGATION_NAME):
+            indexElement(index, obj)
+    return index
+
+
+def findElement(index, ref):
+    """ Element by id (E00012) or, failing that, by object name. """
+    if ref in index["objects"]:
+        return index["objects"][ref]
+    for obj in index["objects"].values():
+        if obj.name == ref:
+            return obj
+    raise KeyError(f"No element '{ref}'.")
+
+
+def queryElements(index, low, high, halo=EDIT_HALO):
+    """ Elements whose boxes come within 'halo' of the box (low, high). """
+    low, high = np.asarray(low) - halo, np.asarray(high) + halo
+    found = set()
+    for cell in getGridCells(low, high):
+        found |= index["grid"].get(cell, set())
+    return [index["objects"][e] for e in sorted(found)
+            if np.all(index["boxes"][e][0] <= high) and np.all(index["boxes"][e][1] >= low)]
+
+
+def getSessionRaster(session):
+    """ Plan raster and portal cells, rebuilt only after an edit that changed walls or openings. """
+    if session["raster"] is None:
+        raster = buildPlanRaster()
+        portals = findPortals(raster) if raster is not None else []
+        session["raster"] = (raster, {p["element"]: [c for c in p["cells"] if c > 0] for p in portals})
+    return session["raster"]
+
+
+def removeColliders(names):
+    for obj in list(bpy.data.objects):
+        if obj.get("collider_of") in names:
+            bpy.data.objects.remove(obj, do_unlink=True)
+
+
+def renameWithAngle(obj, angle):
+    """ Replaces the '_<angle>R' suffix the plan elements carry in their name. """
+    obj.name = re.sub(r"_-?\d+(\.\d+)?R$", f"_{round(angle % 360.0, 2)}R", obj.name)
+
+
+def rebuildWallsNear(session, low, high, targets=()):
+    """
+    Rebuilds the walls within EDIT_HALO of the box (plus 'targets'), with the
+    walls and openings around them as context. Legacy walls have no openings
+    built in, so they are only extruded again.
+    """
+    index = session["index"]
+    context = [o for o in queryElements(index, low, high, 2 * EDIT_HALO) if getColliderKind(o) == "wall"]
+    targets = set(targets) | {o for o in queryElements(index, low, high) if getColliderKind(o) == "wall"}
+    context = [o for o in set(context) | targets if "footprint" in o]
+    openings = []
+    if session["options"]["walls"] == "integrated":
+        contextLow = np.min([index["boxes"][o["element_id"]][0] for o in context], axis=0) if context else low
+        contextHigh = np.max([index["boxes"][o["element_id"]][1] for o in context], axis=0) if context else high
+        openings = [o for o in collectOpenings()
+                    if np.all(o["corners"].min(axis=0) <= contextHigh) and np.all(o["corners"].max(axis=0) >= contextLow)]
+    buildWalls(context, openings, [o for o in targets if o in context])
+    return [o for o in targets if o in context]
+
+
+def editMoveFurniture(session, obj, dx=0.0, dy=0.0, rotate=0.0):
+    """
+    Moves a furniture block by (dx, dy) and turns it 'rotate' degrees around
+    its center. The turn goes into the mesh, as mainFurniture leaves it, and
+    into the angle of its name.
+    """
+    if getColliderKind(obj) != "furniture":
+        raise ValueError(f"'{obj.name}' is not a furniture block.")
+    matrix = obj.matrix_world.copy()
+    center = Matrix.Translation(matrix.translation)
+    obj.data.transform(matrix.inverted() @ center @ Matrix.Rotation(radians(rotate), 4, 'Z') @ center.inverted() @ matrix)
+    obj.data.update()
+    obj.matrix_world = Matrix.Translation((float(dx), float(dy), 0.0)) @ matrix
+    bpy.context.view_layer.update()
+
+    oldName = obj.name
+    angle = float(re.search(r"_(\d+(\.\d+)?)R$", obj.name).group(1))
+    renameWithAngle(obj, angle + rotate)
+    return {"changed": [obj], "renamed": {oldName: obj.name}, "walls": False}
+
+
+def moveFootprintEnd(obj, origin, direction, depthAxis, length, depth, shift):
+    """
+    Moves by 'shift' the footprint edges of a wall lying on the far jamb of a
+    door opening (at 'length' along 'direction' from 'origin', across the
+    'depth' of the opening), and the mesh vertices above them. Returns whether
+    the wall had such an edge.
+    """
+    footprint = getFootprint(obj)
+    moved = []
+    for chains, closed in ((footprint["closed"], True), (footprint["open"], False)):
+        for chain in chains:
+            points = np.array(chain, dtype=np.float64)
+            relative = points - origin
+            along, across = relative @ direction, relative @ depthAxis
+            onJamb = np.abs(along - length) <= OPENING_SNAP
+            ends = set()
+            for i in range(len(points) if closed else len(points) - 1):
+                j = (i + 1) % len(points)
+                if onJamb[i] and onJamb[j] and max(across[i], across[j]) > 0 and min(across[i], across[j]) < depth:
+                    ends |= {i, j}
+            for i in ends:
+                moved.append(points[i])
+                chain[i] = [round(float(v), 5) for v in points[i] + shift]
+    if not moved:
+        return False
+    obj["footprint"] = json.dumps(footprint)
+
+    # Walls drawn as loose lines are not rebuilt from the footprint, their vertices are moved instead
+    world = getWorldVertexArray(obj)
+    hit = np.min(np.linalg.norm(world[:, None, :2] - np.array(moved)[None, :, :], axis=2), axis=1) <= 1e-4
+    toLocal = obj.matrix_world.inverted().to_3x3()
+    offset = toLocal @ Vector((float(shift[0]), float(shift[1]), 0.0))
+    for i in np.flatnonzero(hit):
+        obj.data.vertices[i].co += offset
+    obj.data.update()
+    return True
+
+
+def editDoorWidth(session, door, width):
+    """
+    Sets the clear width of a door. The leaf is stretched from its hinge, and
+    the far jamb moves along the wall together with its frames and the wall
+    end it rests on; the walls around the door are rebuilt with the new opening.
+    """
+    if getColliderKind(door) != "door" or "opening" not in door:
+        raise ValueError(f"'{door.name}' is not a door.")
+    width = float(width)
+    if width < MIN_DOOR_WIDTH:
+        raise ValueError(f"Invalid door width {width}.")
+
+    opening = json.loads(door["opening"])
+    corners = np.array(opening["corners"], dtype=np.float64)
+    length = np.linalg.norm(corners[1] - corners[0])
+    direction = (corners[1] - corners[0]) / length
+    depth = np.linalg.norm(corners[3] - corners[0])
+    depthAxis = (corners[3] - corners[0]) / depth
+    shift = direction * (width - length)
+    neighbours = queryElements(session["index"], corners.min(axis=0), corners.max(axis=0))
+
+    # The leaf is drawn open, along the depth of the opening
+    pivot = np.array(door.matrix_world.translation)
+    world = getWorldVertexArray(door)
+    world[:, :2] += np.outer((world[:, :2] - pivot[:2]) @ depthAxis * (width / length - 1.0), depthAxis)
+    toLocal = door.matrix_world.inverted()
+    for vertex, point in zip(door.data.vertices, world):
+        vertex.co = toLocal @ Vector(point)
+    door.data.update()
+
+    frames = []
+    for obj in neighbours:
+        if obj.name.startswith("00_A_PUERTAS"):
+            low, high = getElementBox(obj)
+            along, across = ((low + high) / 2 - corners[0]) @ direction, ((low + high) / 2 - corners[0]) @ depthAxis
+            if length / 2 < along < length + DOOR_FRAME_SEARCH and -DOOR_FRAME_SEARCH < across < depth + DOOR_FRAME_SEARCH:
+                obj.location += Vector((float(shift[0]), float(shift[1]), 0.0))
+                frames.append(obj)
+    bpy.context.view_layer.update()
+    walls = [o for o in neighbours if getColliderKind(o) == "wall" and "footprint" in o
+             and moveFootprintEnd(o, corners[0], direction, depthAxis, length, depth, shift)]
+
+    corners[1:3] += shift
+    opening["corners"] = [[round(float(x), 5), round(float(y), 5)] for x, y in corners]
+    oldName = door.name
+    renameWithAngle(door, computeDoorAngle(door))
+    door["opening"] = json.dumps(opening)
+    # The walls record their openings by element name
+    for obj in neighbours:
+        if "wall_openings" in obj and oldName != door.name:
+            obj["wall_openings"] = obj["wall_openings"].replace(json.dumps(oldName), json.dumps(door.name))
+
+    rebuilt = rebuildWallsNear(session, corners.min(axis=0), corners.max(axis=0), walls)
+    return {"changed": [door] + frames + rebuilt, "renamed": {oldName: door.name}, "walls": True}
+
+
+def editRemoveWall(session, wall):
+    """ Removes a wall part; the walls around it are rebuilt and take over its openings. """
+    if getColliderKind(wall) != "wall":
+        raise ValueError(f"'{wall.name}' is not a wall.")
+    low, high = session["index"]["boxes"][wall["element_id"]]
+    name, mesh = wall.name, wall.data
+    unindexElement(session["index"], wall["element_id"])
+    bpy.data.objects.remove(wall, do_unlink=True)
+    if mesh.users == 0:
+        bpy.data.meshes.remove(mesh)
+    rebuilt = rebuildWallsNear(session, low, high)
+    return {"changed": rebuilt, "removed": [name], "walls": True}
+
+
+EDIT_OPERATIONS = {
+    "moveFurniture": editMoveFurniture,
+    "setDoorWidth": editDoorWidth,
+    "removeWall": editRemoveWall,
+}
+
+
+def applyEdit(session, command):
+    """
+    Applies one edit ({"op": ..., "id": element id or name, ...arguments}) and
+    refreshes only what it touched: cells and collision proxies of the changed
+    elements. Writes the update as <output>_edit_<n>.json plus a .blend with
+    just the changed objects.
+    """
+    start = time.perf_counter()
+    command = dict(command)
+    op = command.pop("op", None)
+    if op not in EDIT_OPERATIONS:
+        raise ValueError(f"Unknown edit '{op}'.")
+    obj = findElement(session["index"], command.pop("id", None))
+    elementId = obj["element_id"]
+    result = EDIT_OPERATIONS[op](session, obj, **command)
+
+    changed = list(dict.fromkeys(result["changed"]))
+    removed, renamed = result.get("removed", []), result.get("renamed", {})
+    removeColliders(set(removed) | set(renamed) | {o.name for o in changed})
+    if result["walls"]:
+        session["raster"] = None
+    raster, portalCells = getSessionRaster(session)
+    elements, colliders = [], []
+    for o in changed:
+        indexElement(session["index"], o)
+        if raster is not None:
+            elements.append(tagElementCells(o, raster, portalCells))
+        kind = getColliderKind(o)
+        if kind:
+            colliders += createElementColliders(kind, o)
+
+    session["edits"] += 1
+    suffix = f"edit_{session['edits']:03d}"
+    blendPath = f"{session['outputBase']}_{suffix}.blend"
+    tmpPath = getTempPath(blendPath)
+    bpy.data.libraries.write(tmpPath, set(changed) | {bpy.data.objects[c["name"]] for c in colliders}, fake_user=True)
+    os.replace(tmpPath, blendPath)
+    emitEvent("output", path=blendPath, sha256=fileSha256(blendPath), bytes=os.path.getsize(blendPath))
+
+    seconds = round(time.perf_counter() - start, 3)
+    update = {
+        "edit": session["edits"],
+        "op": op,
+        "element": elementId,
+        "arguments": command,
+        "changed": elements or [{"name": o.name, "id": o["element_id"]} for o in changed],
+        "removed": removed,
+        "renamed": {old: new for old, new in renamed.items() if old != new},
+        "colliders": colliders,
+        "blend": os.path.basename(blendPath),
+        "seconds": seconds,
+    }
+    path = getSidecarPath(session["outputBase"], suffix)
+    digest = writeJsonAtomic(path, update)
+    emitEvent("output", path=path, sha256=digest, bytes=os.path.getsize(path))
+    emitEvent("edit_applied", edit=session["edits"], op=op, element=elementId,
+              changed=[o.name for o in changed], removed=removed, seconds=seconds)
+    return update
+
+
+def saveEditSession(session):
+    """ Saves the edited plan, with the plan-wide outputs (cells, colliders, navigation) recomputed. """
+    for obj in list(bpy.data.objects):
+        if "collider" in obj or obj.name.startswith(NAVIGATION_NAME):
+            bpy.data.objects.remove(obj, do_unlink=True)
+    runPipeline(session["options"], stageNames=("rooms", "colliders", "navigation", "accessibility"))
+    session["raster"] = None
+    digest = saveBlend(session["savePath"])
+    emitEvent("output", path=session["savePath"], sha256=digest, bytes=os.path.getsize(session["savePath"]))
+
+
+def mainEditSession(savePath, runOptions=None, commands=None):
+    """
+    Converts the plan as mainScript does (without the export stages) and keeps
+    it in memory, indexed by element id and position. Edits are then read as
+    JSON lines from 'commands' (stdin by default), for example:
+      {"op": "moveFurniture", "id": "E00042", "dx": 0.5, "dy": 0.0, "rotate": 90}
+      {"op": "setDoorWidth", "id": "E00017", "width": 0.9}
+      {"op": "removeWall", "id": "E00003"}
+      {"op": "save"}
+      {"op": "quit"}
+    Each edit only rebuilds the element and its neighbours and writes an
+    incremental update (see applyEdit); "save" writes the whole plan.
+    """
+    outputBase = os.path.splitext(savePath)[0]
+    options = dict(DEFAULT_RUN_OPTIONS, **(runOptions or {}))
+    options.update(outputBase=outputBase, memoryReport=None)
+    emitEvent("run_started", output=savePath, stages=list(EDIT_SESSION_STAGES))
+    runPipeline(options, stageNames=EDIT_SESSION_STAGES)
+    digest = saveBlend(savePath)
+    emitEvent("output", path=savePath, sha256=digest, bytes=os.path.getsize(savePath))
+
+    session = {"options": options, "outputBase": outputBase, "savePath": savePath,
+               "index": buildElementIndex(), "raster": None, "edits": 0}
+    emitEvent("session_ready", output=savePath, elements=len(session["index"]["objects"]))
+    for line in commands or sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            command = json.loads(line)
+            if command.get("op") == "quit":
+                break
+            if command.get("op") == "save":
+                saveEditSession(session)
+            else:
+                applyEdit(session, command)
+        except Exception as e:
+            emitEvent("edit_failed", message=str(e), command=line)
+    emitEvent("session_finished", output=savePath, edits=session["edits"])
+
+
+
+
+
+
+
+
+# ============================
+# MAIN
+# ============================
+
+# Settings of a run that can come from the command line or a manifest
+DEFAULT_RUN_OPTIONS = {
+    "slabs": "building",
+    "texelDensity": 20.0,
+    "merge": "category",
+    "quantize": False,
+    "tileSize": 0.0,
+    "agentRadius": 0.3,
+    "walls": "integrated",
+    "origin": "world",
+    "originOffset": None,
+}
+
+# (stage name, function, keys of the run options passed as keyword arguments)
+PIPELINE_STAGES = [
+    ("names", parseNames, ()),
+    ("origin", rebasePlan, ("outputBase", "originOffset")),
+    ("furniture", mainFurniture, ()),
+    ("walls", mainWalls, ("walls",)),
+    ("doors", mainDoors, ()),
+    ("windows", mainWindows, ("walls",)),
+    ("openings", mainWallOpenings, ("walls",)),
+    ("surface", mainSurface, ("slabs",)),
+    ("lights", mainLights, ()),
+    ("rooms", mainRooms, ("outputBase",)),
+    ("colliders", mainColliders, ("outputBase",)),
+    ("navigation", mainNavigation, ("outputBase", "agentRadius")),
+    ("accessibility", mainAccessibility, ("outputBase",)),
+    ("instancing", mainInstancing, ()),
+    ("lightmaps", mainLightmaps, ("outputBase", "texelDensity")),
+    ("merge", mainMerge, ("outputBase", "merge")),
+    ("optimize", mainOptimize, ("outputBase", "quantize")),
+]
+
+
+def runPipeline(options, firstIndex=0, total=None, stageNames=None):
+    stages = [s for s in PIPELINE_STAGES if stageNames is None or s[0] in stageNames]
+    total = total or len(stages)
+    tiled = [i for i, (name, _, _) in enumerate(stages) if name in TILED_STAGES]
+    for index, (name, func, argNames) in enumerate(stages):
+        if options.get("tileSize") and index in tiled:
+            # The tiled stages run together, one tile at a time
+            if index == tiled[0]:
+                runTiles(options, [stages[i] for i in tiled], firstIndex + index, total)
+            continue
+        kwargs = {argName: options[argName] for argName in argNames}
+        runStage(name, func, firstIndex + index, total, options.get("memoryReport"), **kwargs)
+
+
+def startMemoryReport(enabled):
+    if not enabled:
+        return None
+    tracemalloc.start()
+    return []
+
+
+def mainScript(savePath, memoryReport=False, runOptions=None):
+    emitEvent("run_started", output=savePath, stages=[name for name, _, _ in PIPELINE_STAGES])
+    start = time.perf_counter()
+    outputBase = os.path.splitext(savePath)[0]
+    options = dict(DEFAULT_RUN_OPTIONS, **(runOptions or {}))
+    options.update(outputBase=outputBase, memoryReport=startMemoryReport(memoryReport))
+    try:
+        runPipeline(options)
+        if options["origin"] == "world":
+            restorePlanOrigin()
+        digest = saveBlend(savePath)
+        writeMemoryReport(outputBase, options["memoryReport"])
+    except Exception as e:
+        emitEvent("run_failed", output=savePath, message=str(e))
+        raise
+    emitEvent("output", path=savePath, sha256=digest, bytes=os.path.getsize(savePath))
+    emitEvent("run_finished", output=savePath, seconds=round(time.perf_counter() - start, 3), percent=100.0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Script to generate walls, doors and windows in Blender"
+    )
+    parser.add_argument(
+        "--base-path",
+        dest="savePath",
+        help="Base path of your project (where the blender/ folder is located)"
+    )
+    parser.add_argument(
+        "--manifest",
+        help="JSON manifest listing the floors/units of a building to convert in one session"
+    )
+    parser.add_argument(
+        "--memory-report",
+        action="store_true",
+        help="Measure RSS and tracemalloc peaks per stage and write <output>_memory.json"
+    )
+    parser.add_argument(
+        "--slabs",
+        choices=("building", "room"),
+        default=DEFAULT_RUN_OPTIONS["slabs"],
+        help="One floor/ceiling slab for the whole plan or one per room"
+    )
+    parser.add_argument(
+        "--texel-density",
+        type=float,
+        default=DEFAULT_RUN_OPTIONS["texelDensity"],
+        help="Lightmap texels per meter of the UV2 atlases"
+    )
+    parser.add_argument(
+        "--merge",
+        choices=("none", "category", "room"),
+        default=DEFAULT_RUN_OPTIONS["merge"],
+        help="Merge static geometry by material category, also per room, or not at all"
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Also write 16-bit positions, packed normals and half-float UVs to <output>_meshdata.bytes"
+    )
+    parser.add_argument(
+        "--tile-size",
+        type=float,
+        default=DEFAULT_RUN_OPTIONS["tileSize"],
+        help="Process walls, doors, windows and furniture in square tiles of this size in meters (0 = whole plan); "
+             "only one tile (grown to fit the results crossing its border) is in memory at a time"
+    )
+    parser.add_argument(
+        "--agent-radius",
+        type=float,
+        default=DEFAULT_RUN_OPTIONS["agentRadius"],
+        help="Radius in meters kept clear of walls and furniture in the navigation area"
+    )
+    parser.add_argument(
+        "--delta",
+        nargs=2,
+        metavar=("BASE", "TARGET"),
+        help="Compare two converted models and write <TARGET>_delta.blend/.json with what TARGET changes"
+    )
+    parser.add_argument(
+        "--edit-session",
+        action="store_true",
+        help="Keep the converted plan in memory and apply the edits read as JSON lines from stdin"
+    )
+    parser.add_argument(
+        "--walls",
+        choices=("integrated", "legacy"),
+        default=DEFAULT_RUN_OPTIONS["walls"],
+        help="Walls with their sills and lintels built in, or the stacked window prisms of older versions"
+    )
+    parser.add_argument(
+        "--origin",
+        choices=("local", "world"),
+        default=DEFAULT_RUN_OPTIONS["origin"],
+        help="Save the model around the local origin (offset in <output>_origin.json) or back at its CAD coordinates"
+    )
+    parser.add_argument(
+        "--origin-offset",
+        nargs=3,
+        type=float,
+        metavar=("X", "Y", "Z"),
+        help="CAD coordinates of the local origin, so models converted separately share it (default: center of the plan)"
+    )
+    parser.add_argument(
+        "--plan-origin",
+        nargs="+",
+        metavar="PLAN",
+        help="Only compute the local origin shared by these plans and print it as a 'plan_origin' event"
+    )
+    args = parser.parse_args(sys.argv[sys.argv.index("--") + 1:])
+    if args.tile_size < 0:
+        parser.error("--tile-size must not be negative")
+    if args.agent_radius <= 0:
+        parser.error("--agent-radius must be positive")
+    runOptions = {"slabs": args.slabs, "texelDensity": args.texel_density, "merge": args.merge,
+                  "quantize": args.quantize, "tileSize": args.tile_size, "agentRadius": args.agent_radius,
+                  "walls": args.walls, "origin": args.origin, "originOffset": args.origin_offset}
+    if args.plan_origin:
+        mainPlanOrigin(args.plan_origin)
+    elif args.delta:
+        mainDelta(*args.delta)
+    elif args.edit_session:
+        if not args.savePath:
+            parser.error("--edit-session needs --base-path")
+        mainEditSession(args.savePath, runOptions)
+    elif args.manifest:
+        mainBatch(args.manifest, args.memory_report, runOptions)
+    elif args.savePath:
+        mainScript(args.savePath, args.memory_report, runOptions)
+    else:
+        parser.error("either --base-path, --manifest, --delta or --plan-origin is required")
@@ -1,6 +1,11 @@
 import subprocess
 import os
+import sys
+import json
 import time
+import queue
+import argparse
+import threading
 
 def get_blender_path():
     """ Gets the Blender installation path from the Windows registry. """
@@ -21,31 +26,238 @@ def get_project_root():
     return os.path.dirname(os.path.dirname(directory_path))
 
 
-def run_blender_with_script(blend_file, python_script, base_path):
+def emit_event(event_type, **fields):
+    """ Writes one newline-delimited JSON event on stdout (read by Unity). """
+    event = {"event": event_type, "time": round(time.time(), 3)}
+    event.update(fields)
+    sys.stdout.write(json.dumps(event) + "\n")
+    sys.stdout.flush()
+
+
+def get_log_path(path, suffix=""):
+    """ Where the stderr of the Blender job writing 'path' goes: <path>_blender.log. """
+    return os.path.splitext(os.path.abspath(path))[0] + suffix + "_blender.log"
+
+
+def run_blender_with_script(blend_file, python_script, base_path, extra_args=()):
+    return start_blender([os.path.abspath(blend_file)], python_script,
+                         [f"--base-path={base_path}", *extra_args], get_log_path(base_path))
+
+
+def run_blender_with_manifest(manifest_path, python_script, extra_args=()):
+    """ Converts every floor listed in the manifest inside a single Blender session. """
+    return start_blender([], python_script,
+                         [f"--manifest={os.path.abspath(manifest_path)}", *extra_args], get_log_path(manifest_path))
+
+
+def run_blender_delta(base_blend, target_blend, python_script):
+    """ Packages the reform as a delta of the original (<target>_delta.blend and <target>_delta.json). """
+    return start_blender([], python_script,
+                         ["--delta", os.path.abspath(base_blend), os.path.abspath(target_blend)],
+                         get_log_path(target_blend, "_delta"))
+
+
+def find_plan_origin(blend_files, python_script, log_path):
+    """
+    Asks Blender for the local origin shared by every plan (see mainPlanOrigin),
+    so the models converted in separate processes stay aligned.
+    Returns the [x, y, z] offset, or None if Blender failed.
+    """
+    process = start_blender([], python_script, ["--plan-origin", *map(os.path.abspath, blend_files)], log_path)
+    if process is None:
+        return None
+    origin = None
+    for line in process.stdout:
+        line = line.strip()
+        if not line.startswith("{"):
+            continue
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if event.get("event") == "plan_origin":
+            origin = event["origin"]
+            emit_event("plan_origin", job="origin", origin=origin, overallPercent=0.0)
+    process.wait()
+    if process.returncode != 0:
+        report_failure("origin", process)
+        return None
+    return origin
+
+
+def start_blender(blend_args, python_script, script_args, log_path):
+    """
+    Starts Blender in the background. Its stdout carries the JSON events;
+    stderr (Python tracebacks, Blender warnings) goes to 'log_path'.
+    """
     blender_path = get_blender_path()
     if not blender_path:
-        print("Could not run Blender (path not found in registry).")
-        return
+        print("Could not run Blender (path not found in registry).", file=sys.stderr)
+        return None
 
     blender_exe = os.path.join(blender_path, "blender.exe")
-    blend_path = os.path.abspath(blend_file)
     script_path = os.path.abspath(python_script)
 
     # Build the command:
     cmd = [
         blender_exe,
         "--background",
-        blend_path,
+        *blend_args,
+        "--python-exit-code", "1",
         "--python", script_path,
         "--",                                # <-- everything after this goes to sys.argv of the script
-        f"--base-path={base_path}"
+        *script_args
     ]
 
-    print(f"Running: {' '.join(cmd)}")
-    subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    print(f"Running: {' '.join(cmd)}", file=sys.stderr)
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, "w", encoding="utf-8") as log:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=log,
+                                   text=True, encoding="utf-8", errors="replace", bufsize=1)
+    process.log_path = log_path
+    return process
+
+
+def report_failure(job, process, lines=20):
+    """ Prints the end of the stderr log of a failed job, and returns it. """
+    try:
+        with open(process.log_path, encoding="utf-8", errors="replace") as f:
+            tail = f.readlines()[-lines:]
+    except OSError:
+        tail = []
+    print(f"{job} failed (exit code {process.returncode}), see {process.log_path}:", file=sys.stderr)
+    sys.stderr.writelines(tail)
+    return "".join(tail)
+
+
+def read_events(job, process, events):
+    """ Forwards the JSON lines printed by a Blender process to the shared queue. """
+    for line in process.stdout:
+        line = line.strip()
+        if not line.startswith("{"):
+            continue
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        event["job"] = job
+        events.put(event)
+    process.wait()
+    event = {"event": "job_exited", "job": job, "returncode": process.returncode, "log": process.log_path}
+    if process.returncode != 0:
+        event["stderr"] = report_failure(job, process)
+    events.put(event)
+
+
+def follow_jobs(jobs, outputs=None, failed=None, span=(0.0, 100.0)):
+    """
+    Merges the event streams of every Blender job into this process' stdout,
+    adding an overall percentage (mapped to 'span' when the jobs are one
+    phase of the run). Outputs and failed jobs are appended to the given
+    lists. Returns whether every job succeeded and produced an output.
+    """
+    events = queue.Queue()
+    percents = {job: 0.0 for job in jobs}
+    outputs = [] if outputs is None else outputs
+    failed = [] if failed is None else failed
+    produced = set()
+
+    for job, process in jobs.items():
+        threading.Thread(target=read_events, args=(job, process, events), daemon=True).start()
+
+    running = len(jobs)
+    while running:
+        event = events.get()
+        job = event["job"]
+        if event["event"] == "job_exited":
+            running -= 1
+            if event["returncode"] != 0:
+                failed.append(job)
+            percents[job] = 100.0
+        elif event["event"] == "output":
+            outputs.append({"job": job, "path": event["path"], "sha256": event["sha256"]})
+            produced.add(job)
+        if "percent" in event:
+            percents[job] = event["percent"]
+        event["overallPercent"] = round(span[0] + (span[1] - span[0]) * sum(percents.values()) / len(percents) / 100.0, 1)
+        emit_event(event.pop("event"), **event)
+
+    return not any(job in failed for job in jobs) and produced == set(jobs)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs 3Dmodeling.py with Blender in background")
+    parser.add_argument(
+        "--manifest",
+        help="JSON manifest of a building (floors/units) converted in one Blender session"
+    )
+    parser.add_argument(
+        "--memory-report",
+        action="store_true",
+        help="Report datablock counts, RSS and tracemalloc peaks per stage"
+    )
+    parser.add_argument(
+        "--slabs",
+        choices=("building", "room"),
+        default="building",
+        help="One floor/ceiling slab for the whole plan or one per room"
+    )
+    parser.add_argument(
+        "--texel-density",
+        type=float,
+        default=20.0,
+        help="Lightmap texels per meter of the UV2 atlases"
+    )
+    parser.add_argument(
+        "--merge",
+        choices=("none", "category", "room"),
+        default="category",
+        help="Merge static geometry by material category, also per room, or not at all"
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Also write packed (16-bit) vertex streams next to every .blend"
+    )
+    parser.add_argument(
+        "--tile-size",
+        type=float,
+        default=0.0,
+        help="Process building-scale plans in square tiles of this size in meters (0 = whole plan); "
+             "walls, doors, windows and furniture are built one tile at a time"
+    )
+    parser.add_argument(
+        "--agent-radius",
+        type=float,
+        default=0.3,
+        help="Radius in meters kept clear of walls and furniture in the navigation area"
+    )
+    parser.add_argument(
+        "--walls",
+        choices=("integrated", "legacy"),
+        default="integrated",
+        help="Walls with their sills and lintels built in, or the stacked window prisms of older versions"
+    )
+    parser.add_argument(
+        "--origin",
+        choices=("local", "world"),
+        default="world",
+        help="Save the models back at the CAD coordinates of the plan, or around a local origin "
+             "(the offset shared by both models is written to <model>_origin.json)"
+    )
+    parser.add_argument(
+        "--no-delta",
+        action="store_true",
+        help="Do not package the reform as a delta of the original (Unity then loads both models whole)"
+    )
+    args = parser.parse_args()
+    extra_args = ["--memory-report"] if args.memory_report else []
+    if args.quantize:
+        extra_args.append("--quantize")
+    extra_args += [f"--slabs={args.slabs}", f"--texel-density={args.texel_density}", f"--merge={args.merge}",
+                   f"--tile-size={args.tile_size}", f"--agent-radius={args.agent_radius}", f"--walls={args.walls}",
+                   f"--origin={args.origin}"]
+
     base_path = get_project_root()
     blend_path = os.path.join(base_path, 'tfg', 'blender', 'results', 'original.blend')
     save_path = os.path.join(base_path, 'VR-Piso', 'Assets', 'Resources', 'original.blend')
@@ -55,5 +267,38 @@ if __name__ == "__main__":
 
     script_path = os.path.join(base_path, 'tfg', 'blender', '3Dmodeling.py')
 
-    run_blender_with_script(blend_path, script_path, save_path)
-    run_blender_with_script(blend_path2, script_path, save_path2)
+    delta = not args.manifest and not args.no_delta
+    if not args.manifest:
+        # A delta left by an earlier run would not match the new models
+        for extension in (".blend", ".json"):
+            stale_path = os.path.splitext(save_path2)[0] + "_delta" + extension
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+
+    if args.manifest:
+        jobs = {"building": run_blender_with_manifest(args.manifest, script_path, extra_args)}
+    else:
+        # Both models are rebased by the same offset, or they would not line up in Unity
+        origin = find_plan_origin([blend_path, blend_path2], script_path, get_log_path(save_path, "_origin"))
+        if origin is None:
+            emit_event("completed", ok=False, failed=["origin"], outputs=[], overallPercent=100.0)
+            sys.exit(1)
+        extra_args += ["--origin-offset", *map(str, origin)]
+        jobs = {
+            "original": run_blender_with_script(blend_path, script_path, save_path, extra_args),
+            "reformed": run_blender_with_script(blend_path2, script_path, save_path2, extra_args),
+        }
+    if any(process is None for process in jobs.values()):
+        emit_event("completed", ok=False, failed=list(jobs), outputs=[], overallPercent=100.0)
+        sys.exit(1)
+
+    outputs, failed = [], []
+    ok = follow_jobs(jobs, outputs, failed, span=(0.0, 95.0 if delta else 100.0))
+    if ok and delta:
+        process = run_blender_delta(save_path, save_path2, script_path)
+        ok = process is not None and follow_jobs({"delta": process}, outputs, failed, span=(95.0, 100.0))
+        if process is None:
+            failed.append("delta")
+
+    emit_event("completed", ok=ok, failed=failed, outputs=outputs, overallPercent=100.0)
+    sys.exit(0 if ok else 1)
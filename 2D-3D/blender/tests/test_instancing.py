@@ -0,0 +1,61 @@
+import os
+import importlib.util
+
+import pytest
+
+bpy = pytest.importorskip("bpy")
+
+
+def loadModeling():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "3Dmodeling.py")
+    spec = importlib.util.spec_from_file_location("modeling", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def createWindowFrame(name, offset=(0.0, 0.0, 0.0), location=(0.0, 0.0, 0.0)):
+    """ A 1.0 x 1.2 m frame, 0.1 m deep and 0.1 m wide, standing in the XZ plane. """
+    outer = [(0.0, 0.0), (1.0, 0.0), (1.0, 1.2), (0.0, 1.2)]
+    inner = [(0.1, 0.1), (0.9, 0.1), (0.9, 1.1), (0.1, 1.1)]
+    verts = [(x + offset[0], y + offset[1], z + offset[2])
+             for y in (0.0, 0.1) for x, z in outer + inner]
+    faces = []
+    for i in range(4):
+        j = (i + 1) % 4
+        for front, back in ((0, 8), (4, 12)):
+            faces.append((front + i, front + j, back + j, back + i))
+        for side in (0, 8):
+            faces.append((side + i, side + j, side + 4 + j, side + 4 + i))
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(verts, [], faces)
+    mesh.update()
+    obj = bpy.data.objects.new(name, mesh)
+    obj.location = location
+    bpy.context.scene.collection.objects.link(obj)
+    return obj
+
+
+def test_translated_window_frames_hash_equal_after_origin(tmp_path):
+    modeling = loadModeling()
+    bpy.ops.wm.read_homefile(use_empty=True)
+    # CAD survey coordinates: the second copy is also moved in its vertices
+    first = createWindowFrame("PRISMA_A", location=(431250.0, 4581730.0, 0.0))
+    second = createWindowFrame("PRISMA_B", offset=(7.35, -3.8, 0.0), location=(431250.0, 4581730.0, 0.0))
+
+    modeling.rebasePlan(str(tmp_path / "plan"))
+    assert first.matrix_world == second.matrix_world
+
+    firstKey, _, firstPivot = modeling.getCanonicalFrame(first)
+    secondKey, _, secondPivot = modeling.getCanonicalFrame(second)
+    assert firstKey == secondKey
+    assert tuple(secondPivot - firstPivot) == pytest.approx((7.35, -3.8, 0.0), abs=1e-4)
+
+    assert modeling.mainInstancing() == (2, 1)
+    assert first.data == second.data
+    # Each copy stays where it was drawn
+    offset = bpy.context.scene[modeling.ORIGIN_PROPERTY]
+    for obj, corner in ((first, (431250.0, 4581730.0)), (second, (431257.35, 4581726.2))):
+        world = [obj.matrix_world @ v.co for v in obj.data.vertices]
+        low = (min(v.x for v in world) + offset[0], min(v.y for v in world) + offset[1])
+        assert low == pytest.approx(corner, abs=1e-3)
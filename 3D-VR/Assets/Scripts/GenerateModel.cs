@@ -22,6 +22,15 @@ public class GenerateModel : MonoBehaviour
     private string floorPrefix = "FLOOR_LOWER";
     private string ceilingPrefix = "FLOOR_UPPER";
     private string lightPrefix = "Luz";
+    private string colliderPrefix = "COL_";
+    private string navigationPrefix = "NAV_AREA";
+    private string levelPrefix = "LEVEL_";
+    private char levelTagSeparator = '@';
+    private string cellsSuffix = "_cells";
+    private string mergedSuffix = "_merged";
+    private string meshOptSuffix = "_meshopt";
+    private string meshDataSuffix = "_meshdata";
+    private string deltaSuffix = "_delta";
 
     [Header("Materials (Resources/Materials)")]
     private string wallMatPath = "Materials/BaseWall";
@@ -50,11 +59,28 @@ public class GenerateModel : MonoBehaviour
             return;
         }
 
-        LoadModel(false);
-        LoadModel(true);
+        var spawned = new Dictionary<Transform, GameObject>();
+        var original = LoadModel(prefabPath1, prefabPath1, spawned);
+        // Only the elements changed by the reform, when 3Dmodeling.py --delta packaged them
+        if (!LoadReformDelta(original, spawned))
+            LoadModel(prefabPath2, prefabPath2, null);
+        _isLoaded = true;
         InitializeSwitchModel();
     }
 
+    private bool LoadReformDelta(GameObject original, Dictionary<Transform, GameObject> spawned)
+    {
+        string deltaPath = prefabPath2 + deltaSuffix;
+        var report = Resources.Load<TextAsset>(deltaPath);
+        if (original == null || report == null) return false;
+
+        // The delta uses the room graph and indices of the full reform
+        var delta = LoadModel(deltaPath, prefabPath2, null);
+        if (delta == null) return false;
+        EnsureComponent<ModelDelta>(original).Initialize(report, delta, spawned);
+        return true;
+    }
+
     private void InitializeSwitchModel()
     {
         var switchModel = FindObjectOfType<SwitchModel>();
@@ -69,22 +95,42 @@ public class GenerateModel : MonoBehaviour
         }
     }
 
-    private void LoadModel(bool reform)
+    // 'dataPath' is the name of the .blend the sidecar files (_cells, _merged, ...) belong to.
+    // Furniture and lights instantiated for a placeholder are added to 'spawned' when given.
+    private GameObject LoadModel(string prefabPath, string dataPath, Dictionary<Transform, GameObject> spawned)
     {
-        if (!TryInstantiatePrefab(reform, out var root)) return;
+        if (!TryInstantiatePrefab(prefabPath, out var root)) return null;
+
+        // Box proxies exported by 3Dmodeling.py replace the wall, door and furniture colliders
+        bool hasProxies = ContainsPrefix(root, colliderPrefix);
+        // The precomputed walkable area replaces the floor as teleport target
+        bool hasNavigation = ContainsPrefix(root, navigationPrefix);
 
         foreach (var tr in root.GetComponentsInChildren<Transform>(true))
         {
-            string n = tr.name;
+            string n = StripLevelTag(tr.name);
 
-            if (n.StartsWith(wallPrefix))
+            if (n.StartsWith(levelPrefix))
             {
-                EnsureCollider<MeshCollider>(tr.gameObject);
+                // Floor containers of multi-floor buildings, already placed at their elevation
+                continue;
+            }
+            else if (n.StartsWith(colliderPrefix))
+            {
+                EnsureCollider<BoxCollider>(tr.gameObject);
+            }
+            else if (n.StartsWith(navigationPrefix))
+            {
+                ConfigureNavigationArea(tr.gameObject);
+            }
+            else if (n.StartsWith(wallPrefix))
+            {
+                if (!hasProxies) EnsureCollider<MeshCollider>(tr.gameObject);
                 AssignMaterial(tr, wallMatPath);
             }
             else if (n.StartsWith(doorPrefix))
             {
-                EnsureCollider<BoxCollider>(tr.gameObject);
+                if (!hasProxies) EnsureCollider<BoxCollider>(tr.gameObject);
                 AssignMaterial(tr, doorMatPath);
                 ConfigureDoorRotation(tr);
             }
@@ -107,7 +153,7 @@ public class GenerateModel : MonoBehaviour
             {
                 EnsureCollider<MeshCollider>(tr.gameObject);
                 AssignMaterial(tr, floorMatPath);
-                ConfigureTeleportationArea(tr.gameObject);
+                if (!hasNavigation) ConfigureTeleportationArea(tr.gameObject);
             }
             else if (n.StartsWith(ceilingPrefix))
             {
@@ -116,20 +162,50 @@ public class GenerateModel : MonoBehaviour
             }
             else if (n.StartsWith(lightPrefix))
             {
-                LightPlacer.PlaceLight(tr);
+                var lamp = LightPlacer.PlaceLight(tr);
+                if (spawned != null) spawned[tr] = lamp;
             }
             else
             {
-                PrefabScaler.InstantiateFurniture(tr);
+                var furniture = PrefabScaler.InstantiateFurniture(tr);
+                if (hasProxies && furniture != null) RemoveMeshColliders(furniture);
+                if (spawned != null) spawned[tr] = furniture;
             }
         }
+
+        ConfigureRoomCulling(root, dataPath);
+        ConfigureMergedElementIndex(root, dataPath);
+        // A delta keeps its imported meshes rather than loading the packed streams of the whole reform
+        if (prefabPath == dataPath) ConfigureQuantizedMeshes(root, dataPath);
+        return root;
     }
 
     #region Helper Methods
 
-    private bool TryInstantiatePrefab(bool reform, out GameObject instance)
+    // Multi-floor scenes prefix every element with '<floor>@'
+    private string StripLevelTag(string name)
+    {
+        int at = name.IndexOf(levelTagSeparator);
+        return at >= 0 ? name.Substring(at + 1) : name;
+    }
+
+    private bool ContainsPrefix(GameObject root, string prefix)
+    {
+        foreach (var tr in root.GetComponentsInChildren<Transform>(true))
+        {
+            if (StripLevelTag(tr.name).StartsWith(prefix)) return true;
+        }
+        return false;
+    }
+
+    private static void RemoveMeshColliders(GameObject go)
+    {
+        foreach (var mc in go.GetComponentsInChildren<MeshCollider>(true))
+            Destroy(mc);
+    }
+
+    private bool TryInstantiatePrefab(string pathToLoad, out GameObject instance)
     {
-        string pathToLoad = reform ? prefabPath2 : prefabPath1;
         if (string.IsNullOrEmpty(pathToLoad))
         {
             Debug.LogError("[FloorLoader] Prefab path is not set.");
@@ -145,14 +221,9 @@ public class GenerateModel : MonoBehaviour
             return false;
         }
 
-        if (reform)
-        {
-            _isLoaded = true;
-        }
-
         instance = Instantiate(prefab, Vector3.zero, Quaternion.identity);
         instance.name = prefab.name + "_Instance";
-        Debug.Log($"[FloorLoader] Prefab '{prefab.name}' instantiated at {Vector3.zero} (reform={reform}).");
+        Debug.Log($"[FloorLoader] Prefab '{prefab.name}' instantiated at {Vector3.zero}.");
         return true;
     }
 
@@ -177,6 +248,46 @@ public class GenerateModel : MonoBehaviour
         grab.movementType = UnityEngine.XR.Interaction.Toolkit.Interactables.XRBaseInteractable.MovementType.VelocityTracking;
     }
 
+    private void ConfigureRoomCulling(GameObject root, string dataPath)
+    {
+        // Room/portal graph written by 3Dmodeling.py next to the .blend
+        string cellsPath = dataPath + cellsSuffix;
+        var cells = Resources.Load<TextAsset>(cellsPath);
+        if (cells == null)
+        {
+            Debug.Log($"[FloorLoader] No room graph at Resources/{cellsPath}, room culling disabled.");
+            return;
+        }
+        EnsureComponent<RoomCulling>(root).Initialize(cells);
+    }
+
+    private void ConfigureMergedElementIndex(GameObject root, string dataPath)
+    {
+        // Element ranges of the meshes merged by material category
+        string mergedPath = dataPath + mergedSuffix;
+        var merged = Resources.Load<TextAsset>(mergedPath);
+        if (merged == null) return;
+        EnsureComponent<MergedElementIndex>(root).Initialize(merged);
+    }
+
+    private void ConfigureQuantizedMeshes(GameObject root, string dataPath)
+    {
+        // Packed vertex streams, only written by 3Dmodeling.py --quantize
+        var report = Resources.Load<TextAsset>(dataPath + meshOptSuffix);
+        var data = Resources.Load<TextAsset>(dataPath + meshDataSuffix);
+        if (report == null || data == null) return;
+        EnsureComponent<QuantizedMeshLoader>(root).Load(report, data);
+    }
+
+    private void ConfigureNavigationArea(GameObject go)
+    {
+        // Invisible walkable surface: teleport target and NavMesh source
+        if (go.TryGetComponent<MeshRenderer>(out var mr)) mr.enabled = false;
+        EnsureCollider<MeshCollider>(go);
+        ConfigureTeleportationArea(go);
+        EnsureComponent<NavigationArea>(go);
+    }
+
     private void ConfigureTeleportationArea(GameObject go)
     {
         var tpArea = go.GetComponent<UnityEngine.XR.Interaction.Toolkit.Locomotion.Teleportation.TeleportationArea>();
@@ -201,9 +312,15 @@ public class GenerateModel : MonoBehaviour
         if (_materialCache.TryGetValue(path, out var cached)) return cached;
         var mat = Resources.Load<Material>(path);
         if (mat == null)
+        {
             Debug.LogWarning($"[FloorLoader] Material not found: Resources/{path}");
+        }
         else
+        {
+            // Repeated blocks share one mesh, so they can be drawn with GPU instancing
+            mat.enableInstancing = true;
             _materialCache[path] = mat;
+        }
         return mat;
     }
 
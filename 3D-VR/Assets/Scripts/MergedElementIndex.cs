@@ -0,0 +1,87 @@
+using System.Collections.Generic;
+using UnityEngine;
+
+// Resolves which original element (wall part, frame, window...) a triangle of a
+// merged mesh belongs to, using the <name>_merged.json index written by 3Dmodeling.py.
+[DisallowMultipleComponent]
+public class MergedElementIndex : MonoBehaviour
+{
+    #region Merged JSON
+
+    [System.Serializable]
+    private class MergedIndex
+    {
+        public int maxVertices;
+        public MergedObject[] objects;
+    }
+
+    [System.Serializable]
+    private class MergedObject
+    {
+        public string name;
+        public string category;
+        public int[] cells;
+        public MergedElement[] elements;
+    }
+
+    [System.Serializable]
+    public class MergedElement
+    {
+        public string name;
+        public string id;
+        public int[] cells;
+        public int vertexStart;
+        public int vertexCount;
+        public int faceStart;
+        public int faceCount;
+        public int triangleStart;
+        public int triangleCount;
+    }
+
+    #endregion
+
+    private readonly Dictionary<string, MergedObject> _objects = new();
+
+    public void Initialize(TextAsset mergedJson)
+    {
+        var index = JsonUtility.FromJson<MergedIndex>(mergedJson.text);
+        if (index?.objects == null) return;
+
+        foreach (var obj in index.objects)
+            _objects[obj.name] = obj;
+        Debug.Log($"[MergedElementIndex] {_objects.Count} merged objects indexed.");
+    }
+
+    // Works for hits on MeshColliders, which report the triangle that was hit
+    public bool TryGetElement(RaycastHit hit, out MergedElement element)
+    {
+        element = null;
+        return hit.collider is MeshCollider
+            && TryGetElement(hit.collider.name, hit.triangleIndex, out element);
+    }
+
+    public bool TryGetElement(string mergedName, int triangleIndex, out MergedElement element)
+    {
+        element = null;
+        if (triangleIndex < 0 || !_objects.TryGetValue(mergedName, out var obj)) return false;
+
+        // Elements are stored in triangle order
+        int low = 0, high = obj.elements.Length - 1;
+        while (low <= high)
+        {
+            int mid = (low + high) / 2;
+            var candidate = obj.elements[mid];
+            if (triangleIndex < candidate.triangleStart) high = mid - 1;
+            else if (triangleIndex >= candidate.triangleStart + candidate.triangleCount) low = mid + 1;
+            else
+            {
+                element = candidate;
+                return true;
+            }
+        }
+        return false;
+    }
+
+    public IReadOnlyList<MergedElement> GetElements(string mergedName) =>
+        _objects.TryGetValue(mergedName, out var obj) ? obj.elements : System.Array.Empty<MergedElement>();
+}
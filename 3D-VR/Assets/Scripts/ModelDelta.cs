@@ -0,0 +1,83 @@
+using System.Collections.Generic;
+using UnityEngine;
+
+// Shows the reform on top of the original model when only the elements it changes
+// are loaded: <reformed>_delta.json, written by 3Dmodeling.py --delta, lists the
+// original elements the reform removes or replaces, and <reformed>_delta.blend
+// holds the added and modified ones. Switching only toggles those two sets.
+[DisallowMultipleComponent]
+public class ModelDelta : MonoBehaviour
+{
+    #region Delta JSON
+
+    [System.Serializable]
+    private class DeltaReport
+    {
+        public string @base;
+        public string target;
+        public int shared;
+        public string[] removed;
+        public ModifiedElement[] modified;
+        public string[] added;
+    }
+
+    [System.Serializable]
+    private class ModifiedElement
+    {
+        public string @base;
+        public string target;
+    }
+
+    #endregion
+
+    private readonly List<GameObject> _replaced = new();
+    private GameObject _deltaRoot;
+    private RoomCulling _baseCulling;
+
+    public bool Reform { get; private set; }
+
+    // 'spawned' maps the furniture and light placeholders to the prefabs instantiated
+    // for them, which are not their children and have to be toggled instead
+    public void Initialize(TextAsset deltaJson, GameObject deltaRoot, IReadOnlyDictionary<Transform, GameObject> spawned)
+    {
+        var report = JsonUtility.FromJson<DeltaReport>(deltaJson.text);
+        if (report == null) return;
+
+        var names = new HashSet<string>(report.removed ?? System.Array.Empty<string>());
+        foreach (var element in report.modified ?? System.Array.Empty<ModifiedElement>())
+            names.Add(element.@base);
+
+        foreach (var tr in GetComponentsInChildren<Transform>(true))
+        {
+            if (!names.Contains(tr.name)) continue;
+            if (spawned.TryGetValue(tr, out var instance))
+            {
+                if (instance != null) _replaced.Add(instance);
+            }
+            // Placeholders without a prefab are hidden already
+            else if (tr.gameObject.activeSelf)
+            {
+                _replaced.Add(tr.gameObject);
+            }
+        }
+
+        _deltaRoot = deltaRoot;
+        _baseCulling = GetComponent<RoomCulling>();
+        SetReform(false);
+        Debug.Log($"[ModelDelta] {report.shared} shared elements, {_replaced.Count} replaced by the reform " +
+                  $"({report.removed?.Length ?? 0} removed, {report.modified?.Length ?? 0} modified, {report.added?.Length ?? 0} added).");
+    }
+
+    public void SetReform(bool reform)
+    {
+        Reform = reform;
+        foreach (var go in _replaced)
+        {
+            if (go != null) go.SetActive(!reform);
+        }
+        if (_deltaRoot != null) _deltaRoot.SetActive(reform);
+
+        // The room graph of the original does not hold once walls or doors change
+        if (_baseCulling != null) _baseCulling.enabled = !reform;
+    }
+}
@@ -0,0 +1,35 @@
+#if UNITY_EDITOR
+using System.IO;
+using UnityEditor;
+using UnityEngine;
+
+// Keeps the triangle and vertex order of the models written by 3Dmodeling.py.
+// Its export stage already sorts them for the vertex cache (see <name>_meshopt.json),
+// and the element ranges of <name>_merged.json index into that order, so the
+// "Optimize Mesh" import setting must not reorder them again.
+public class ModelImportSettings : AssetPostprocessor
+{
+    private const string meshOptSuffix = "_meshopt.json";
+    private const string deltaSuffix = "_delta";
+
+    // Bumped so the models imported with the optimization on are imported again
+    public override uint GetVersion() => 1;
+
+    private void OnPreprocessModel()
+    {
+        string basePath = Path.ChangeExtension(assetPath, null);
+        // The delta of the reform keeps the order of the reform
+        if (basePath.EndsWith(deltaSuffix)) basePath = basePath.Substring(0, basePath.Length - deltaSuffix.Length);
+
+        // <name>_meshopt.json, or <name>_<floor>_meshopt.json for a combined building
+        string directory = Path.GetDirectoryName(basePath);
+        if (string.IsNullOrEmpty(directory) || !Directory.Exists(directory)) return;
+        if (Directory.GetFiles(directory, Path.GetFileName(basePath) + "*" + meshOptSuffix).Length == 0) return;
+
+        var importer = (ModelImporter)assetImporter;
+        importer.optimizeMeshPolygons = false;
+        importer.optimizeMeshVertices = false;
+        Debug.Log($"[ModelImportSettings] Mesh optimization disabled for {assetPath}, the order comes from 3Dmodeling.py.");
+    }
+}
+#endif
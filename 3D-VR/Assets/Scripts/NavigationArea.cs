@@ -0,0 +1,78 @@
+using System.Collections.Generic;
+using UnityEngine;
+using UnityEngine.AI;
+
+// Builds the NavMesh at runtime from the NAV_AREA mesh written by 3Dmodeling.py,
+// which is already the floor minus walls and furniture shrunk by the agent radius,
+// so nothing has to be baked in the editor after a reconversion.
+[DisallowMultipleComponent]
+[RequireComponent(typeof(MeshFilter))]
+public class NavigationArea : MonoBehaviour
+{
+    #region Inspector
+
+    [Tooltip("The area is already eroded by the agent radius; keep this small")]
+    [SerializeField] private float agentRadius = 0.05f;
+
+    [Tooltip("Voxel size of the generated NavMesh (meters)")]
+    [SerializeField] private float voxelSize = 0.02f;
+
+    #endregion
+
+    private NavMeshData _data;
+    private NavMeshDataInstance _instance;
+
+    // Added and removed with the model, so only the visible layout is navigable
+    private void OnEnable()
+    {
+        if (_data == null) _data = Build();
+        if (_data != null) _instance = NavMesh.AddNavMeshData(_data);
+    }
+
+    private void OnDisable()
+    {
+        if (_instance.valid) _instance.Remove();
+    }
+
+    #region Helper Methods
+
+    private NavMeshData Build()
+    {
+        var mesh = GetComponent<MeshFilter>().sharedMesh;
+        if (mesh == null)
+        {
+            Debug.LogWarning($"[NavigationArea] '{name}' has no mesh, navigation disabled.");
+            return null;
+        }
+
+        var settings = NavMesh.GetSettingsByID(0);
+        settings.agentRadius = agentRadius;
+        settings.overrideVoxelSize = true;
+        settings.voxelSize = voxelSize;
+
+        var sources = new List<NavMeshBuildSource>
+        {
+            new NavMeshBuildSource
+            {
+                shape = NavMeshBuildSourceShape.Mesh,
+                sourceObject = mesh,
+                transform = transform.localToWorldMatrix,
+                area = 0,
+            }
+        };
+
+        // Bounds of the area in world space, with some room above the floor
+        Vector3 min = mesh.bounds.min, max = mesh.bounds.max;
+        var corners = new Vector3[8];
+        for (int i = 0; i < 8; i++)
+            corners[i] = new Vector3((i & 1) == 0 ? min.x : max.x, (i & 2) == 0 ? min.y : max.y, (i & 4) == 0 ? min.z : max.z);
+        var bounds = GeometryUtility.CalculateBounds(corners, transform.localToWorldMatrix);
+        bounds.Expand(new Vector3(0.5f, 2f, 0.5f));
+
+        var data = NavMeshBuilder.BuildNavMeshData(settings, sources, bounds, Vector3.zero, Quaternion.identity);
+        Debug.Log($"[NavigationArea] NavMesh built from '{name}' ({mesh.GetIndexCount(0) / 3} triangles).");
+        return data;
+    }
+
+    #endregion
+}
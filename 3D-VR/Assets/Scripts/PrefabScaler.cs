@@ -130,7 +130,7 @@ public static class PrefabScaler
         }
     };
 
-    public static void InstantiateFurniture(Transform placeholder)
+    public static GameObject InstantiateFurniture(Transform placeholder)
     {
         string name = placeholder.name;
 
@@ -141,7 +141,7 @@ public static class PrefabScaler
         if (kv.Equals(default(KeyValuePair<string, FurnitureInfo>)))
         {
             Debug.LogWarning($"[PrefabScaler] No configuration found for '{name}'.");
-            return;
+            return null;
         }
 
         var config = kv.Value;
@@ -149,7 +149,7 @@ public static class PrefabScaler
         if (prefab == null)
         {
             Debug.LogError($"[PrefabScaler] Prefab not found: Resources/{config.PrefabPath}");
-            return;
+            return null;
         }
 
         // Instantiate at the placeholder's position
@@ -167,6 +167,7 @@ public static class PrefabScaler
 
         Debug.Log($"[PrefabScaler] Instantiated '{instance.name}' for '{name}'.");
         placeholder.gameObject.SetActive(false);
+        return instance;
     }
 
     public static void ApplyRotationFromName(Transform t, string name)
@@ -0,0 +1,188 @@
+using System;
+using System.Collections.Generic;
+using UnityEngine;
+using UnityEngine.Rendering;
+
+// Replaces the imported meshes with the packed streams written by 3Dmodeling.py
+// (--quantize): <name>_meshopt.json describes the layout of <name>_meshdata.bytes.
+// Normals stay as 8-bit, lightmap UVs as 16-bit unorm and the other UVs as half floats on the GPU.
+[DisallowMultipleComponent]
+public class QuantizedMeshLoader : MonoBehaviour
+{
+    #region Meshopt JSON
+
+    [Serializable]
+    private class MeshOptReport
+    {
+        public bool quantized;
+        public MeshEntry[] meshes;
+    }
+
+    [Serializable]
+    private class MeshEntry
+    {
+        public string mesh;
+        public string[] objects;
+        public int vertexCount;
+        public int indexCount;
+        public int indexFormat;
+        public float[] boundsMin;
+        public float[] boundsSize;
+        public string[] uvLayers;
+        public string[] uvFormats;
+        public StreamOffsets offsets;
+    }
+
+    [Serializable]
+    private class StreamOffsets
+    {
+        public int positions = -1;
+        public int normals = -1;
+        public int uv0 = -1;
+        public int uv1 = -1;
+        public int indices = -1;
+    }
+
+    #endregion
+
+    private const char LevelTagSeparator = '@';
+
+    public int Load(TextAsset reportJson, TextAsset meshData)
+    {
+        var report = JsonUtility.FromJson<MeshOptReport>(reportJson.text);
+        if (report == null || !report.quantized || report.meshes == null) return 0;
+
+        var filters = new Dictionary<string, List<MeshFilter>>();
+        foreach (var mf in GetComponentsInChildren<MeshFilter>(true))
+        {
+            string n = mf.name;
+            int at = n.IndexOf(LevelTagSeparator);
+            if (at >= 0) n = n.Substring(at + 1);
+            if (!filters.TryGetValue(n, out var list)) filters[n] = list = new List<MeshFilter>();
+            list.Add(mf);
+        }
+
+        byte[] data = meshData.bytes;
+        int replaced = 0;
+        foreach (var entry in report.meshes)
+        {
+            if (entry.offsets == null || entry.offsets.positions < 0) continue;
+
+            Mesh decoded = null;
+            foreach (string objectName in entry.objects)
+            {
+                if (!filters.TryGetValue(objectName, out var targets)) continue;
+                foreach (var mf in targets)
+                {
+                    // Same local space as the imported mesh (the importer may mirror X)
+                    decoded ??= Decode(entry, data, MirrorsX(mf.sharedMesh, entry));
+                    mf.sharedMesh = decoded;
+                    if (mf.TryGetComponent<MeshCollider>(out var mc)) mc.sharedMesh = decoded;
+                    replaced++;
+                }
+            }
+        }
+
+        Debug.Log($"[QuantizedMeshLoader] {replaced} meshes replaced by their packed version.");
+        return replaced;
+    }
+
+    #region Helper Methods
+
+    private static bool MirrorsX(Mesh imported, MeshEntry entry)
+    {
+        if (imported == null) return false;
+        float centerX = entry.boundsMin[0] + entry.boundsSize[0] / 2f;
+        return Mathf.Abs(imported.bounds.center.x + centerX) < Mathf.Abs(imported.bounds.center.x - centerX);
+    }
+
+    private static Mesh Decode(MeshEntry entry, byte[] data, bool mirrorX)
+    {
+        int n = entry.vertexCount;
+        var min = new Vector3(entry.boundsMin[0], entry.boundsMin[1], entry.boundsMin[2]);
+        var size = new Vector3(entry.boundsSize[0], entry.boundsSize[1], entry.boundsSize[2]);
+
+        // Positions: 4 x uint16 relative to the bounds
+        var positions = new Vector3[n];
+        for (int i = 0; i < n; i++)
+        {
+            int o = entry.offsets.positions + i * 8;
+            var p = min + Vector3.Scale(size, new Vector3(
+                BitConverter.ToUInt16(data, o),
+                BitConverter.ToUInt16(data, o + 2),
+                BitConverter.ToUInt16(data, o + 4)) / 65535f);
+            if (mirrorX) p.x = -p.x;
+            positions[i] = p;
+        }
+
+        var normals = new byte[n * 4];
+        Buffer.BlockCopy(data, entry.offsets.normals, normals, 0, normals.Length);
+        if (mirrorX)
+        {
+            for (int i = 0; i < n; i++) normals[i * 4] = unchecked((byte)(-(sbyte)normals[i * 4]));
+        }
+
+        var layout = new List<VertexAttributeDescriptor>
+        {
+            new VertexAttributeDescriptor(VertexAttribute.Position, VertexAttributeFormat.Float32, 3, 0),
+            new VertexAttributeDescriptor(VertexAttribute.Normal, VertexAttributeFormat.SNorm8, 4, 1),
+        };
+        int[] uvOffsets = { entry.offsets.uv0, entry.offsets.uv1 };
+        for (int uv = 0; uv < uvOffsets.Length; uv++)
+        {
+            if (uvOffsets[uv] >= 0)
+                layout.Add(new VertexAttributeDescriptor(VertexAttribute.TexCoord0 + uv, GetUVFormat(entry, uv), 2, 2 + uv));
+        }
+
+        var mesh = new Mesh { name = entry.mesh };
+        mesh.SetVertexBufferParams(n, layout.ToArray());
+        mesh.SetVertexBufferData(positions, 0, 0, n, 0);
+        mesh.SetVertexBufferData(normals, 0, 0, normals.Length, 1);
+        for (int uv = 0; uv < uvOffsets.Length; uv++)
+        {
+            if (uvOffsets[uv] < 0) continue;
+            var uvs = new byte[n * 4];
+            Buffer.BlockCopy(data, uvOffsets[uv], uvs, 0, uvs.Length);
+            mesh.SetVertexBufferData(uvs, 0, 0, uvs.Length, 2 + uv);
+        }
+
+        // Mirroring flips the winding
+        int count = entry.indexCount;
+        if (entry.indexFormat == 16)
+        {
+            var indices = new ushort[count];
+            Buffer.BlockCopy(data, entry.offsets.indices, indices, 0, count * 2);
+            if (mirrorX) FlipWinding(indices);
+            mesh.SetIndexBufferParams(count, IndexFormat.UInt16);
+            mesh.SetIndexBufferData(indices, 0, 0, count);
+        }
+        else
+        {
+            var indices = new uint[count];
+            Buffer.BlockCopy(data, entry.offsets.indices, indices, 0, count * 4);
+            if (mirrorX) FlipWinding(indices);
+            mesh.SetIndexBufferParams(count, IndexFormat.UInt32);
+            mesh.SetIndexBufferData(indices, 0, 0, count);
+        }
+
+        mesh.subMeshCount = 1;
+        mesh.SetSubMesh(0, new SubMeshDescriptor(0, count));
+        mesh.RecalculateBounds();
+        return mesh;
+    }
+
+    // Older reports have no uvFormats: every UV layer was written as half floats
+    private static VertexAttributeFormat GetUVFormat(MeshEntry entry, int uv)
+    {
+        bool unorm = entry.uvFormats != null && uv < entry.uvFormats.Length && entry.uvFormats[uv] == "unorm16";
+        return unorm ? VertexAttributeFormat.UNorm16 : VertexAttributeFormat.Float16;
+    }
+
+    private static void FlipWinding<T>(T[] indices)
+    {
+        for (int i = 0; i + 2 < indices.Length; i += 3)
+            (indices[i + 1], indices[i + 2]) = (indices[i + 2], indices[i + 1]);
+    }
+
+    #endregion
+}
@@ -0,0 +1,261 @@
+using System.Collections.Generic;
+using UnityEngine;
+
+// Hides the rooms the camera cannot see, using the cell/portal graph written by
+// 3Dmodeling.py next to each .blend (<name>_cells.json, imported as a TextAsset).
+[DisallowMultipleComponent]
+public class RoomCulling : MonoBehaviour
+{
+    #region Inspector
+
+    [Tooltip("How many portals away from the camera's room are still drawn")]
+    [SerializeField] private int portalDepth = 2;
+
+    [Tooltip("Frames between two visibility updates")]
+    [SerializeField] private int updateInterval = 5;
+
+    #endregion
+
+    #region Cells JSON
+
+    [System.Serializable]
+    private class CellGraph
+    {
+        public float resolution;
+        public Cell[] cells;
+        public Portal[] portals;
+        public Element[] elements;
+    }
+
+    [System.Serializable]
+    private class Cell
+    {
+        public int id;
+        public float[] polygon;
+    }
+
+    [System.Serializable]
+    private class Portal
+    {
+        public string element;
+        public int[] cells;
+        public float[] center;
+        public float width;
+        public float head;
+    }
+
+    [System.Serializable]
+    private class Element
+    {
+        public string name;
+        public int[] cells;
+        public float[] center;
+    }
+
+    #endregion
+
+    private CellGraph _graph;
+    private readonly Dictionary<int, List<Portal>> _portalsPerCell = new();
+    private readonly List<(Renderer renderer, int[] cells)> _elements = new();
+    private readonly HashSet<int> _visibleCells = new();
+
+    // Plan (Blender XY) to world (Unity XZ): world = _axisX * x + _axisY * y + _offset
+    private Vector2 _axisX, _axisY, _offset;
+    private Camera _camera;
+    private int _currentCell = -1;
+    private bool _ready = false;
+
+    public void Initialize(TextAsset cellsJson)
+    {
+        _graph = JsonUtility.FromJson<CellGraph>(cellsJson.text);
+        if (_graph?.cells == null || _graph.cells.Length == 0)
+        {
+            Debug.LogWarning($"[RoomCulling] No rooms in {cellsJson.name}, culling disabled.");
+            return;
+        }
+
+        foreach (var portal in _graph.portals)
+        {
+            foreach (int cell in portal.cells)
+            {
+                if (!_portalsPerCell.TryGetValue(cell, out var list))
+                    _portalsPerCell[cell] = list = new List<Portal>();
+                list.Add(portal);
+            }
+        }
+
+        var renderers = new Dictionary<string, Renderer>();
+        foreach (var r in GetComponentsInChildren<Renderer>(true))
+            renderers.TryAdd(r.name, r);
+
+        var planPoints = new List<Vector2>();
+        var worldPoints = new List<Vector2>();
+        foreach (var element in _graph.elements)
+        {
+            if (!renderers.TryGetValue(element.name, out var r)) continue;
+            _elements.Add((r, element.cells));
+            planPoints.Add(new Vector2(element.center[0], element.center[1]));
+            worldPoints.Add(new Vector2(r.bounds.center.x, r.bounds.center.z));
+        }
+
+        if (!FitPlanToWorld(planPoints, worldPoints))
+        {
+            Debug.LogWarning("[RoomCulling] Could not match the plan to the scene, culling disabled.");
+            return;
+        }
+
+        _camera = Camera.main;
+        _ready = true;
+        Debug.Log($"[RoomCulling] {_graph.cells.Length} rooms, {_graph.portals.Length} portals, {_elements.Count} elements.");
+    }
+
+    private void LateUpdate()
+    {
+        if (!_ready || _camera == null || Time.frameCount % updateInterval != 0) return;
+
+        Vector3 eye = _camera.transform.position;
+        int cell = FindCell(WorldToPlan(new Vector2(eye.x, eye.z)));
+        if (cell == _currentCell && cell <= 0) return;
+        _currentCell = cell;
+
+        // Outside every room: everything may be visible
+        if (cell <= 0)
+        {
+            foreach (var (r, _) in _elements) r.enabled = true;
+            return;
+        }
+
+        CollectVisibleCells(cell);
+        foreach (var (r, cells) in _elements)
+        {
+            bool visible = cells == null || cells.Length == 0;
+            for (int i = 0; !visible && i < cells.Length; i++)
+                visible = _visibleCells.Contains(cells[i]);
+            r.enabled = visible;
+        }
+    }
+
+    private void OnDisable()
+    {
+        foreach (var (r, _) in _elements)
+            if (r != null) r.enabled = true;
+        _currentCell = -1;
+    }
+
+    #region Helper Methods
+
+    // Breadth-first walk through the portals in the view frustum
+    private void CollectVisibleCells(int start)
+    {
+        var planes = GeometryUtility.CalculateFrustumPlanes(_camera);
+        var frontier = new Queue<(int cell, int depth)>();
+        _visibleCells.Clear();
+        _visibleCells.Add(start);
+        frontier.Enqueue((start, 0));
+
+        while (frontier.Count > 0)
+        {
+            var (cell, depth) = frontier.Dequeue();
+            if (depth >= portalDepth || !_portalsPerCell.TryGetValue(cell, out var portals)) continue;
+
+            foreach (var portal in portals)
+            {
+                if (!GeometryUtility.TestPlanesAABB(planes, PortalBounds(portal))) continue;
+                foreach (int next in portal.cells)
+                {
+                    if (next > 0 && _visibleCells.Add(next))
+                        frontier.Enqueue((next, depth + 1));
+                }
+            }
+        }
+    }
+
+    private Bounds PortalBounds(Portal portal)
+    {
+        Vector2 c = PlanToWorld(new Vector2(portal.center[0], portal.center[1]));
+        float y = transform.position.y + portal.head / 2f;
+        return new Bounds(new Vector3(c.x, y, c.y), new Vector3(portal.width, portal.head, portal.width));
+    }
+
+    private int FindCell(Vector2 point)
+    {
+        foreach (var cell in _graph.cells)
+        {
+            if (ContainsPoint(cell.polygon, point)) return cell.id;
+        }
+        return 0;
+    }
+
+    private static bool ContainsPoint(float[] polygon, Vector2 p)
+    {
+        bool inside = false;
+        int n = polygon.Length / 2;
+        for (int i = 0, j = n - 1; i < n; j = i++)
+        {
+            float xi = polygon[2 * i], yi = polygon[2 * i + 1];
+            float xj = polygon[2 * j], yj = polygon[2 * j + 1];
+            if ((yi > p.y) != (yj > p.y) && p.x < (xj - xi) * (p.y - yi) / (yj - yi) + xi)
+                inside = !inside;
+        }
+        return inside;
+    }
+
+    private Vector2 PlanToWorld(Vector2 p) => _axisX * p.x + _axisY * p.y + _offset;
+
+    private Vector2 WorldToPlan(Vector2 w)
+    {
+        Vector2 d = w - _offset;
+        float det = _axisX.x * _axisY.y - _axisY.x * _axisX.y;
+        return new Vector2((d.x * _axisY.y - d.y * _axisY.x) / det,
+                           (d.y * _axisX.x - d.x * _axisX.y) / det);
+    }
+
+    // Least-squares affine map from the element centers in the plan to their renderers,
+    // so the import axes, scale and the instance placement do not matter
+    private bool FitPlanToWorld(List<Vector2> plan, List<Vector2> world)
+    {
+        if (plan.Count < 3) return false;
+
+        double sxx = 0, sxy = 0, syy = 0, sx = 0, sy = 0, n = plan.Count;
+        double ux = 0, uy = 0, u1 = 0, vx = 0, vy = 0, v1 = 0;
+        for (int i = 0; i < plan.Count; i++)
+        {
+            double x = plan[i].x, y = plan[i].y, u = world[i].x, v = world[i].y;
+            sxx += x * x; sxy += x * y; syy += y * y; sx += x; sy += y;
+            ux += u * x; uy += u * y; u1 += u;
+            vx += v * x; vy += v * y; v1 += v;
+        }
+
+        var m = new double[3, 3] { { sxx, sxy, sx }, { sxy, syy, sy }, { sx, sy, n } };
+        if (!Solve3(m, ux, uy, u1, out var a) || !Solve3(m, vx, vy, v1, out var b)) return false;
+
+        _axisX = new Vector2((float)a[0], (float)b[0]);
+        _axisY = new Vector2((float)a[1], (float)b[1]);
+        _offset = new Vector2((float)a[2], (float)b[2]);
+        return Mathf.Abs(_axisX.x * _axisY.y - _axisY.x * _axisX.y) > 1e-6f;
+    }
+
+    // Cramer's rule on the 3x3 normal equations
+    private static bool Solve3(double[,] m, double r0, double r1, double r2, out double[] result)
+    {
+        double Det(double[,] k) =>
+            k[0, 0] * (k[1, 1] * k[2, 2] - k[1, 2] * k[2, 1])
+          - k[0, 1] * (k[1, 0] * k[2, 2] - k[1, 2] * k[2, 0])
+          + k[0, 2] * (k[1, 0] * k[2, 1] - k[1, 1] * k[2, 0]);
+
+        result = new double[3];
+        double det = Det(m);
+        if (System.Math.Abs(det) < 1e-12) return false;
+
+        double[] rhs = { r0, r1, r2 };
+        for (int col = 0; col < 3; col++)
+        {
+            var k = (double[,])m.Clone();
+            for (int row = 0; row < 3; row++) k[row, col] = rhs[row];
+            result[col] = Det(k) / det;
+        }
+        return true;
+    }
+
+    #endregion
+}
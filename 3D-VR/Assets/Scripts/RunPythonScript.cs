@@ -3,6 +3,7 @@ using UnityEngine.UI;
 using System.Diagnostics;
 using System.IO;
 using System.Collections;
+using System.Collections.Concurrent;
 using Debug = UnityEngine.Debug;
 #if UNITY_EDITOR
 using UnityEditor;
@@ -23,12 +24,41 @@ public class RunPythonScript : MonoBehaviour
     [Tooltip("Second .blend file that should also appear")]
     public string blendFileName2 = "reformed.blend";
 
+    [Tooltip("Seconds without any progress event before the run is considered stalled")]
+    public float stallTimeout = 300f;
+
     [Header("Loading UI")]
     [Tooltip("Assign here the Canvas or Panel used for loading")]
     [SerializeField] private GameObject loadingCanvas;
 
+    [Tooltip("Optional progress bar updated from the pipeline events")]
+    [SerializeField] private Slider progressBar;
+
+    [Tooltip("Optional label showing the current pipeline stage")]
+    [SerializeField] private Text progressLabel;
+
     private bool buttonUsed = false;
 
+    // Lines read on the process' stdout thread, consumed on the main thread
+    private readonly ConcurrentQueue<string> pendingLines = new ConcurrentQueue<string>();
+
+    // One line of the newline-delimited JSON stream written by blender/main.py
+    [System.Serializable]
+    private class PipelineEvent
+    {
+        public string @event;
+        public string job;
+        public string stage;
+        public string path;
+        public string sha256;
+        public string message;
+        public int returncode;
+        public string log;
+        public string stderr;
+        public float overallPercent;
+        public bool ok;
+    }
+
     private string GetProjectParentFolder()
     {
         string projectRoot = Directory.GetParent(Application.dataPath).FullName;
@@ -45,6 +75,7 @@ public class RunPythonScript : MonoBehaviour
         buttonUsed = true;
 
         loadingCanvas.SetActive(true);
+        SetProgress(0f, "Starting...");
 
         string baseFolder     = GetProjectParentFolder();
         string fullScriptPath = Path.Combine(baseFolder, scriptRelativePath).Replace('\\','/');
@@ -61,12 +92,18 @@ public class RunPythonScript : MonoBehaviour
             CreateNoWindow         = true
         };
 
+        Process process;
         try
         {
-            using (var process = Process.Start(startInfo))
+            process = new Process { StartInfo = startInfo, EnableRaisingEvents = true };
+            process.OutputDataReceived += (_, args) =>
             {
-                process.WaitForExit();
-            }
+                if (args.Data != null) pendingLines.Enqueue(args.Data);
+            };
+            process.ErrorDataReceived += (_, _) => { };
+            process.Start();
+            process.BeginOutputReadLine();
+            process.BeginErrorReadLine();
         }
         catch (System.Exception e)
         {
@@ -75,40 +112,110 @@ public class RunPythonScript : MonoBehaviour
             return;
         }
 
-        StartCoroutine(CheckBlendAndRefresh());
+        StartCoroutine(FollowPipelineEvents(process));
     }
 
-    private IEnumerator CheckBlendAndRefresh()
+    private IEnumerator FollowPipelineEvents(Process process)
     {
-        string resourcesFolder = Path.Combine(Application.dataPath, "Resources").Replace('\\','/');
-        string blendPath1      = Path.Combine(resourcesFolder, blendFileName1).Replace('\\','/');
-        string blendPath2      = Path.Combine(resourcesFolder, blendFileName2).Replace('\\','/');
+        float sinceLastEvent = 0f;
 
-        Debug.Log($"[RunPythonScript] Waiting for: {blendFileName1} and {blendFileName2}");
-
-        float timeout = 30f;
-        float elapsed = 0f;
-
-        while (elapsed < timeout)
+        while (true)
         {
-            bool exists1 = File.Exists(blendPath1);
-            bool exists2 = File.Exists(blendPath2);
+            bool received = false;
+            while (pendingLines.TryDequeue(out var line))
+            {
+                if (!line.StartsWith("{")) continue;
+                received = true;
+
+                PipelineEvent evt;
+                try
+                {
+                    evt = JsonUtility.FromJson<PipelineEvent>(line);
+                }
+                catch (System.ArgumentException)
+                {
+                    continue;
+                }
+
+                if (HandleEvent(evt))
+                {
+                    process.Dispose();
+                    yield break;
+                }
+            }
 
-            if (exists1 && exists2)
+            if (received)
             {
-                Debug.Log($"[RunPythonScript] Both .blend files found, refreshing AssetDatabase...");
+                sinceLastEvent = 0f;
+            }
+            else if (process.HasExited && pendingLines.IsEmpty)
+            {
+                Debug.LogWarning($"[RunPythonScript] Python exited (code {process.ExitCode}) without a completion event.");
+                break;
+            }
+            else if (sinceLastEvent > stallTimeout)
+            {
+                Debug.LogWarning($"[RunPythonScript] No progress for {stallTimeout} seconds, giving up.");
+                break;
+            }
+
+            yield return null;
+            sinceLastEvent += Time.unscaledDeltaTime;
+        }
+
+        process.Dispose();
+        loadingCanvas.SetActive(false);
+    }
+
+    // Returns true once the run is over (successfully or not)
+    private bool HandleEvent(PipelineEvent evt)
+    {
+        switch (evt.@event)
+        {
+            case "stage_started":
+                SetProgress(evt.overallPercent, $"{evt.job}: {evt.stage}");
+                return false;
+
+            case "output":
+                Debug.Log($"[RunPythonScript] {evt.job} written to {evt.path} (sha256 {evt.sha256}).");
+                SetProgress(evt.overallPercent, $"{evt.job}: saved");
+                return false;
+
+            case "run_failed":
+                Debug.LogError($"[RunPythonScript] {evt.job} failed: {evt.message}");
+                return false;
+
+            case "job_exited":
+                if (evt.returncode != 0)
+                    Debug.LogError($"[RunPythonScript] Blender exited with code {evt.returncode} in {evt.job} (log: {evt.log}):\n{evt.stderr}");
+                SetProgress(evt.overallPercent, null);
+                return false;
+
+            case "completed":
+                if (evt.ok)
+                {
+                    Debug.Log($"[RunPythonScript] {blendFileName1} and {blendFileName2} ready, refreshing AssetDatabase...");
 #if UNITY_EDITOR
-                AssetDatabase.Refresh();
+                    AssetDatabase.Refresh();
 #endif
+                }
+                else
+                {
+                    Debug.LogWarning("[RunPythonScript] The pipeline finished with errors.");
+                }
+                SetProgress(100f, evt.ok ? "Done" : "Failed");
                 loadingCanvas.SetActive(false);
-                yield break;
-            }
+                return true;
 
-            yield return new WaitForSeconds(1f);
-            elapsed += 1f;
+            default:
+                SetProgress(evt.overallPercent, null);
+                return false;
         }
+    }
 
-        Debug.LogWarning($"[RunPythonScript] Both .blend files did not appear within {timeout} seconds.");
-        loadingCanvas.SetActive(false);
+    private void SetProgress(float percent, string label)
+    {
+        if (progressBar != null) progressBar.value = Mathf.Clamp01(percent / 100f);
+        if (progressLabel != null && label != null) progressLabel.text = label;
     }
 }
@@ -4,20 +4,39 @@ public class SwitchModel : MonoBehaviour
 {
     private GameObject originalFloor;
     private GameObject reformedFloor;
+    private ModelDelta delta;
     private bool reform = false;
 
     public void FindInstances()
     {
         originalFloor = GameObject.Find("original_Instance");
-        reformedFloor = GameObject.Find("reformed_Instance");
-        reformedFloor.SetActive(false);
 
+        // Reform packaged as a delta of the original: only the changed elements are toggled
+        delta = originalFloor != null ? originalFloor.GetComponent<ModelDelta>() : null;
+        if (delta != null)
+        {
+            delta.SetReform(reform);
+            return;
+        }
+
+        reformedFloor = GameObject.Find("reformed_Instance");
         if (originalFloor == null || reformedFloor == null)
+        {
             Debug.LogError("[SwitchModel] One or both floor instances not found by name.");
+            return;
+        }
+        reformedFloor.SetActive(false);
     }
 
     public void SwitchModelState()
     {
+        if (delta != null)
+        {
+            reform = !reform;
+            delta.SetReform(reform);
+            return;
+        }
+
         if (originalFloor == null || reformedFloor == null)
         {
             Debug.LogWarning("[SwitchModel] Cannot switch: objects not found.");